@@ -0,0 +1,320 @@
+"""
+Latency / token / cost benchmark per prompt version, model and mode.
+
+Runs every case in assignment3.csv against each prompt version and model,
+keeping what agentic.py throws away: wall-clock latency (including retries),
+latency of the successful attempt, usage_metadata token counts and an
+estimated USD cost per case. The report puts accuracy next to latency
+percentiles and cost so a production prompt can be chosen on all three.
+
+Outputs:
+- parquet/benchmark/ (row per call, partitioned by prompt_version and mode;
+  a run replaces only the rows of the prompt/model/mode configurations it
+  covers, so earlier runs of other configurations are kept)
+- benchmark_runs.csv (CSV export of the same rows)
+- benchmark_summary.md (accuracy vs p50/p95/p99 latency vs cost)
+
+Usage (from assignment3/):
+    python benchmark.py                              # all versions x flash/pro
+    python benchmark.py --versions v3 v4 --models flash --repeats 3
+    python benchmark.py --summarize-only             # rebuild report from stored runs
+
+Prices are list prices in USD per 1M tokens at the time of writing; override
+with --price MODEL=INPUT,OUTPUT when they change. Thought tokens are billed
+as output.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from qualitative_review import is_response_type_policy_violation
+from storage import PARQUET_DIR, export_csv, read_dataset, update_dataset
+
+
+ROOT = Path(__file__).resolve().parent
+META_FILE = ROOT / "assignment3.csv"
+PROMPTS_DIR = ROOT / "prompts"
+IMG_DIR = ROOT / "img"
+PROMPT_VERSIONS = ["v1", "v2", "v3", "v4"]
+
+RUNS_DATASET = PARQUET_DIR / "benchmark"
+# A new run replaces the stored rows of the configurations it covers.
+RUN_KEYS = ["prompt_version", "model", "mode"]
+RUNS_OUT = ROOT / "benchmark_runs.csv"
+SUMMARY_OUT = ROOT / "benchmark_summary.md"
+
+MODELS = {
+    "flash": "models/gemini-3-flash-preview",
+    "pro": "gemini-3-pro-preview",
+}
+
+# USD per 1M tokens: (input, output).
+PRICES = {
+    "models/gemini-3-flash-preview": (0.50, 3.00),
+    "gemini-3-pro-preview": (2.00, 12.00),
+}
+
+PERCENTILES = [50, 95, 99]
+
+# Values recorded for a failed call, so every run row has the same columns.
+FAILED_CALL = {
+    "attempts": 0,
+    "latency_s": float("nan"),
+    "attempt_latency_s": float("nan"),
+    "tokens_in": 0,
+    "tokens_out": 0,
+    "tokens_thoughts": 0,
+    "tokens_total": 0,
+}
+
+
+class LLMResponse(BaseModel):
+    verdict: str
+    response_type: str
+    message_is: str
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from google import genai
+
+        _client = genai.Client()
+    return _client
+
+
+def call_model_timed(
+    prompt: str,
+    image: Any,
+    mode: str,
+    model: str,
+    max_retries: int = 5,
+) -> dict[str, Any]:
+    """Call Gemini with retries; return the text plus timing and usage."""
+    from google.genai.errors import ServerError
+
+    client = get_client()
+    t0 = time.perf_counter()
+    for attempt in range(max_retries):
+        t_attempt = time.perf_counter()
+        try:
+            resp = client.models.generate_content(
+                model=model,
+                contents=[prompt, mode, image],
+                config={
+                    "response_mime_type": "application/json",
+                    "response_json_schema": LLMResponse.model_json_schema(),
+                },
+            )
+        except ServerError:
+            if attempt == max_retries - 1:
+                raise
+            wait = 2**attempt
+            print(f"Server busy, retrying in {wait}s...")
+            time.sleep(wait)
+            continue
+
+        now = time.perf_counter()
+        usage = getattr(resp, "usage_metadata", None)
+        return {
+            "text": resp.text,
+            "attempts": attempt + 1,
+            "latency_s": now - t0,
+            "attempt_latency_s": now - t_attempt,
+            "tokens_in": getattr(usage, "prompt_token_count", None) or 0,
+            "tokens_out": getattr(usage, "candidates_token_count", None) or 0,
+            "tokens_thoughts": getattr(usage, "thoughts_token_count", None) or 0,
+            "tokens_total": getattr(usage, "total_token_count", None) or 0,
+        }
+    raise RuntimeError("Gemini request failed unexpectedly")
+
+
+def estimate_cost(model: str, tokens_in: int, tokens_out: int, tokens_thoughts: int) -> float:
+    price_in, price_out = PRICES.get(model, (0.0, 0.0))
+    return (tokens_in * price_in + (tokens_out + tokens_thoughts) * price_out) / 1_000_000
+
+
+def run_benchmark(
+    versions: list[str],
+    models: list[str],
+    modes: list[str] | None,
+    repeats: int,
+    limit: int | None,
+    pause_s: float,
+) -> pd.DataFrame:
+    from PIL import Image
+
+    cases = pd.read_csv(META_FILE)
+    if modes:
+        cases = cases[cases["mode"].isin(modes)]
+    if limit is not None:
+        cases = cases.head(limit)
+
+    rows: list[dict[str, Any]] = []
+    for version in versions:
+        prompt = (PROMPTS_DIR / f"{version}.txt").read_text(encoding="utf-8")
+        for model in models:
+            for repeat in range(repeats):
+                for case in cases.itertuples():
+                    file_path = IMG_DIR / case.image
+                    print(f"[{version} {model} #{repeat}] {case.mode} {case.image}")
+                    row: dict[str, Any] = {
+                        "prompt_version": version,
+                        "model": model,
+                        "mode": case.mode,
+                        "repeat": repeat,
+                        "id": case.id,
+                        "image": case.image,
+                        "expected_verdict": case.expected_verdict,
+                        "started_at": datetime.now(),
+                        **FAILED_CALL,
+                    }
+                    try:
+                        with Image.open(file_path) as image:
+                            timed = call_model_timed(prompt, image, case.mode, model)
+                        parsed = LLMResponse.model_validate_json(timed.pop("text"))
+                        row.update(parsed.model_dump(exclude={"message_is"}))
+                        row.update(timed)
+                        row["error"] = None
+                    except Exception as exc:
+                        print(f"Failed on {file_path}: {exc}")
+                        row.update({"verdict": None, "response_type": "error", "error": str(exc)})
+                    rows.append(row)
+                    time.sleep(pause_s)
+
+    runs = pd.DataFrame(rows)
+    runs["cost_usd"] = [
+        estimate_cost(m, i, o, t)
+        for m, i, o, t in zip(runs["model"], runs["tokens_in"], runs["tokens_out"], runs["tokens_thoughts"])
+    ]
+    return runs
+
+
+def summarize(runs: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """Accuracy, latency percentiles, tokens and cost per group."""
+    runs = runs.assign(
+        ok=runs["error"].isna(),
+        correct=(runs["verdict"].astype("string") == runs["expected_verdict"].astype("string")).fillna(False),
+        feasible=[
+            not is_response_type_policy_violation(v, rt)
+            for v, rt in zip(runs["verdict"].astype(object), runs["response_type"].astype(object))
+        ],
+    )
+
+    out: list[dict[str, Any]] = []
+    for key, group in runs.groupby(keys, observed=True, sort=True):
+        ok = group[group["ok"]]
+        latency = ok["latency_s"].to_numpy(dtype=float)
+        pcts = np.percentile(latency, PERCENTILES) if len(latency) else [np.nan] * len(PERCENTILES)
+        row = dict(zip(keys, key if isinstance(key, tuple) else (key,)))
+        row.update(
+            {
+                "calls": len(group),
+                "errors": int((~group["ok"]).sum()),
+                "accuracy": round(100 * group["correct"].mean(), 1),
+                "feasible": round(100 * group["feasible"].mean(), 1),
+                **{f"p{p}_s": round(v, 2) for p, v in zip(PERCENTILES, pcts)},
+                "retries": int((ok["attempts"] - 1).sum()),
+                "avg_tokens_in": round(ok["tokens_in"].mean(), 0),
+                "avg_tokens_out": round(ok["tokens_out"].mean(), 0),
+                "avg_tokens_thoughts": round(ok["tokens_thoughts"].mean(), 0),
+                "cost_per_case_usd": round(ok["cost_usd"].mean(), 5),
+                "cost_per_1k_cases_usd": round(1000 * ok["cost_usd"].mean(), 2),
+            }
+        )
+        out.append(row)
+    return pd.DataFrame(out)
+
+
+def mark_pareto(summary: pd.DataFrame) -> pd.DataFrame:
+    """Flag configurations not dominated on (accuracy up, p95 down, cost down).
+
+    Configurations without a usable metric (every call errored, so p95 and
+    cost are NaN) are left out of the comparison and never marked.
+    """
+    metrics = summary[["accuracy", "p95_s", "cost_per_case_usd"]]
+    measured = (metrics.notna().all(axis=1) & (summary["errors"] < summary["calls"])).to_numpy()
+    acc, p95, cost = (metrics[col].to_numpy()[measured] for col in metrics.columns)
+    # dominated[i, j]: j is at least as good as i everywhere and better somewhere.
+    no_worse = (acc[None, :] >= acc[:, None]) & (p95[None, :] <= p95[:, None]) & (cost[None, :] <= cost[:, None])
+    better = (acc[None, :] > acc[:, None]) | (p95[None, :] < p95[:, None]) | (cost[None, :] < cost[:, None])
+    pareto = np.full(len(summary), "", dtype=object)
+    pareto[measured] = np.where((no_worse & better).any(axis=1), "", "yes")
+    return summary.assign(pareto=pareto)
+
+
+def write_report(runs: pd.DataFrame) -> None:
+    overall = mark_pareto(summarize(runs, ["prompt_version", "model"]))
+    by_mode = summarize(runs, ["prompt_version", "model", "mode"])
+    md_lines = [
+        "# Latency and Cost Benchmark",
+        "",
+        (
+            f"{len(runs)} calls. Latency is wall-clock per case including retries; "
+            "cost uses the list prices in `benchmark.py`. "
+            "`pareto` marks configurations no other configuration beats on accuracy, p95 and cost at once."
+        ),
+        "",
+        "## Prompt x Model",
+        "",
+        overall.to_markdown(index=False),
+        "",
+        "## Prompt x Model x Mode",
+        "",
+        by_mode.to_markdown(index=False),
+        "",
+        "## Files",
+        "",
+        f"- Row-level: `{RUNS_OUT.name}` (Parquet: `{RUNS_DATASET.relative_to(ROOT)}/`)",
+    ]
+    SUMMARY_OUT.write_text("\n".join(md_lines), encoding="utf-8")
+
+
+def parse_price(value: str) -> tuple[str, tuple[float, float]]:
+    model, prices = value.split("=", 1)
+    price_in, price_out = (float(p) for p in prices.split(","))
+    return MODELS.get(model, model), (price_in, price_out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark latency, tokens and cost per prompt/model.")
+    parser.add_argument("--versions", nargs="+", default=PROMPT_VERSIONS)
+    parser.add_argument("--models", nargs="+", default=list(MODELS), help="flash, pro or full model names")
+    parser.add_argument("--modes", nargs="+", default=None, help="restrict to these dataset modes")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None, help="only the first N cases")
+    parser.add_argument("--pause", type=float, default=1.0, help="seconds between calls")
+    parser.add_argument("--price", action="append", default=[], help="MODEL=INPUT,OUTPUT (USD per 1M)")
+    parser.add_argument("--summarize-only", action="store_true")
+    args = parser.parse_args()
+
+    PRICES.update(dict(parse_price(p) for p in args.price))
+
+    if args.summarize_only:
+        runs = read_dataset(RUNS_DATASET)
+    else:
+        models = [MODELS.get(m, m) for m in args.models]
+        runs = run_benchmark(args.versions, models, args.modes, args.repeats, args.limit, args.pause)
+        runs = update_dataset(runs, RUNS_DATASET, RUN_KEYS)
+        export_csv(runs, RUNS_OUT)
+        print(f"Wrote {RUNS_DATASET.relative_to(ROOT)}/")
+        print(f"Wrote {RUNS_OUT.name}")
+
+    write_report(runs)
+    print(f"Wrote {SUMMARY_OUT.name}")
+
+
+if __name__ == "__main__":
+    main()
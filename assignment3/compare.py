@@ -0,0 +1,203 @@
+"""
+Paired statistical comparison of prompt versions (and models, when present).
+
+All prompt versions are scored on the same cases, so comparisons are paired
+by case id:
+- Paired bootstrap: resample case ids with replacement and recompute the
+  difference in mean metric. Resampling is one vectorized NumPy gather over
+  an (n_replicates, n_cases) index matrix, so 10k replicates take a few ms.
+- McNemar exact test on the discordant pairs of each binary metric.
+
+Metrics (per case, 0/1):
+- verdict_accuracy: verdict == expected_verdict
+- correctness_rate: correctness_label == "Correct"
+- feasible_rate: response_type is consistent with verdict (no policy violation)
+
+Usage (from assignment3/):
+    python compare.py   # updates the comparison section of qualitative_tables.md
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from storage import load_scores
+
+
+ROOT = Path(__file__).resolve().parent
+TABLES_OUT = ROOT / "qualitative_tables.md"
+
+N_REPLICATES = 10_000
+CI_LEVEL = 0.95
+SEED = 42
+
+SECTION_TITLE = "## Paired Prompt Comparison"
+SCORE_COLUMNS = [
+    "prompt_version",
+    "id",
+    "verdict",
+    "expected_verdict",
+    "correctness_label",
+    "policy_violation",
+]
+
+
+def case_metrics(scored: pd.DataFrame) -> pd.DataFrame:
+    """Per-case 0/1 metric columns, vectorized over the whole frame."""
+    verdict = scored["verdict"].astype("string").str.strip().str.lower()
+    expected = scored["expected_verdict"].astype("string").str.strip().str.lower()
+    return pd.DataFrame(
+        {
+            "verdict_accuracy": (verdict == expected).fillna(False).astype(np.int8),
+            "correctness_rate": (scored["correctness_label"] == "Correct").astype(np.int8),
+            "feasible_rate": (~scored["policy_violation"].astype(bool)).astype(np.int8),
+        },
+        index=scored.index,
+    )
+
+
+def system_labels(scored: pd.DataFrame) -> pd.Series:
+    """Label of the compared system: prompt version, plus model when recorded."""
+    labels = scored["prompt_version"].astype(str)
+    if "model" in scored.columns:
+        labels = labels + "/" + scored["model"].astype(str).str.replace("models/", "", regex=False)
+    return labels
+
+
+def paired_matrix(scored: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """Cases x systems matrix of a metric, restricted to cases every system answered."""
+    metrics = case_metrics(scored)
+    wide = (
+        pd.DataFrame({"system": system_labels(scored), "id": scored["id"], metric: metrics[metric]})
+        .pivot_table(index="id", columns="system", values=metric, aggfunc="first", observed=True)
+        .dropna()
+    )
+    return wide.astype(np.int8)
+
+
+def bootstrap_indices(n_cases: int, n_replicates: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n_cases, size=(n_replicates, n_cases), dtype=np.int32)
+
+
+def mcnemar_exact(a: np.ndarray, b: np.ndarray) -> tuple[int, int, float]:
+    """Exact two-sided McNemar test; returns (a_only, b_only, p_value)."""
+    a_only = int(np.sum((a == 1) & (b == 0)))
+    b_only = int(np.sum((a == 0) & (b == 1)))
+    n = a_only + b_only
+    if n == 0:
+        return a_only, b_only, 1.0
+    k = min(a_only, b_only)
+    tail = sum(math.comb(n, i) for i in range(k + 1)) / 2**n
+    return a_only, b_only, min(1.0, 2.0 * tail)
+
+
+def compare_systems(
+    scored: pd.DataFrame,
+    metrics: tuple[str, ...] = ("verdict_accuracy", "correctness_rate", "feasible_rate"),
+    n_replicates: int = N_REPLICATES,
+    level: float = CI_LEVEL,
+    seed: int = SEED,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return (per-system CIs, pairwise differences) for each metric."""
+    system_rows: list[dict[str, object]] = []
+    pair_rows: list[dict[str, object]] = []
+
+    for metric in metrics:
+        wide = paired_matrix(scored, metric)
+        values = wide.to_numpy(dtype=np.float64)
+        systems = list(wide.columns)
+        idx = bootstrap_indices(len(wide), n_replicates, seed)
+
+        # One gather for all systems: (replicates, cases, systems).
+        resampled = values[idx]
+        means = resampled.mean(axis=1)
+        alpha = (1.0 - level) / 2.0
+        lo, hi = np.quantile(means, [alpha, 1.0 - alpha], axis=0)
+        for j, system in enumerate(systems):
+            system_rows.append(
+                {
+                    "metric": metric,
+                    "system": system,
+                    "cases": len(wide),
+                    "mean": round(100 * values[:, j].mean(), 1),
+                    "ci_low": round(100 * lo[j], 1),
+                    "ci_high": round(100 * hi[j], 1),
+                }
+            )
+
+        for i, j in itertools.combinations(range(len(systems)), 2):
+            diff = means[:, j] - means[:, i]
+            d_lo, d_hi = np.quantile(diff, [alpha, 1.0 - alpha])
+            a_only, b_only, p_value = mcnemar_exact(values[:, i], values[:, j])
+            pair_rows.append(
+                {
+                    "metric": metric,
+                    "a": systems[i],
+                    "b": systems[j],
+                    "diff_b_minus_a": round(100 * (values[:, j].mean() - values[:, i].mean()), 1),
+                    "ci_low": round(100 * d_lo, 1),
+                    "ci_high": round(100 * d_hi, 1),
+                    "a_only": a_only,
+                    "b_only": b_only,
+                    "mcnemar_p": round(p_value, 4),
+                }
+            )
+
+    return pd.DataFrame(system_rows), pd.DataFrame(pair_rows)
+
+
+def comparison_markdown(scored: pd.DataFrame) -> list[str]:
+    """Markdown lines for the comparison section of qualitative_tables.md."""
+    systems, pairs = compare_systems(scored)
+    pct = int(CI_LEVEL * 100)
+    return [
+        SECTION_TITLE,
+        "",
+        (
+            f"Paired by case id. {pct}% percentile CIs from {N_REPLICATES:,} bootstrap "
+            f"replicates (seed {SEED}); values in percent. McNemar p-values are exact "
+            "(binomial) on discordant cases: `a_only` = cases only `a` got right."
+        ),
+        "",
+        "### Per-System Rates",
+        "",
+        systems.to_markdown(index=False),
+        "",
+        "### Pairwise Differences",
+        "",
+        pairs.to_markdown(index=False),
+        "",
+    ]
+
+
+def replace_section(markdown: str, section: list[str]) -> str:
+    """Replace (or insert before ## Files) the comparison section in markdown."""
+    lines = markdown.split("\n")
+    if SECTION_TITLE in lines:
+        start = lines.index(SECTION_TITLE)
+        end = next(
+            (i for i in range(start + 1, len(lines)) if lines[i].startswith("## ")),
+            len(lines),
+        )
+    else:
+        start = end = lines.index("## Files") if "## Files" in lines else len(lines)
+    return "\n".join(lines[:start] + section + lines[end:])
+
+
+def main() -> None:
+    scored = load_scores(columns=SCORE_COLUMNS)
+    section = comparison_markdown(scored)
+    TABLES_OUT.write_text(
+        replace_section(TABLES_OUT.read_text(encoding="utf-8"), section), encoding="utf-8"
+    )
+    print(f"Wrote comparison section to {TABLES_OUT.name}")
+
+
+if __name__ == "__main__":
+    main()
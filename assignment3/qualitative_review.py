@@ -7,9 +7,12 @@ Guideline dimensions:
 - Clarity: 1..5
 
 Outputs (v2):
-- qualitative_scores_all_prompts.csv
-- qualitative_summary_by_prompt.csv
-- qualitative_summary_by_prompt_and_mode.csv
+- parquet/qualitative_scores/ (partitioned by prompt_version and mode)
+- parquet/qualitative_summary_by_prompt.parquet
+- parquet/qualitative_summary_by_prompt_and_mode.parquet
+- qualitative_scores_all_prompts.csv (CSV export)
+- qualitative_summary_by_prompt.csv (CSV export)
+- qualitative_summary_by_prompt_and_mode.csv (CSV export)
 - qualitative_tables.md
 - manual_review_sample.csv
 
@@ -26,6 +29,9 @@ from typing import Any
 
 import pandas as pd
 
+from compare import comparison_markdown
+from storage import PARQUET_DIR, SCORES_DATASET, export_csv, load_results, write_dataset, write_table
+
 
 ROOT = Path(__file__).resolve().parent
 META_FILE = ROOT / "assignment3.csv"
@@ -37,6 +43,10 @@ MODE_SUMMARY_OUT = ROOT / "qualitative_summary_by_prompt_and_mode.csv"
 TABLES_OUT = ROOT / "qualitative_tables.md"
 MANUAL_SAMPLE_OUT = ROOT / "manual_review_sample.csv"
 
+SUMMARY_PARQUET_OUT = PARQUET_DIR / "qualitative_summary_by_prompt.parquet"
+MODE_SUMMARY_PARQUET_OUT = PARQUET_DIR / "qualitative_summary_by_prompt_and_mode.parquet"
+RESULT_COLUMNS = ["verdict", "response_type", "message_is", "file_path", "expected_verdict"]
+
 
 def norm_text(value: Any) -> str:
     if pd.isna(value):
@@ -254,8 +264,9 @@ def build_scored_rows() -> pd.DataFrame:
 
     rows: list[dict[str, Any]] = []
     for version in PROMPT_VERSIONS:
-        result_path = ROOT / f"results_{version}.csv"
-        result_df = pd.read_csv(result_path)
+        result_df = load_results(columns=RESULT_COLUMNS, versions=[version])
+        # Categorical labels would not merge against the plain-text metadata.
+        result_df = result_df.astype({"expected_verdict": object})
         result_df["image"] = result_df["file_path"].str.replace("./img/", "", regex=False)
 
         merged = result_df.merge(meta, on=["image", "expected_verdict"], how="left")
@@ -318,21 +329,31 @@ def build_scored_rows() -> pd.DataFrame:
 
 
 def save_outputs(scored: pd.DataFrame) -> None:
-    scored.to_csv(SCORED_OUT, index=False, encoding="utf-8-sig")
+    write_dataset(scored, SCORES_DATASET)
+    export_csv(scored, SCORED_OUT)
 
     hint_numeric = pd.to_numeric(
         scored["hint_usefulness_1_5"].replace("N/A", pd.NA), errors="coerce"
     )
+    # Precompute indicator columns so groupby.agg uses built-in sum/mean
+    # instead of a Python lambda per group.
+    labels = scored["correctness_label"]
+    indicators = scored.assign(
+        hint_usefulness_numeric=hint_numeric,
+        is_correct=labels == "Correct",
+        is_incorrect=labels == "Incorrect",
+        is_unclear=labels == "Unclear",
+    )
 
     summary = (
-        scored.assign(hint_usefulness_numeric=hint_numeric)
+        indicators
         .groupby("prompt_version")
         .agg(
             total_cases=("id", "count"),
-            correctness_correct=("correctness_label", lambda s: (s == "Correct").sum()),
-            correctness_incorrect=("correctness_label", lambda s: (s == "Incorrect").sum()),
-            correctness_unclear=("correctness_label", lambda s: (s == "Unclear").sum()),
-            correctness_rate=("correctness_label", lambda s: (s == "Correct").mean()),
+            correctness_correct=("is_correct", "sum"),
+            correctness_incorrect=("is_incorrect", "sum"),
+            correctness_unclear=("is_unclear", "sum"),
+            correctness_rate=("is_correct", "mean"),
             policy_violations=("policy_violation", "sum"),
             answer_leakage_cases=("answer_leakage", "sum"),
             avg_hint_usefulness=("hint_usefulness_numeric", "mean"),
@@ -343,14 +364,15 @@ def save_outputs(scored: pd.DataFrame) -> None:
     summary["correctness_rate"] = (summary["correctness_rate"] * 100).round(1)
     summary["avg_hint_usefulness"] = summary["avg_hint_usefulness"].round(2)
     summary["avg_clarity"] = summary["avg_clarity"].round(2)
-    summary.to_csv(SUMMARY_OUT, index=False, encoding="utf-8-sig")
+    write_table(summary, SUMMARY_PARQUET_OUT)
+    export_csv(summary, SUMMARY_OUT)
 
     mode_summary = (
-        scored.assign(hint_usefulness_numeric=hint_numeric)
+        indicators
         .groupby(["prompt_version", "mode"])
         .agg(
             cases=("id", "count"),
-            correctness_rate=("correctness_label", lambda s: (s == "Correct").mean()),
+            correctness_rate=("is_correct", "mean"),
             policy_violations=("policy_violation", "sum"),
             answer_leakage_cases=("answer_leakage", "sum"),
             avg_hint_usefulness=("hint_usefulness_numeric", "mean"),
@@ -361,7 +383,8 @@ def save_outputs(scored: pd.DataFrame) -> None:
     mode_summary["correctness_rate"] = (mode_summary["correctness_rate"] * 100).round(1)
     mode_summary["avg_hint_usefulness"] = mode_summary["avg_hint_usefulness"].round(2)
     mode_summary["avg_clarity"] = mode_summary["avg_clarity"].round(2)
-    mode_summary.to_csv(MODE_SUMMARY_OUT, index=False, encoding="utf-8-sig")
+    write_table(mode_summary, MODE_SUMMARY_PARQUET_OUT)
+    export_csv(mode_summary, MODE_SUMMARY_OUT)
 
     md_lines = [
         "# Qualitative Analysis Tables (Guidelines v2)",
@@ -379,11 +402,15 @@ def save_outputs(scored: pd.DataFrame) -> None:
         "",
         mode_summary.fillna("-").to_markdown(index=False),
         "",
+        *comparison_markdown(scored),
         "## Files",
         "",
-        f"- Row-level: `{SCORED_OUT.name}`",
-        f"- Prompt summary: `{SUMMARY_OUT.name}`",
-        f"- Prompt x mode summary: `{MODE_SUMMARY_OUT.name}`",
+        f"- Row-level: `{SCORED_OUT.name}` (Parquet: `{SCORES_DATASET.relative_to(ROOT)}/`)",
+        f"- Prompt summary: `{SUMMARY_OUT.name}` (Parquet: `{SUMMARY_PARQUET_OUT.relative_to(ROOT)}`)",
+        (
+            f"- Prompt x mode summary: `{MODE_SUMMARY_OUT.name}` "
+            f"(Parquet: `{MODE_SUMMARY_PARQUET_OUT.relative_to(ROOT)}`)"
+        ),
     ]
     TABLES_OUT.write_text("\n".join(md_lines), encoding="utf-8")
 
@@ -423,6 +450,7 @@ def main() -> None:
     scored = build_scored_rows()
     save_outputs(scored)
     build_manual_sample(scored)
+    print(f"Wrote {SCORES_DATASET.relative_to(ROOT)}/")
     print(f"Wrote {SCORED_OUT.name}")
     print(f"Wrote {SUMMARY_OUT.name}")
     print(f"Wrote {MODE_SUMMARY_OUT.name}")
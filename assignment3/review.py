@@ -1,12 +1,15 @@
 """
 Review the output of the three different prompting strategies
 """
-import pandas as pd
+from storage import load_results
+
+# Only the label columns are needed; message_is is never read.
+COLUMNS = ["file_path", "verdict", "expected_verdict", "response_type"]
 
 for v in ['v1','v2','v3', 'v4']:
     verdict_acc = 0
     non_feas = 0
-    df = pd.read_csv(f"results_{v}.csv")
+    df = load_results(columns=COLUMNS, versions=[v])
     for row in df.itertuples():
         # test wether the verdict is the same as the expected (true) verdict
         if row.verdict == row.expected_verdict:
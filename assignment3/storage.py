@@ -0,0 +1,288 @@
+"""
+Columnar storage for evaluation artifacts.
+
+Parquet is the primary on-disk format:
+- Row-level datasets are partitioned by prompt_version and mode
+  (parquet/<dataset>/prompt_version=v1/mode=hint/...).
+- Columns are typed; verdict/response_type/mode labels are stored as
+  categoricals (dictionary-encoded in Parquet).
+- Readers ask for the columns they need, so the long message_is text
+  column is never decoded unless requested.
+
+CSV stays available as an export format (export_csv / --export-csv) and as a
+read fallback when no Parquet dataset has been written yet.
+
+Usage (from assignment3/):
+    python storage.py               # convert results_v*.csv + qualitative CSVs to Parquet
+    python storage.py --export-csv  # write CSV copies from the Parquet datasets
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+from pathlib import Path
+from typing import Any, Sequence
+
+import pandas as pd
+
+
+ROOT = Path(__file__).resolve().parent
+META_FILE = ROOT / "assignment3.csv"
+PROMPT_VERSIONS = ["v1", "v2", "v3", "v4"]
+
+PARQUET_DIR = ROOT / "parquet"
+RESULTS_DATASET = PARQUET_DIR / "results"
+SCORES_DATASET = PARQUET_DIR / "qualitative_scores"
+PARTITION_COLS = ["prompt_version", "mode"]
+
+VERDICTS = ["fully_solved", "correct_so_far", "incorrect", "unclear"]
+RESPONSE_TYPES = ["hint", "fix_first", "explanation", "full_solution", "ask_clarification"]
+MODES = ["check_solution", "hint", "reveal"]
+
+CATEGORICAL_LEVELS = {
+    "prompt_version": PROMPT_VERSIONS,
+    "mode": MODES,
+    "verdict": VERDICTS,
+    "expected_verdict": VERDICTS,
+    "response_type": RESPONSE_TYPES,
+    "correctness_label": ["Correct", "Incorrect", "Unclear"],
+}
+
+COLUMN_DTYPES = {
+    "id": "Int64",
+    "clarity_1_5": "Int8",
+    "policy_violation": "boolean",
+    "answer_leakage": "boolean",
+    "file_path": "string",
+    "image": "string",
+    "category": "string",
+    "error_type": "string",
+    "message_is": "string",
+    "correctness_rationale": "string",
+    "hint_usefulness_1_5": "string",
+    "hint_usefulness_rationale": "string",
+    "clarity_rationale": "string",
+    "audit_rationale": "string",
+}
+
+# hint_usefulness_1_5 uses the literal "N/A" outside hint mode; keep it as text.
+SCORES_CSV_NA = {"keep_default_na": False, "na_values": [""]}
+
+
+def coerce_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Apply the artifact schema to every known column present in df."""
+    out = df.copy()
+    for col, levels in CATEGORICAL_LEVELS.items():
+        if col not in out.columns:
+            continue
+        # Keep the known levels first and append anything unexpected
+        # (e.g. response_type "error" for failed calls) instead of dropping it.
+        observed = [v for v in out[col].dropna().astype(str).unique() if v not in levels]
+        dtype = pd.CategoricalDtype(levels + sorted(observed))
+        out[col] = out[col].astype("string").astype(dtype)
+    for col, dtype in COLUMN_DTYPES.items():
+        if col in out.columns:
+            out[col] = out[col].astype(dtype)
+    return out
+
+
+def write_dataset(
+    df: pd.DataFrame,
+    path: Path,
+    partition_cols: Sequence[str] = PARTITION_COLS,
+) -> None:
+    """Write df as a partitioned Parquet dataset, replacing any previous run."""
+    if path.exists():
+        shutil.rmtree(path)
+    coerce_types(df).to_parquet(
+        path,
+        engine="pyarrow",
+        partition_cols=list(partition_cols),
+        index=False,
+    )
+
+
+def update_dataset(
+    df: pd.DataFrame,
+    path: Path,
+    keys: Sequence[str],
+    partition_cols: Sequence[str] = PARTITION_COLS,
+) -> pd.DataFrame:
+    """Merge df into the dataset at path and return the whole dataset.
+
+    Stored rows whose keys match a row of df are replaced; the rest are kept,
+    so a run over some configurations leaves the others' rows in place. The
+    merged dataset is written next to the old one and swapped in, so a failed
+    write loses nothing.
+    """
+    merged = df
+    if path.exists():
+        previous = read_dataset(path)
+        covered = pd.MultiIndex.from_frame(previous[list(keys)].astype("string")).isin(
+            pd.MultiIndex.from_frame(df[list(keys)].astype("string"))
+        )
+        kept = previous[~covered]
+        if len(kept):
+            # Categoricals from the two frames have different levels;
+            # coerce_types restores the schema when writing.
+            merged = pd.concat(
+                [kept.astype({c: "string" for c in CATEGORICAL_LEVELS if c in kept.columns}), df],
+                ignore_index=True,
+            )[list(df.columns)]
+    staging = path.with_name(f".{path.name}.new")
+    write_dataset(merged, staging, partition_cols)
+    if path.exists():
+        shutil.rmtree(path)
+    staging.rename(path)
+    return coerce_types(merged)
+
+
+def write_table(df: pd.DataFrame, path: Path) -> None:
+    """Write a small, unpartitioned table (e.g. summaries) as one Parquet file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    coerce_types(df).to_parquet(path, engine="pyarrow", index=False)
+
+
+def read_dataset(
+    path: Path,
+    columns: Sequence[str] | None = None,
+    filters: list[tuple[str, str, Any]] | None = None,
+) -> pd.DataFrame:
+    """Read only the requested columns (and partitions) of a Parquet dataset."""
+    return pd.read_parquet(
+        path,
+        engine="pyarrow",
+        columns=list(columns) if columns is not None else None,
+        filters=filters,
+    )
+
+
+def export_csv(df: pd.DataFrame, path: Path, encoding: str = "utf-8-sig") -> None:
+    df.to_csv(path, index=False, encoding=encoding)
+
+
+def _version_filter(versions: Sequence[str] | None) -> list[tuple[str, str, Any]] | None:
+    if versions is None:
+        return None
+    return [("prompt_version", "in", list(versions))]
+
+
+def _read_results_csv(
+    columns: Sequence[str] | None,
+    versions: Sequence[str] | None,
+) -> pd.DataFrame:
+    """Fallback reader for results_<version>.csv when no Parquet dataset exists."""
+    wanted = set(columns) if columns is not None else None
+    need_mode = wanted is None or "mode" in wanted
+
+    frames: list[pd.DataFrame] = []
+    for version in versions or PROMPT_VERSIONS:
+        usecols = None
+        if wanted is not None:
+            # file_path is the join key for mode, keep it while merging.
+            usecols = lambda c: c in wanted or c == "file_path"  # noqa: E731
+        df = pd.read_csv(ROOT / f"results_{version}.csv", usecols=usecols)
+        df["prompt_version"] = version
+        frames.append(df)
+    results = pd.concat(frames, ignore_index=True)
+
+    if need_mode:
+        meta = pd.read_csv(META_FILE, usecols=["image", "mode"])
+        image = results["file_path"].str.replace("./img/", "", regex=False)
+        results["mode"] = image.map(meta.set_index("image")["mode"])
+
+    if columns is not None:
+        results = results[list(columns)]
+    return coerce_types(results)
+
+
+def load_results(
+    columns: Sequence[str] | None = None,
+    versions: Sequence[str] | None = None,
+) -> pd.DataFrame:
+    """Load model outputs for the given prompt versions.
+
+    Reads the Parquet dataset when present, otherwise the per-version CSVs.
+    """
+    if RESULTS_DATASET.exists():
+        return read_dataset(RESULTS_DATASET, columns, _version_filter(versions))
+    return _read_results_csv(columns, versions)
+
+
+def load_scores(
+    columns: Sequence[str] | None = None,
+    versions: Sequence[str] | None = None,
+) -> pd.DataFrame:
+    """Load row-level qualitative scores (Parquet first, CSV fallback)."""
+    if SCORES_DATASET.exists():
+        return read_dataset(SCORES_DATASET, columns, _version_filter(versions))
+    df = pd.read_csv(
+        ROOT / "qualitative_scores_all_prompts.csv",
+        encoding="utf-8-sig",
+        usecols=list(columns) if columns is not None else None,
+        **SCORES_CSV_NA,
+    )
+    if versions is not None:
+        df = df[df["prompt_version"].isin(list(versions))]
+    return coerce_types(df)
+
+
+def convert_csv_artifacts() -> None:
+    """Convert the committed CSV artifacts to Parquet datasets/tables."""
+    results = _read_results_csv(columns=None, versions=PROMPT_VERSIONS)
+    write_dataset(results, RESULTS_DATASET)
+    print(f"Wrote {RESULTS_DATASET.relative_to(ROOT)}/")
+
+    scores = pd.read_csv(
+        ROOT / "qualitative_scores_all_prompts.csv", encoding="utf-8-sig", **SCORES_CSV_NA
+    )
+    write_dataset(scores, SCORES_DATASET)
+    print(f"Wrote {SCORES_DATASET.relative_to(ROOT)}/")
+
+    for name in ["qualitative_summary_by_prompt", "qualitative_summary_by_prompt_and_mode"]:
+        summary = pd.read_csv(ROOT / f"{name}.csv", encoding="utf-8-sig")
+        write_table(summary, PARQUET_DIR / f"{name}.parquet")
+        print(f"Wrote {(PARQUET_DIR / f'{name}.parquet').relative_to(ROOT)}")
+
+
+def export_parquet_artifacts() -> None:
+    """Write CSV copies of the Parquet datasets (inverse of convert_csv_artifacts)."""
+    results = read_dataset(RESULTS_DATASET)
+    for version, group in results.groupby("prompt_version", observed=True):
+        out = (
+            group.drop(columns=["prompt_version", "mode"])
+            .assign(prompt_version=version)
+            .sort_values("file_path", key=lambda s: s.str.extract(r"(\d+)")[0].astype(int))
+        )
+        # results_<version>.csv has always been plain UTF-8 (agentic.py output).
+        export_csv(out, ROOT / f"results_{version}.csv", encoding="utf-8")
+        print(f"Wrote results_{version}.csv")
+
+    scores = read_dataset(SCORES_DATASET)
+    # Partition columns come back last; restore the original column order.
+    rest = [c for c in scores.columns if c not in ("prompt_version", "id", "image", "mode")]
+    scores = scores[["prompt_version", "id", "image", "mode", *rest]].sort_values(
+        ["prompt_version", "id"]
+    )
+    export_csv(scores, ROOT / "qualitative_scores_all_prompts.csv")
+    print("Wrote qualitative_scores_all_prompts.csv")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert eval artifacts between CSV and Parquet.")
+    parser.add_argument(
+        "--export-csv",
+        action="store_true",
+        help="Export CSV files from the Parquet datasets instead of converting CSV to Parquet.",
+    )
+    args = parser.parse_args()
+
+    if args.export_csv:
+        export_parquet_artifacts()
+    else:
+        convert_csv_artifacts()
+
+
+if __name__ == "__main__":
+    main()
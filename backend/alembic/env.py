@@ -25,7 +25,7 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 # Import models so SQLModel.metadata is populated for autogenerate.
-from backend.models import auth_models  # noqa: F401
+from backend.models import auth_models, interaction_models, job_models, problem_models, usage_models  # noqa: F401
 
 target_metadata = SQLModel.metadata
 
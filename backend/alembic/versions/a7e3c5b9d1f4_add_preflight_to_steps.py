@@ -0,0 +1,36 @@
+"""add image quality and preflight to steps
+
+Revision ID: a7e3c5b9d1f4
+Revises: f2c6d8a1b3e9
+Create Date: 2026-10-19 17:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7e3c5b9d1f4"
+down_revision: Union[str, Sequence[str], None] = "f2c6d8a1b3e9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("steps", sa.Column("sol_ink_fraction", sa.Float(), nullable=True))
+    op.add_column("steps", sa.Column("sol_brightness", sa.Float(), nullable=True))
+    op.add_column("steps", sa.Column("sol_contrast", sa.Float(), nullable=True))
+    op.add_column("steps", sa.Column("sol_sharpness", sa.Float(), nullable=True))
+    op.add_column("steps", sa.Column("preflight", sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("steps", "preflight")
+    op.drop_column("steps", "sol_sharpness")
+    op.drop_column("steps", "sol_contrast")
+    op.drop_column("steps", "sol_brightness")
+    op.drop_column("steps", "sol_ink_fraction")
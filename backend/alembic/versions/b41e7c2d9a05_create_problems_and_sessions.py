@@ -0,0 +1,66 @@
+"""create problems and sessions
+
+Revision ID: b41e7c2d9a05
+Revises: 9f3c2a7d4b11
+Create Date: 2026-10-19 10:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b41e7c2d9a05"
+down_revision: Union[str, Sequence[str], None] = "9f3c2a7d4b11"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "problems",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("image_data", sa.LargeBinary(), nullable=False),
+        sa.Column("image_mime", sa.String(length=64), nullable=False),
+        sa.Column("image_sha256", sa.String(length=64), nullable=False),
+        sa.Column("image_width", sa.Integer(), nullable=False),
+        sa.Column("image_height", sa.Integer(), nullable=False),
+        sa.Column("gemini_file_name", sa.String(length=128), nullable=True),
+        sa.Column("gemini_file_uri", sa.String(length=512), nullable=True),
+        sa.Column("gemini_file_expires_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_problems_id"), "problems", ["id"], unique=False)
+    op.create_index(op.f("ix_problems_user_id"), "problems", ["user_id"], unique=False)
+    op.create_index("ix_problems_user_id_created_at", "problems", ["user_id", "created_at"], unique=False)
+
+    op.create_table(
+        "sessions",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.Column("active_problem_id", sa.Uuid(), nullable=True),
+        sa.Column("last_active_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["active_problem_id"], ["problems.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_sessions_id"), "sessions", ["id"], unique=False)
+    op.create_index("ix_sessions_user_id", "sessions", ["user_id"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_sessions_user_id", table_name="sessions")
+    op.drop_index(op.f("ix_sessions_id"), table_name="sessions")
+    op.drop_table("sessions")
+    op.drop_index("ix_problems_user_id_created_at", table_name="problems")
+    op.drop_index(op.f("ix_problems_user_id"), table_name="problems")
+    op.drop_index(op.f("ix_problems_id"), table_name="problems")
+    op.drop_table("problems")
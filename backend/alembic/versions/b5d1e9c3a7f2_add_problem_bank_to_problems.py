@@ -0,0 +1,32 @@
+"""add problem bank match and hint level to problems
+
+Revision ID: b5d1e9c3a7f2
+Revises: a7e3c5b9d1f4
+Create Date: 2026-10-19 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b5d1e9c3a7f2"
+down_revision: Union[str, Sequence[str], None] = "a7e3c5b9d1f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("problems", sa.Column("bank_problem_id", sa.String(length=64), nullable=True))
+    op.add_column(
+        "problems", sa.Column("bank_hint_level", sa.Integer(), nullable=False, server_default="0")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("problems", "bank_hint_level")
+    op.drop_column("problems", "bank_problem_id")
@@ -0,0 +1,34 @@
+"""add last solution and verdict to problems
+
+Revision ID: c7d2e4f8a613
+Revises: b41e7c2d9a05
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c7d2e4f8a613"
+down_revision: Union[str, Sequence[str], None] = "b41e7c2d9a05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("problems", sa.Column("last_solution_data", sa.LargeBinary(), nullable=True))
+    op.add_column("problems", sa.Column("last_verdict", sa.String(length=32), nullable=True))
+    op.add_column("problems", sa.Column("last_response_type", sa.String(length=32), nullable=True))
+    op.add_column("problems", sa.Column("last_message", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("problems", "last_message")
+    op.drop_column("problems", "last_response_type")
+    op.drop_column("problems", "last_verdict")
+    op.drop_column("problems", "last_solution_data")
@@ -0,0 +1,69 @@
+"""create steps and feedback
+
+Revision ID: f2c6d8a1b3e9
+Revises: e8b4c0d5f7a2
+Create Date: 2026-10-19 15:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f2c6d8a1b3e9"
+down_revision: Union[str, Sequence[str], None] = "e8b4c0d5f7a2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "steps",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.Column("problem_id", sa.Uuid(), nullable=True),
+        sa.Column("mode", sa.String(length=32), nullable=False),
+        sa.Column("incremental", sa.Boolean(), nullable=False),
+        sa.Column("regenerate", sa.Boolean(), nullable=False),
+        sa.Column("sol_image_sha256", sa.String(length=64), nullable=False),
+        sa.Column("prob_image_sha256", sa.String(length=64), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["problem_id"], ["problems.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_steps_user_id"), "steps", ["user_id"], unique=False)
+    op.create_index(op.f("ix_steps_problem_id"), "steps", ["problem_id"], unique=False)
+    op.create_index(op.f("ix_steps_created_at"), "steps", ["created_at"], unique=False)
+
+    op.create_table(
+        "feedback",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("step_id", sa.Uuid(), nullable=False),
+        sa.Column("model", sa.String(length=64), nullable=True),
+        sa.Column("verdict", sa.String(length=32), nullable=True),
+        sa.Column("response_type", sa.String(length=32), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("latency_ms", sa.Integer(), nullable=True),
+        sa.Column("tokens_in", sa.Integer(), nullable=False),
+        sa.Column("tokens_out", sa.Integer(), nullable=False),
+        sa.Column("tokens_thoughts", sa.Integer(), nullable=False),
+        sa.Column("tokens_total", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["step_id"], ["steps.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_feedback_step_id"), "feedback", ["step_id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_feedback_step_id"), table_name="feedback")
+    op.drop_table("feedback")
+    op.drop_index(op.f("ix_steps_created_at"), table_name="steps")
+    op.drop_index(op.f("ix_steps_problem_id"), table_name="steps")
+    op.drop_index(op.f("ix_steps_user_id"), table_name="steps")
+    op.drop_table("steps")
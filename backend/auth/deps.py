@@ -22,7 +22,11 @@ def get_current_user(
         raise HTTPException(status_code=401, detail="Invalid or expired access token")
 
     user = session.get(User, user_id)
+    # Give the connection back now: /query and the job stream keep the request
+    # open for seconds. The user's columns stay readable, and a route that
+    # uses the session again starts a new transaction.
+    session.close()
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="User not found or inactive")
 
-    return user
\ No newline at end of file
+    return user
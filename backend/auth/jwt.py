@@ -1,17 +1,143 @@
 # app/auth/jwt.py
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Optional
 from uuid import UUID
 
-from jose import jwt, JWTError
+from backend.config import (
+    ACCESS_TOKEN_CACHE_SIZE,
+    ACCESS_TOKEN_TTL_MIN,
+    JWT_ACTIVE_KID,
+    JWT_ALG,
+    JWT_BACKEND,
+    JWT_KEYS,
+    JWT_SECRET,
+)
 
-from backend.config import JWT_SECRET, JWT_ALG, ACCESS_TOKEN_TTL_MIN
+logger = logging.getLogger(__name__)
 
 
 def utcnow():
     return datetime.now(timezone.utc)
 
 
+def parse_keys(value: str) -> dict[str, str]:
+    """JWT_KEYS ("kid=secret,kid=secret") as {kid: secret}."""
+    keys = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        kid, sep, secret = item.partition("=")
+        if not sep or not kid.strip() or not secret.strip():
+            raise ValueError(f"Invalid JWT_KEYS entry {item.split('=')[0]!r}: expected kid=secret")
+        keys[kid.strip()] = secret.strip()
+    return keys
+
+
+_keys = parse_keys(JWT_KEYS)
+if JWT_ACTIVE_KID and JWT_ACTIVE_KID not in _keys:
+    raise ValueError(f"JWT_ACTIVE_KID {JWT_ACTIVE_KID!r} is not in JWT_KEYS")
+
+
+class _JoseBackend:
+    name = "python-jose"
+
+    def __init__(self) -> None:
+        from jose import JWTError, jwt
+
+        self._jwt = jwt
+        self.errors = (JWTError, ValueError)
+
+    def encode(self, payload: dict[str, Any], key: str, headers: Optional[dict[str, str]]) -> str:
+        return self._jwt.encode(payload, key, algorithm=JWT_ALG, headers=headers)
+
+    def header(self, token: str) -> dict[str, Any]:
+        return self._jwt.get_unverified_header(token)
+
+    def decode(self, token: str, key: str) -> dict[str, Any]:
+        return self._jwt.decode(token, key, algorithms=[JWT_ALG])
+
+
+class _PyJWTBackend:
+    # Optional dependency (pip install PyJWT); compare with
+    # python -m backend.perf.auth_bench.
+    name = "PyJWT"
+
+    def __init__(self) -> None:
+        import jwt
+
+        self._jwt = jwt
+        self.errors = (jwt.PyJWTError, ValueError)
+
+    def encode(self, payload: dict[str, Any], key: str, headers: Optional[dict[str, str]]) -> str:
+        return self._jwt.encode(payload, key, algorithm=JWT_ALG, headers=headers)
+
+    def header(self, token: str) -> dict[str, Any]:
+        return self._jwt.get_unverified_header(token)
+
+    def decode(self, token: str, key: str) -> dict[str, Any]:
+        return self._jwt.decode(token, key, algorithms=[JWT_ALG])
+
+
+def _load_backend(name: str):
+    if name in ("auto", "pyjwt"):
+        try:
+            return _PyJWTBackend()
+        except ImportError:
+            if name == "pyjwt":
+                raise
+            logger.info("PyJWT not installed; using python-jose for JWTs")
+    return _JoseBackend()
+
+
+_backend = _load_backend(JWT_BACKEND)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified access tokens, SHA-256 digest -> (user_id, exp).
+
+    Only tokens that passed verification are stored, and an entry is dropped
+    once its exp passes, so a hit is as good as a fresh decode. The digest,
+    not the token, is kept.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, tuple[UUID, float]] = OrderedDict()
+
+    def get(self, digest: bytes) -> Optional[UUID]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def put(self, digest: bytes, user_id: UUID, exp: float) -> None:
+        with self._lock:
+            self._entries[digest] = (user_id, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+token_cache = VerifiedTokenCache(ACCESS_TOKEN_CACHE_SIZE) if ACCESS_TOKEN_CACHE_SIZE > 0 else None
+
+
 def create_access_token(user_id: UUID) -> str:
     exp = utcnow() + timedelta(minutes=ACCESS_TOKEN_TTL_MIN)
     payload = {
@@ -20,17 +146,41 @@ def create_access_token(user_id: UUID) -> str:
         "iat": int(utcnow().timestamp()),
         "type": "access",
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
+    if JWT_ACTIVE_KID:
+        return _backend.encode(payload, _keys[JWT_ACTIVE_KID], {"kid": JWT_ACTIVE_KID})
+    return _backend.encode(payload, JWT_SECRET, None)
+
+
+def _verify(token: str) -> Optional[dict[str, Any]]:
+    key = JWT_SECRET
+    if _keys:
+        kid = _backend.header(token).get("kid")
+        if kid is not None:
+            key = _keys.get(kid)
+            if key is None:
+                # Signed with a key that has been retired (or never existed).
+                return None
+    return _backend.decode(token, key)
 
 
 def decode_access_token(token: str) -> Optional[UUID]:
+    digest = None
+    if token_cache is not None:
+        digest = hashlib.sha256(token.encode()).digest()
+        user_id = token_cache.get(digest)
+        if user_id is not None:
+            return user_id
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        if payload.get("type") != "access":
+        payload = _verify(token)
+        if payload is None or payload.get("type") != "access":
             return None
         sub = payload.get("sub")
         if not sub:
             return None
-        return UUID(sub)
-    except (JWTError, ValueError):
+        user_id = UUID(sub)
+    except _backend.errors:
         return None
+    exp = payload.get("exp")
+    if digest is not None and exp is not None:
+        token_cache.put(digest, user_id, float(exp))
+    return user_id
@@ -1,9 +1,30 @@
 # app/config.py
 import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Single place that loads backend/.env; every module reads settings from here
+# (or os.getenv after importing this module).
+load_dotenv(Path(__file__).resolve().parent / ".env")
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
 
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-change-me")
 JWT_ALG = os.getenv("JWT_ALG", "HS256")
 ACCESS_TOKEN_TTL_MIN = int(os.getenv("ACCESS_TOKEN_TTL_MIN", "15"))
+# Access-token signing keys for rotation, "kid=secret,kid=secret": new tokens
+# are signed with JWT_ACTIVE_KID and carry it in their header; a token is
+# verified with the key its kid names. Tokens without a kid (all of them
+# when JWT_KEYS is empty) are verified with JWT_SECRET.
+JWT_KEYS = os.getenv("JWT_KEYS", "")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "")
+JWT_BACKEND = os.getenv("JWT_BACKEND", "auto")  # "auto" (PyJWT if installed) | "pyjwt" | "jose"
+# Verified access tokens kept per process (by SHA-256 digest, until they
+# expire) so repeat requests skip the JWT decode; 0 disables.
+ACCESS_TOKEN_CACHE_SIZE = int(os.getenv("ACCESS_TOKEN_CACHE_SIZE", "10000"))
 REFRESH_TOKEN_TTL_DAYS = int(os.getenv("REFRESH_TOKEN_TTL_DAYS", "30"))
 
 # Cookie settings
@@ -15,3 +36,160 @@ COOKIE_SECURE = os.getenv("COOKIE_SECURE", "false").lower() == "true"
 # "lax" is usually good; if frontend/backend are truly cross-site you may need "none"
 COOKIE_SAMESITE = os.getenv("COOKIE_SAMESITE", "lax")  # "lax" | "strict" | "none"
 COOKIE_PATH = os.getenv("COOKIE_PATH", "/")
+
+# Tracing: one OpenTelemetry trace per request or job, exported to Langfuse
+# (when its keys are set) and to OTEL_EXPORTER_OTLP_ENDPOINT (when set).
+# Every trace with an error, a retry or a root span slower than its route's
+# rolling p95 is kept, and TRACE_SAMPLE_RATE of the others; at most
+# TRACE_MAX_BUFFERED traces wait for that decision. Prompts are recorded as
+# PROMPT_VERSION plus a hash, or in full with TRACE_PROMPT_BODIES.
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_MAX_BUFFERED = int(os.getenv("TRACE_MAX_BUFFERED", "2000"))
+TRACE_PROMPT_BODIES = os.getenv("TRACE_PROMPT_BODIES", "false").lower() == "true"
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+
+# Operational metrics (/metrics route + event-loop lag monitor); off by default
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+LOOP_LAG_INTERVAL_S = float(os.getenv("LOOP_LAG_INTERVAL_S", "0.05"))
+
+# Profiling, off by default. PROFILING_ENABLED adds the /debug routes and
+# per-request sampling profiles: a request is profiled when it carries the
+# header X-Profile-Token: <PROFILING_TOKEN>, and PROFILE_SAMPLE_RATE of the
+# others are. A watchdog thread reports event-loop callbacks that block longer
+# than LOOP_BLOCK_THRESHOLD_S, with the loop's stack. TRACEMALLOC_FRAMES > 0
+# also traces allocations for GET /debug/memory (this slows every allocation).
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_S", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+LOOP_BLOCK_THRESHOLD_S = float(os.getenv("LOOP_BLOCK_THRESHOLD_S", "0.1"))
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "0"))
+
+# Startup: clients are built lazily; the lifespan warms them before /ready
+# reports ready. LLM_WARMUP_PING also opens a connection to the Gemini API.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+LLM_WARMUP_PING = os.getenv("LLM_WARMUP_PING", "true").lower() == "true"
+WARMUP_RETRY_MAX_S = float(os.getenv("WARMUP_RETRY_MAX_S", "30"))
+
+# Problem images: longest side kept after normalization (Gemini tiles larger
+# images internally, so extra pixels only cost upload bytes), and how long
+# before its expiry an uploaded Gemini file is replaced.
+IMAGE_NORMALIZE_MAX_SIDE = int(os.getenv("IMAGE_NORMALIZE_MAX_SIDE", "1600"))
+GEMINI_FILE_REFRESH_MARGIN_S = int(os.getenv("GEMINI_FILE_REFRESH_MARGIN_S", "600"))
+
+# Uploads: request bodies larger than MAX_REQUEST_BYTES are cut off with 413
+# while they stream in; each image may be at most MAX_IMAGE_BYTES encoded and
+# MAX_IMAGE_PIXELS decoded (decompression-bomb guard).
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(16 * 1024 * 1024)))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(8 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "40000000"))
+
+# Gemini explicit context caching of the tutoring prompt (+ problem image).
+# Active caches are extended while in use; at most GEMINI_CACHE_MAX_ENTRIES
+# are kept per process, least recently used deleted first.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+GEMINI_CACHE_TTL_S = int(os.getenv("GEMINI_CACHE_TTL_S", "3600"))
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "256"))
+
+# Incremental step checks: a pixel counts as new ink when its grey level
+# moved by more than STEP_DIFF_THRESHOLD; the crop around new ink is padded
+# by STEP_CROP_PADDING_PX and only used if it covers at most
+# STEP_MAX_CROP_FRACTION of the canvas.
+STEP_DIFF_THRESHOLD = int(os.getenv("STEP_DIFF_THRESHOLD", "48"))
+STEP_CROP_PADDING_PX = int(os.getenv("STEP_CROP_PADDING_PX", "24"))
+STEP_MAX_CROP_FRACTION = float(os.getenv("STEP_MAX_CROP_FRACTION", "0.6"))
+
+# Model routing: calls whose difficulty score (dense ink, long multi-step
+# work, earlier incorrect/unclear verdicts on the problem, reveal mode)
+# reaches ROUTER_PRO_SCORE go to pro; the rest try flash and escalate to pro
+# when its answer is unclear, breaks the verdict/response_type policy or is
+# not valid JSON.
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+ROUTER_PRO_SCORE = int(os.getenv("ROUTER_PRO_SCORE", "2"))
+ROUTER_DENSE_INK = float(os.getenv("ROUTER_DENSE_INK", "0.05"))
+ROUTER_LONG_WORK_ROWS = int(os.getenv("ROUTER_LONG_WORK_ROWS", "600"))
+ROUTER_ESCALATE = os.getenv("ROUTER_ESCALATE", "true").lower() == "true"
+
+# Pre-flight image checks: a solution canvas with less than PREFLIGHT_MIN_INK
+# ink (pixels far from the page's grey level), or an image flatter (grey level
+# standard deviation) or blurrier (edge strength / contrast) than these
+# minimums, is answered with a clarification request without calling Gemini.
+# A flat image darker (mean grey level) than PREFLIGHT_MIN_BRIGHTNESS is
+# reported as too dark.
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT_ENABLED", "true").lower() == "true"
+PREFLIGHT_MIN_INK = float(os.getenv("PREFLIGHT_MIN_INK", "0.0005"))
+PREFLIGHT_MIN_BRIGHTNESS = float(os.getenv("PREFLIGHT_MIN_BRIGHTNESS", "90"))
+PREFLIGHT_MIN_CONTRAST = float(os.getenv("PREFLIGHT_MIN_CONTRAST", "3"))
+PREFLIGHT_MIN_SHARPNESS = float(os.getenv("PREFLIGHT_MIN_SHARPNESS", "0.08"))
+
+# Problem bank: known textbook problems with a reviewed hint ladder and
+# common-error feedback, generated offline (python -m backend.problem_bank).
+# PROBLEM_BANK_PATH is its bank.json; unset, there is no bank. A problem
+# matches a bank problem by id, or when the dHash of its image is within
+# PROBLEM_BANK_MAX_DISTANCE bits (of 256) of a bank image's.
+PROBLEM_BANK_PATH = os.getenv("PROBLEM_BANK_PATH", "")
+PROBLEM_BANK_MAX_DISTANCE = int(os.getenv("PROBLEM_BANK_MAX_DISTANCE", "16"))
+
+# /query Idempotency-Key results are kept in-process for this long (and at
+# most this many), so a retried request gets the stored answer.
+IDEMPOTENCY_TTL_S = int(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+# /query gives up on its Gemini call(s) after QUERY_DEADLINE_S (504), or the
+# client's X-Request-Timeout if shorter; a call whose client has disconnected
+# is stopped too, so no retry, escalation or continuation runs for nobody.
+QUERY_DEADLINE_S = float(os.getenv("QUERY_DEADLINE_S", "60"))
+
+# Tutor call scheduler (per process): at most LLM_MAX_CONCURRENCY calls run at
+# once (0 disables the scheduler) and the rest queue. hint/check_solution
+# calls go before reveal/regenerate ones, which get at most
+# LLM_BATCH_MAX_CONCURRENCY slots unless one has waited LLM_BATCH_MAX_WAIT_S.
+# Within each lane tenants ("user", or "domain": the school's email domain)
+# share the slots fairly, a call weighing LLM_CALL_COSTS ("mode=cost").
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_BATCH_MAX_CONCURRENCY = int(os.getenv("LLM_BATCH_MAX_CONCURRENCY", "8"))
+LLM_BATCH_MAX_WAIT_S = float(os.getenv("LLM_BATCH_MAX_WAIT_S", "30"))
+LLM_TENANT = os.getenv("LLM_TENANT", "user")  # "user" | "domain"
+LLM_CALL_COSTS = os.getenv("LLM_CALL_COSTS", "hint=1,check_solution=1,reveal=3")
+
+# Shadow evaluation: SHADOW_SAMPLE_RATE of answered /query calls are replayed,
+# after the response is sent, against each of SHADOW_CANDIDATES
+# ("name=prompt_file@model", prompt file relative to backend/) and the
+# verdicts compared. SHADOW_MAX_CONCURRENCY calls at once, at most
+# SHADOW_MAX_PENDING waiting (more are dropped), and no more once the day's
+# shadow calls used SHADOW_DAILY_TOKEN_BUDGET tokens (0: no budget).
+SHADOW_CANDIDATES = os.getenv("SHADOW_CANDIDATES", "")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+SHADOW_MAX_CONCURRENCY = int(os.getenv("SHADOW_MAX_CONCURRENCY", "2"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "100"))
+SHADOW_DAILY_TOKEN_BUDGET = int(os.getenv("SHADOW_DAILY_TOKEN_BUDGET", "200000"))
+
+# /query throttling per user: token buckets per mode, "mode=burst/per_minute",
+# and a daily Gemini token budget (tokens_total; 0 disables). "memory" keeps
+# state per worker; "database" shares it across workers via the app DB.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" | "database"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "hint=10/20,check_solution=10/20,reveal=3/5")
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "500000"))
+
+# /jobs: background LLM calls (regenerate/reveal). JOB_WORKERS per process;
+# idle workers check the jobs table every JOB_POLL_INTERVAL_S. A job left
+# "running" longer than JOB_STALE_S (worker died) is re-queued, up to
+# JOB_MAX_ATTEMPTS runs in total. A job's Gemini call(s), including the wait
+# for a scheduler slot, are stopped after JOB_DEADLINE_S, which must be
+# shorter than JOB_STALE_S so a live job is never re-queued under its worker.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_S = float(os.getenv("JOB_POLL_INTERVAL_S", "2"))
+JOB_STALE_S = int(os.getenv("JOB_STALE_S", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_DEADLINE_S = float(os.getenv("JOB_DEADLINE_S", "300"))
+
+# Interaction log (steps/feedback tables): /query and job outcomes are queued
+# in memory and written in batches every INTERACTION_LOG_FLUSH_MS; past
+# INTERACTION_LOG_MAX_PENDING unwritten rows the oldest are dropped.
+INTERACTION_LOG_ENABLED = os.getenv("INTERACTION_LOG_ENABLED", "true").lower() == "true"
+INTERACTION_LOG_FLUSH_MS = int(os.getenv("INTERACTION_LOG_FLUSH_MS", "500"))
+INTERACTION_LOG_MAX_PENDING = int(os.getenv("INTERACTION_LOG_MAX_PENDING", "10000"))
@@ -1,21 +1,65 @@
-import os
-from dotenv import load_dotenv
-from sqlmodel import SQLModel, create_engine, Session
+from __future__ import annotations
 
-load_dotenv()
+import threading
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL is not set")
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import create_engine, Session
+
+from backend.config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from backend.tracing import detached_span
+
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def _build_engine() -> Engine:
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL is not set")
+
+    # SQLite (local load tests) needs connections shareable across FastAPI's
+    # worker threads; Postgres needs nothing extra.
+    connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+
+    # Recommended for Neon & hosted Postgres: keep pool small and recycle
+    return create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        connect_args=connect_args,
+    )
+
+
+def get_engine() -> Engine:
+    """Return the process-wide engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _build_engine()
+    return _engine
+
+
+def engine_if_created() -> Engine | None:
+    """The engine if something already created it (metrics must not create it)."""
+    return _engine
+
+
+def warm_up_db() -> None:
+    """Create the engine and open one pooled connection."""
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def dispose_engine() -> None:
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
 
-# Recommended for Neon & hosted Postgres: keep pool small and recycle
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=5,
-)
 
 def get_session():
-    with Session(engine) as session:
+    with detached_span("db.session"), Session(get_engine()) as session:
         yield session
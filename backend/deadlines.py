@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Awaitable, TypeVar
+
+from starlette.requests import Request
+
+from backend.metrics import metrics
+
+T = TypeVar("T")
+
+
+class CallCancelled(Exception):
+    """Raised in the worker thread when a model call is no longer wanted."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"cancelled: {reason}")
+        self.reason = reason
+
+
+class Cancellation:
+    """Deadline and cancel flag shared between a request and its model call.
+
+    The request side calls cancel(); the worker thread running the blocking
+    Gemini calls checks it before every attempt, wakes from retry backoff
+    when it is set, and bounds each HTTP request by remaining(), so the
+    outbound request itself is aborted at the deadline.
+    """
+
+    def __init__(self, timeout_s: float) -> None:
+        self.expires_at = time.monotonic() + timeout_s
+        self.reason: str | None = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str) -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            metrics.incr(f"cancelled_{reason}")
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def check(self) -> None:
+        if not self._event.is_set() and self.remaining() <= 0:
+            self.cancel("deadline")
+        if self._event.is_set():
+            raise CallCancelled(self.reason or "cancelled")
+
+    def sleep(self, seconds: float) -> None:
+        """Retry backoff: returns after seconds unless cancelled first.
+
+        A backoff that would run past the deadline is cut short at once,
+        since there would be no time left for the retry.
+        """
+        if seconds >= self.remaining():
+            self.cancel("deadline")
+        self._event.wait(seconds)
+        self.check()
+
+
+async def _disconnected(request: Request) -> None:
+    # The body has been read by now, so the next message is the disconnect.
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def until_disconnected(request: Request, work: Awaitable[T], cancellation: Cancellation) -> T:
+    """Await work unless the client disconnects or the deadline passes first.
+
+    On a deadline the shared call is cancelled and CallCancelled("deadline")
+    raised. On a disconnect only this waiter stops (raising
+    CallCancelled("disconnected")); a SingleFlight cancels the call itself
+    once no waiter is left.
+    """
+    work_task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_disconnected(request))
+    try:
+        done, _ = await asyncio.wait(
+            {work_task, watcher}, timeout=cancellation.remaining(), return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        watcher.cancel()
+    if work_task in done:
+        return work_task.result()
+
+    work_task.cancel()
+    if watcher in done:
+        metrics.incr("query_client_disconnected")
+        raise CallCancelled("disconnected")
+    cancellation.cancel("deadline")
+    raise CallCancelled("deadline")
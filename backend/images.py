@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+from backend.config import (
+    IMAGE_NORMALIZE_MAX_SIDE,
+    MAX_IMAGE_PIXELS,
+    STEP_CROP_PADDING_PX,
+    STEP_DIFF_THRESHOLD,
+    STEP_MAX_CROP_FRACTION,
+)
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+NORMALIZED_MIME = "image/png"
+
+# Upload formats accepted, by leading magic bytes; PIL is only asked to
+# decode these.
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"\xff\xd8\xff", "JPEG"),
+)
+ACCEPTED_FORMATS = ("PNG", "JPEG", "WEBP")
+
+# How far a pixel's grey level must be from the page's (the median) to count
+# as pen stroke, either way: light pencil on white paper, chalk on a dark
+# board (see ImageQuality).
+INK_MARGIN = 64
+# Images are halved past this side before edge detection for sharpness.
+_SHARPNESS_MAX_SIDE = 800
+# Grid of the perceptual hash: one bit per cell, 256 bits. 8x8 is the usual
+# dHash, but it barely tells mostly-white pages of text apart.
+_DHASH_SIDE = 16
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image."""
+
+
+class ImageTooLargeError(InvalidImageError):
+    """Raised when an image decodes to more than MAX_IMAGE_PIXELS."""
+
+
+def sniff_format(head: bytes) -> str | None:
+    """PNG/JPEG/WEBP from the first bytes of a file, None for anything else."""
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+@dataclass(frozen=True)
+class ImageQuality:
+    """Cheap measures of a normalized image, for routing and pre-flight checks.
+
+    ink_fraction/ink_rows are proxies for how much work is on a canvas: a
+    one-line linear equation has little ink over few rows, a multi-step
+    solution a lot. Ink is measured against the page, not an absolute grey
+    level, so light pencil and light-on-dark canvases count.
+    brightness/contrast are the mean and standard deviation of the grey
+    levels; sharpness is edge strength relative to contrast, low for
+    out-of-focus photos.
+    """
+
+    ink_fraction: float
+    ink_rows: int
+    brightness: float
+    contrast: float
+    sharpness: float
+
+
+@dataclass(frozen=True)
+class NormalizedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    sha256: str
+    quality: ImageQuality
+    dhash: str
+
+    def to_pil(self) -> Image.Image:
+        from PIL import Image
+
+        return Image.open(BytesIO(self.data))
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_image(data: bytes) -> NormalizedImage:
+    """Decode, orient and downscale an upload, re-encoded as PNG.
+
+    Handwriting and printed problems compress well as PNG and stay lossless,
+    so the stored bytes are what Gemini sees on every later call.
+    The pixel count is checked from the header before anything is decoded.
+    The quality measures are taken from the decoded image on the way.
+    CPU-bound; call from a worker thread.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(BytesIO(data), formats=ACCEPTED_FORMATS) as img:
+            if img.width * img.height > MAX_IMAGE_PIXELS:
+                raise ImageTooLargeError(f"{img.width}x{img.height} exceeds {MAX_IMAGE_PIXELS} pixels")
+            # JPEG can decode at a reduced scale directly; no-op for other formats.
+            img.draft("RGB", (IMAGE_NORMALIZE_MAX_SIDE, IMAGE_NORMALIZE_MAX_SIDE))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("L", "RGB"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+                if img.mode == "RGBA":
+                    # Transparent canvases become white paper.
+                    background = Image.new("RGB", img.size, (255, 255, 255))
+                    background.paste(img, mask=img.getchannel("A"))
+                    img = background
+            img.thumbnail((IMAGE_NORMALIZE_MAX_SIDE, IMAGE_NORMALIZE_MAX_SIDE))
+            quality = measure_quality(img)
+            dhash = difference_hash(img)
+
+            out = BytesIO()
+            img.save(out, format="PNG", optimize=True)
+            width, height = img.size
+    except Image.DecompressionBombError as exc:
+        raise ImageTooLargeError(str(exc)) from exc
+    except (UnidentifiedImageError, OSError) as exc:
+        raise InvalidImageError(str(exc)) from exc
+
+    encoded = out.getvalue()
+    return NormalizedImage(
+        data=encoded,
+        mime_type=NORMALIZED_MIME,
+        width=width,
+        height=height,
+        sha256=sha256_hex(encoded),
+        quality=quality,
+        dhash=dhash,
+    )
+
+
+def new_region(previous: bytes, current: bytes) -> tuple[int, int, int, int] | None:
+    """Bounding box (left, top, right, bottom) of what was added to a canvas.
+
+    Both images are normalized PNGs of the same solution canvas. A canvas that
+    grew is compared against the previous one padded with white. Returns None
+    when the diff is unusable: nothing changed, the canvas shrank, or the
+    changed area is so large that a crop would not save anything.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(BytesIO(previous)) as prev_img, Image.open(BytesIO(current)) as cur_img:
+        prev = np.asarray(prev_img.convert("L"), dtype=np.int16)
+        cur = np.asarray(cur_img.convert("L"), dtype=np.int16)
+
+    if prev.shape[0] > cur.shape[0] or prev.shape[1] > cur.shape[1]:
+        return None
+    if prev.shape != cur.shape:
+        padded = np.full(cur.shape, 255, dtype=np.int16)
+        padded[: prev.shape[0], : prev.shape[1]] = prev
+        prev = padded
+
+    changed = np.abs(cur - prev) > STEP_DIFF_THRESHOLD
+    rows = np.flatnonzero(changed.any(axis=1))
+    cols = np.flatnonzero(changed.any(axis=0))
+    if rows.size == 0:
+        return None
+
+    height, width = cur.shape
+    top = max(int(rows[0]) - STEP_CROP_PADDING_PX, 0)
+    bottom = min(int(rows[-1]) + 1 + STEP_CROP_PADDING_PX, height)
+    left = max(int(cols[0]) - STEP_CROP_PADDING_PX, 0)
+    right = min(int(cols[-1]) + 1 + STEP_CROP_PADDING_PX, width)
+    if (bottom - top) * (right - left) > STEP_MAX_CROP_FRACTION * height * width:
+        return None
+    return left, top, right, bottom
+
+
+def measure_quality(img: Image.Image) -> ImageQuality:
+    # One grey histogram gives ink share, brightness and contrast; edges are
+    # found on a halved copy of large images, which is enough to tell blur.
+    import numpy as np
+    from PIL import ImageFilter, ImageStat
+
+    grey = img.convert("L")
+    histogram = grey.histogram()
+    stat = ImageStat.Stat(histogram)
+    pixels = grey.width * grey.height
+    page = stat.median[0]
+    low, high = page - INK_MARGIN, page + INK_MARGIN
+    ink = sum(histogram[: max(low, 0)]) + sum(histogram[high + 1 :])
+    array = np.asarray(grey)
+    ink_rows = int(np.count_nonzero((array.min(axis=1) < low) | (array.max(axis=1) > high)))
+    small = grey.reduce(2) if max(grey.size) > _SHARPNESS_MAX_SIDE else grey
+    edges = ImageStat.Stat(small.filter(ImageFilter.FIND_EDGES)).mean[0]
+    contrast = stat.stddev[0]
+    return ImageQuality(
+        ink_fraction=ink / pixels,
+        ink_rows=ink_rows,
+        brightness=stat.mean[0],
+        contrast=contrast,
+        sharpness=edges / contrast if contrast else 0.0,
+    )
+
+
+def difference_hash(img: Image.Image) -> str:
+    """256-bit perceptual hash (dHash) as 64 hex digits.
+
+    Each bit says whether a cell of a 16x16 grey grid is brighter than its
+    right neighbour, so the hash survives rescaling, re-encoding and small
+    brightness changes, unlike sha256, but not cropping.
+    """
+    small = img.convert("L").resize((_DHASH_SIDE + 1, _DHASH_SIDE))
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(_DHASH_SIDE):
+        for col in range(_DHASH_SIDE):
+            i = row * (_DHASH_SIDE + 1) + col
+            bits = bits << 1 | (pixels[i] > pixels[i + 1])
+    return f"{bits:0{_DHASH_SIDE * _DHASH_SIDE // 4}x}"
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Differing bits between two difference_hash() values."""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def image_quality(data: bytes) -> ImageQuality:
+    """measure_quality() of an already normalized image."""
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as img:
+        return measure_quality(img)
+
+
+def crop_png(data: bytes, box: tuple[int, int, int, int]) -> bytes:
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as img:
+        out = BytesIO()
+        img.crop(box).save(out, format="PNG", optimize=True)
+    return out.getvalue()
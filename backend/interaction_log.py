@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+from uuid import UUID, uuid4
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.config import (
+    INTERACTION_LOG_ENABLED,
+    INTERACTION_LOG_FLUSH_MS,
+    INTERACTION_LOG_MAX_PENDING,
+)
+from backend.db import get_engine
+from backend.metrics import metrics
+from backend.repositories.interaction_repo import insert_interactions
+
+if TYPE_CHECKING:
+    from backend.images import ImageQuality
+    from backend.llm import LLMResponse
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT transaction when a backlog is flushed.
+FLUSH_BATCH_ROWS = 500
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class Interaction:
+    """One tutor call as logged: the Step and the Feedback it got."""
+
+    user_id: UUID
+    problem_id: UUID | None
+    mode: str
+    incremental: bool
+    regenerate: bool
+    sol_image_sha256: str
+    prob_image_sha256: str | None
+    sol_quality: ImageQuality | None = None
+    preflight: str | None = None
+    model: str | None = None
+    verdict: str | None = None
+    response_type: str | None = None
+    error: str | None = None
+    latency_ms: int | None = None
+    tokens_in: int = 0
+    tokens_out: int = 0
+    tokens_thoughts: int = 0
+    tokens_total: int = 0
+    created_at: datetime = field(default_factory=utcnow)
+
+    def with_result(self, result: tuple, parsed: LLMResponse | None) -> Interaction:
+        """Fill in the model call's stats (call_model_with_retry tuple) and verdict."""
+        self.model = result[5]
+        self.latency_ms = int(result[7] * 1000)
+        self.tokens_in = result[8] or 0
+        self.tokens_out = result[9] or 0
+        self.tokens_thoughts = result[10] or 0
+        self.tokens_total = result[11] or 0
+        if parsed is not None:
+            self.verdict = parsed.verdict
+            self.response_type = parsed.response_type
+        return self
+
+    def with_preflight(self, reason: str, parsed: LLMResponse) -> Interaction:
+        """Mark the call as answered by the pre-flight checks, with no model call."""
+        self.preflight = reason
+        self.verdict = parsed.verdict
+        self.response_type = parsed.response_type
+        self.latency_ms = 0
+        return self
+
+    def with_bank_hint(self, parsed: LLMResponse) -> Interaction:
+        """Mark the call as answered from the problem bank's hint ladder."""
+        self.model = "problem_bank"
+        self.verdict = parsed.verdict
+        self.response_type = parsed.response_type
+        self.latency_ms = 0
+        return self
+
+    def rows(self) -> tuple[dict[str, Any], dict[str, Any]]:
+        step_id = uuid4()
+        quality = self.sol_quality
+        step = {
+            "id": step_id,
+            "user_id": self.user_id,
+            "problem_id": self.problem_id,
+            "mode": self.mode,
+            "incremental": self.incremental,
+            "regenerate": self.regenerate,
+            "sol_image_sha256": self.sol_image_sha256,
+            "prob_image_sha256": self.prob_image_sha256,
+            "sol_ink_fraction": quality.ink_fraction if quality else None,
+            "sol_brightness": quality.brightness if quality else None,
+            "sol_contrast": quality.contrast if quality else None,
+            "sol_sharpness": quality.sharpness if quality else None,
+            "preflight": self.preflight,
+            "created_at": self.created_at,
+        }
+        feedback = {
+            "id": uuid4(),
+            "step_id": step_id,
+            "model": self.model,
+            "verdict": self.verdict,
+            "response_type": self.response_type,
+            "error": self.error,
+            "latency_ms": self.latency_ms,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_thoughts": self.tokens_thoughts,
+            "tokens_total": self.tokens_total,
+            "created_at": self.created_at,
+        }
+        return step, feedback
+
+
+class InteractionLogWriter:
+    """Batches interaction rows and writes them off the request path.
+
+    record() only appends to an in-memory buffer and may be called from the
+    event loop or any worker thread. A background task flushes the buffer
+    every flush_interval_s, as multi-row inserts in one transaction per
+    FLUSH_BATCH_ROWS. The buffer holds at most max_pending rows; beyond that
+    the oldest are dropped (counted in interaction_log_dropped) so a database
+    outage cannot grow memory without bound. A failed batch is dropped too.
+    """
+
+    def __init__(self, flush_interval_s: float, max_pending: int) -> None:
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: deque[Interaction] = deque()
+        self._task: asyncio.Task | None = None
+
+    def record(self, interaction: Interaction) -> None:
+        with self._lock:
+            self._pending.append(interaction)
+            if len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                metrics.incr("interaction_log_dropped")
+
+    def _take(self, limit: int) -> list[Interaction]:
+        with self._lock:
+            count = min(limit, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Blocking; returns rows written."""
+        written = 0
+        while True:
+            batch = self._take(FLUSH_BATCH_ROWS)
+            if not batch:
+                return written
+            steps, feedback = zip(*(interaction.rows() for interaction in batch))
+            try:
+                with Session(get_engine()) as session:
+                    insert_interactions(session, list(steps), list(feedback))
+            except Exception:
+                logger.exception("Writing %s interaction log rows failed; dropping them", len(batch))
+                metrics.incr("interaction_log_dropped", len(batch))
+                return written
+            written += len(batch)
+            metrics.incr("interaction_log_written", len(batch))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Whatever arrived since the last flush.
+        await run_in_threadpool(self.flush)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            if self._pending:
+                await run_in_threadpool(self.flush)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+interaction_log = (
+    InteractionLogWriter(INTERACTION_LOG_FLUSH_MS / 1000, INTERACTION_LOG_MAX_PENDING)
+    if INTERACTION_LOG_ENABLED
+    else None
+)
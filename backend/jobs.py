@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.config import JOB_DEADLINE_S, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL_S, JOB_STALE_S, JOB_WORKERS
+from backend.db import get_engine
+from backend.deadlines import Cancellation
+from backend.images import NORMALIZED_MIME, image_quality, normalize_image, sha256_hex
+from backend.interaction_log import Interaction, interaction_log
+from backend.llm import image_part
+from backend.metrics import metrics
+from backend.model_router import call_routed
+from backend.models.auth_models import User
+from backend.models.job_models import LLMJob
+from backend.preflight import clarification, preflight
+from backend.ratelimit import RateLimitExceeded, rate_limiter
+from backend.repositories.job_repo import claim_next_job, finish_job, requeue_stale_jobs
+from backend.repositories.problem_repo import record_solution
+from backend.scheduler import llm_scheduler, tenant_of
+from backend.tracing import span
+from backend.tutor import load_prompt, stored_problem_step
+
+logger = logging.getLogger(__name__)
+
+
+def _log(interaction: Interaction) -> None:
+    if interaction_log is not None:
+        interaction_log.record(interaction)
+
+
+def _llm_slot(session: Session, job: LLMJob, cancellation: Cancellation):
+    if llm_scheduler is None:
+        return contextlib.nullcontext()
+    user = session.get(User, job.user_id)
+    tenant = tenant_of(user) if user is not None else str(job.user_id)
+    return llm_scheduler.slot_sync(tenant, job.mode, job.regenerate, cancellation)
+
+
+def _run_job(session: Session, job: LLMJob, cancellation: Cancellation) -> str:
+    """The /query call for a job; returns the model's JSON."""
+    prompt = load_prompt()
+    step = None
+    if job.problem_id is not None:
+        solution = normalize_image(job.sol_image)
+        step = stored_problem_step(session, job.problem_id, job.user_id, solution, job.mode, job.incremental)
+        prob_part, sol_part = step.prob_part, step.sol_part
+        prob_quality, sol_quality = None, step.solution.quality
+    else:
+        prob_part = image_part(job.prob_image, NORMALIZED_MIME)
+        sol_part = image_part(job.sol_image, NORMALIZED_MIME)
+        prob_quality, sol_quality = image_quality(job.prob_image), image_quality(job.sol_image)
+
+    interaction = Interaction(
+        user_id=job.user_id,
+        problem_id=job.problem_id,
+        mode=job.mode,
+        incremental=job.incremental,
+        regenerate=job.regenerate,
+        sol_image_sha256=sha256_hex(job.sol_image),
+        prob_image_sha256=step.problem.image_sha256 if step else sha256_hex(job.prob_image),
+        sol_quality=sol_quality,
+    )
+    reason = preflight(job.mode, sol_quality, prob_quality)
+    if reason is not None:
+        parsed = clarification(reason)
+        _log(interaction.with_preflight(reason, parsed))
+        return parsed.model_dump_json()
+
+    # As in /query, only a model call takes from the rate limits; a job over
+    # them fails with the limit's reason.
+    if rate_limiter is not None:
+        rate_limiter.acquire(job.user_id, job.mode)
+
+    # The slot is taken on entering it; building it loads the user's tenant.
+    slot = _llm_slot(session, job, cancellation)
+    # End the transaction so no connection is held while the job waits for a
+    # slot and the model answers (the session keeps its objects loaded).
+    session.commit()
+
+    try:
+        with slot:
+            routed = call_routed(
+                prompt=prompt,
+                prob_image=prob_part,
+                sol_image=sol_part,
+                mode=job.mode,
+                sol_quality=sol_quality,
+                prior_verdict=step.problem.last_verdict if step else None,
+                regenerate=job.regenerate,
+                problem_cache_key=step.cache_key if step else None,
+                note=step.note if step else None,
+                cancellation=cancellation,
+            )
+    except Exception as exc:
+        interaction.error = str(exc)
+        _log(interaction)
+        raise
+
+    result, parsed = routed.result, routed.parsed
+    if rate_limiter is not None:
+        # Spent whether or not the answer turns out usable.
+        rate_limiter.record_tokens(job.user_id, result[11])
+    interaction.with_result(result, parsed).error = routed.error
+    _log(interaction)
+    if parsed is None:
+        raise ValueError(f"Model returned {routed.error}")
+
+    if step is not None:
+        record_solution(
+            session,
+            step.problem,
+            step.solution.data,
+            parsed.verdict,
+            parsed.response_type,
+            parsed.message_is,
+        )
+    return routed.body().decode()
+
+
+def claim_and_run_one() -> bool:
+    """Run the oldest queued job, if any. Returns False when the queue was empty."""
+    # expire_on_commit=False: the job's transaction is committed before the
+    # model call and its objects are read again after it.
+    with Session(get_engine(), expire_on_commit=False) as session:
+        job = claim_next_job(session)
+        if job is None:
+            return False
+        # Read now: a rollback after a failure expires the instance.
+        job_id, attempt = job.id, job.attempts
+        # Shorter than JOB_STALE_S, so the job is not re-queued while this
+        # run still holds it.
+        cancellation = Cancellation(JOB_DEADLINE_S)
+
+        logger.info("Running job %s (%s, regenerate=%s)", job_id, job.mode, job.regenerate)
+        try:
+            with span("job", mode=job.mode, regenerate=job.regenerate):
+                resp_text = _run_job(session, job, cancellation)
+        except RateLimitExceeded as exc:
+            logger.warning("Job %s is over the rate limits: %s", job_id, exc.reason)
+            session.rollback()
+            outcome, error, resp_text = "failed", exc.reason, None
+        except Exception as exc:
+            logger.exception("Job %s failed", job_id)
+            session.rollback()
+            outcome, error, resp_text = "failed", str(exc), None
+        else:
+            outcome, error = "succeeded", None
+
+        if finish_job(session, job_id, attempt, result=resp_text, error=error):
+            metrics.incr(f"jobs_{outcome}")
+        else:
+            logger.warning("Job %s attempt %s was superseded; its outcome is dropped", job_id, attempt)
+            metrics.incr("jobs_superseded")
+        return True
+
+
+def requeue_stale() -> int:
+    with Session(get_engine()) as session:
+        return requeue_stale_jobs(session, JOB_STALE_S, JOB_MAX_ATTEMPTS)
+
+
+class JobWorkerPool:
+    """Background workers that execute queued jobs from the jobs table.
+
+    Each worker is an asyncio task running one job at a time in the
+    threadpool. Workers sleep JOB_POLL_INTERVAL_S when the queue is empty;
+    notify() wakes them at once for jobs submitted to this process. Jobs from
+    other processes are picked up on the next poll, and jobs stranded in
+    "running" by a dead worker are re-queued after JOB_STALE_S.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS) -> None:
+        self.workers = workers
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            try:
+                ran = await run_in_threadpool(claim_and_run_one)
+            except Exception:
+                logger.exception("Job worker %s failed to claim a job", index)
+                ran = False
+            if ran:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=JOB_POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reaper(self) -> None:
+        while True:
+            try:
+                requeued = await run_in_threadpool(requeue_stale)
+                if requeued:
+                    logger.warning("Re-queued %s stale job(s)", requeued)
+                    self.notify()
+            except Exception:
+                logger.exception("Re-queueing stale jobs failed")
+            await asyncio.sleep(max(JOB_STALE_S / 4, 1.0))
+
+
+job_workers = JobWorkerPool()
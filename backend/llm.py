@@ -1,22 +1,42 @@
 from __future__ import annotations
 
+import hashlib
 import logging
 import os
+import threading
 import time
-from datetime import datetime
-from pathlib import Path
-from typing import Any
-
-from dotenv import load_dotenv
-from google import genai
-from google.genai.errors import ServerError
-from langfuse import Langfuse
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import TYPE_CHECKING, Any
+
 from pydantic import BaseModel
 
-load_dotenv(Path(__file__).resolve().parent / ".env")
+from backend.config import (
+    GEMINI_BASE_URL,
+    GEMINI_CACHE_MAX_ENTRIES,
+    GEMINI_CACHE_TTL_S,
+    GEMINI_CONTEXT_CACHE,
+    LLM_WARMUP_PING,
+)
+from backend.deadlines import CallCancelled
+from backend.llm_cache import ContextCacheManager
+from backend.tracing import get_tracer_provider, keep_trace, prompt_ref
+
+if TYPE_CHECKING:
+    from google import genai
+
+    from backend.deadlines import Cancellation
+    from google.genai import types
+    from langfuse import Langfuse
 
 logger = logging.getLogger(__name__)
 
+FLASH_MODEL = "models/gemini-3-flash-preview"
+PRO_MODEL = "gemini-3-pro-preview"
+
+# Files API uploads are kept for 48 hours; used when the response omits it.
+GEMINI_FILE_TTL = timedelta(hours=48)
+
 
 class LLMResponse(BaseModel):
     verdict: str
@@ -40,9 +60,15 @@ def _build_langfuse_client() -> Langfuse | None:
     host = os.getenv("LANGFUSE_HOST") or os.getenv("LANGFUSE_BASE_URL")
 
     try:
+        # Imported here: langfuse pulls in OpenTelemetry, which is slow to import.
+        from langfuse import Langfuse
+
+        # Langfuse's spans go through backend.tracing's provider, so they join
+        # the request's trace and its sampling.
+        options: dict[str, Any] = {"tracer_provider": get_tracer_provider()}
         if host:
-            return Langfuse(public_key=public_key, secret_key=secret_key, host=host)
-        return Langfuse(public_key=public_key, secret_key=secret_key)
+            options["host"] = host
+        return Langfuse(public_key=public_key, secret_key=secret_key, **options)
     except Exception:
         logger.exception("Langfuse initialization failed")
         return None
@@ -52,11 +78,143 @@ def _build_genai_client() -> genai.Client:
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError("GEMINI_API_KEY is not set")
+
+    from google import genai
+
+    # Point the SDK at another endpoint, e.g. the local stand-in used by
+    # backend/perf/loadtest.py.
+    if GEMINI_BASE_URL:
+        return genai.Client(api_key=api_key, http_options={"base_url": GEMINI_BASE_URL})
     return genai.Client(api_key=api_key)
 
 
-langfuse = _build_langfuse_client()
-client = _build_genai_client()
+# Clients are built on first use (or by warm_up_llm from the app lifespan),
+# not at import, so importing backend.main stays cheap.
+_UNSET: Any = object()
+_langfuse: Langfuse | None = _UNSET
+_client: genai.Client | None = None
+_clients_lock = threading.Lock()
+
+context_caches = ContextCacheManager(ttl_s=GEMINI_CACHE_TTL_S, max_entries=GEMINI_CACHE_MAX_ENTRIES)
+
+
+def get_langfuse() -> Langfuse | None:
+    global _langfuse
+    if _langfuse is _UNSET:
+        with _clients_lock:
+            if _langfuse is _UNSET:
+                _langfuse = _build_langfuse_client()
+    return _langfuse
+
+
+def get_client() -> genai.Client:
+    global _client
+    if _client is None:
+        with _clients_lock:
+            if _client is None:
+                _client = _build_genai_client()
+    return _client
+
+
+def warm_up_llm() -> None:
+    """Build the Gemini and Langfuse clients and optionally open a connection.
+
+    The ping (a models.get for the default model) pays the DNS/TLS handshake
+    before the first student request does. A failed ping is only logged.
+    """
+    client = get_client()
+    get_tracer_provider()
+    get_langfuse()
+    if not LLM_WARMUP_PING:
+        return
+    try:
+        client.models.get(model=FLASH_MODEL)
+    except Exception:
+        logger.warning("Gemini warm-up ping failed", exc_info=True)
+
+
+def close_llm_clients() -> None:
+    global _langfuse, _client
+    context_caches.clear(_client)
+    with _clients_lock:
+        if _langfuse is not _UNSET and _langfuse is not None:
+            try:
+                _langfuse.shutdown()
+            except Exception:
+                logger.exception("Failed to shut down Langfuse client")
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception:
+                logger.exception("Failed to close Gemini client")
+        _langfuse = _UNSET
+        _client = None
+
+
+def upload_image(data: bytes, mime_type: str) -> tuple[str, str, datetime]:
+    """Upload image bytes to the Gemini Files API.
+
+    Returns (file name, file URI, expiry) so callers can reference the image
+    in later requests instead of sending the bytes again.
+    """
+    file = get_client().files.upload(file=BytesIO(data), config={"mime_type": mime_type})
+    expires_at = file.expiration_time or datetime.now(timezone.utc) + GEMINI_FILE_TTL
+    return file.name, file.uri, expires_at
+
+
+def file_part(uri: str, mime_type: str) -> types.Part:
+    from google.genai import types
+
+    return types.Part.from_uri(file_uri=uri, mime_type=mime_type)
+
+
+def image_part(data: bytes, mime_type: str) -> types.Part:
+    """Inline image Part from already-encoded bytes (no re-encode by the SDK)."""
+    from google.genai import types
+
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
+
+
+def problem_cache_key(problem_id: Any, file_name: str) -> str:
+    # The file name is part of the key: a re-uploaded image gets a new cache.
+    return f"problem:{problem_id}:{file_name}"
+
+
+def evict_problem_caches(problem_id: Any) -> None:
+    if _client is not None:
+        context_caches.evict_prefix(_client, f"problem:{problem_id}:")
+
+
+def _prompt_cache_key(prompt: str) -> str:
+    return "prompt:" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _cached_contents(
+    client: genai.Client,
+    model: str,
+    prompt: str,
+    mode: str,
+    prob_image: Any,
+    sol_image: Any,
+    problem_cache_key: str | None,
+    note: str | None = None,
+) -> tuple[list[Any], str | None]:
+    """Request contents and cache name, caching as much of the prefix as possible.
+
+    With a stored problem the prompt and problem image are cached together and
+    only the mode and solution image are sent; otherwise only the prompt is.
+    """
+    turn = [note, mode] if note else [mode]
+    if not GEMINI_CONTEXT_CACHE:
+        return [prompt, *turn, prob_image, sol_image], None
+    if problem_cache_key is not None:
+        name = context_caches.get_or_create(client, model, problem_cache_key, prompt, [prob_image])
+        if name is not None:
+            return [*turn, sol_image], name
+    name = context_caches.get_or_create(client, model, _prompt_cache_key(prompt), prompt)
+    if name is not None:
+        return [*turn, prob_image, sol_image], name
+    return [prompt, *turn, prob_image, sol_image], None
 
 
 def _trace_event(trace: Any, name: str, metadata: dict[str, Any]) -> None:
@@ -67,22 +225,31 @@ def _trace_event(trace: Any, name: str, metadata: dict[str, Any]) -> None:
             trace.event(name=name, metadata=metadata)
         elif hasattr(trace, "create_event"):
             trace.create_event(name=name, metadata=metadata)
-        elif hasattr(langfuse, "create_event"):
-            langfuse.create_event(name=name, metadata=metadata)
+        elif hasattr(get_langfuse(), "create_event"):
+            get_langfuse().create_event(name=name, metadata=metadata)
         else:
             logger.warning("No compatible Langfuse event API found")
     except Exception:
         logger.exception("Failed to send Langfuse trace event")
 
 
+def _end_trace(trace: Any) -> None:
+    if trace is not None and hasattr(trace, "end"):
+        try:
+            trace.end()
+        except Exception:
+            logger.exception("Failed to end Langfuse trace/span")
+
+
 def _start_trace(prompt: str, mode: str) -> Any:
+    langfuse = get_langfuse()
     if langfuse is None:
         return None
     try:
         if hasattr(langfuse, "trace"):
-            return langfuse.trace(name="gemini-call", input={"prompt": prompt, "mode": mode})
+            return langfuse.trace(name="gemini-call", input={"prompt": prompt_ref(prompt), "mode": mode})
         if hasattr(langfuse, "start_span"):
-            return langfuse.start_span(name="gemini-call", input={"prompt": prompt, "mode": mode})
+            return langfuse.start_span(name="gemini-call", input={"prompt": prompt_ref(prompt), "mode": mode})
         logger.warning("No compatible Langfuse trace/span API found")
         return None
     except Exception:
@@ -102,6 +269,7 @@ def _trace_generation(
     tokens_out: int,
     tokens_total: int,
     tokens_thoughts: int,
+    tokens_cached: int = 0,
 ) -> None:
     if trace is None:
         return
@@ -111,7 +279,7 @@ def _trace_generation(
             trace.generation(
                 name="gemini-generation",
                 model=model,
-                input=prompt,
+                input=prompt_ref(prompt),
                 output=output,
                 usage={
                     "prompt_tokens": tokens_in,
@@ -122,6 +290,7 @@ def _trace_generation(
                     "mode": mode,
                     "latency": latency,
                     "thought_tokens": tokens_thoughts,
+                    "cached_tokens": tokens_cached,
                 },
             )
             return
@@ -130,7 +299,7 @@ def _trace_generation(
             generation = trace.start_generation(
                 name="gemini-generation",
                 model=model,
-                input=prompt,
+                input=prompt_ref(prompt),
                 output=output,
                 usage_details={
                     "input": tokens_in,
@@ -141,6 +310,7 @@ def _trace_generation(
                     "mode": mode,
                     "latency": latency,
                     "thought_tokens": tokens_thoughts,
+                    "cached_tokens": tokens_cached,
                 },
             )
             if hasattr(generation, "end"):
@@ -152,6 +322,23 @@ def _trace_generation(
         logger.exception("Failed to send Langfuse generation")
 
 
+def _deadline_http_options(cancellation: Cancellation) -> dict[str, int]:
+    # HttpOptions.timeout is in milliseconds.
+    return {"timeout": max(int(cancellation.remaining() * 1000), 1)}
+
+
+def _is_timeout(exc: Exception) -> bool:
+    import httpx
+
+    return isinstance(exc, httpx.TimeoutException)
+
+
+def _cancelled(trace: Any, cancelled: CallCancelled) -> None:
+    logger.info("Gemini call %s", cancelled)
+    _trace_event(trace, name="cancelled", metadata={"reason": cancelled.reason})
+    _end_trace(trace)
+
+
 def call_model_with_retry(
     prompt: str,
     prob_image: Any,
@@ -159,37 +346,62 @@ def call_model_with_retry(
     mode: str,
     max_retries: int = 5,
     regenerate: bool = False,
+    problem_cache_key: str | None = None,
+    note: str | None = None,
+    model: str | None = None,
+    cancellation: Cancellation | None = None,
 ):
     """Call Gemini with retries and optional Langfuse tracing.
 
+    problem_cache_key (see problem_cache_key()) marks prob_image as a stored
+    problem whose prompt+image prefix can be served from a context cache.
+    note is extra text sent ahead of the mode, e.g. the incremental-step
+    context from /query. model overrides the flash/pro choice made from
+    regenerate (see backend.model_router).
+
+    cancellation (backend.deadlines) is checked before every attempt and
+    wakes retry backoff; its deadline is also each request's HTTP timeout.
+    A call stopped by it raises CallCancelled.
+
     Returns the same tuple shape as before for compatibility.
     """
     if max_retries < 1:
         raise ValueError("max_retries must be >= 1")
 
+    from google.genai.errors import ClientError, ServerError
+
+    client = get_client()
+
     t0 = time.time()
     trace = None
 
     trace = _start_trace(prompt=prompt, mode=mode)
 
-    model = "gemini-3-pro-preview" if regenerate else "models/gemini-3-flash-preview"
+    if model is None:
+        model = PRO_MODEL if regenerate else FLASH_MODEL
+    contents, cache_name = _cached_contents(
+        client, model, prompt, mode, prob_image, sol_image, problem_cache_key, note
+    )
 
     for attempt in range(max_retries):
         try:
-            resp = client.models.generate_content(
-                model=model,
-                contents=[prompt, mode, prob_image, sol_image],
-                config={
-                    "response_mime_type": "application/json",
-                    "response_json_schema": LLMResponse.model_json_schema(),
-                },
-            )
+            config = {
+                "response_mime_type": "application/json",
+                "response_json_schema": LLMResponse.model_json_schema(),
+            }
+            if cache_name is not None:
+                config["cached_content"] = cache_name
+            if cancellation is not None:
+                cancellation.check()
+                config["http_options"] = _deadline_http_options(cancellation)
+            resp = client.models.generate_content(model=model, contents=contents, config=config)
 
             usage = getattr(resp, "usage_metadata", None)
             tokens_in = getattr(usage, "prompt_token_count", 0)
             tokens_out = getattr(usage, "candidates_token_count", 0)
             tokens_total = getattr(usage, "total_token_count", 0)
             tokens_thoughts = getattr(usage, "thoughts_token_count", 0)
+            tokens_cached = getattr(usage, "cached_content_token_count", 0) or 0
             latency = time.time() - t0
 
             _trace_generation(
@@ -203,15 +415,9 @@ def call_model_with_retry(
                 tokens_out=tokens_out,
                 tokens_total=tokens_total,
                 tokens_thoughts=tokens_thoughts,
+                tokens_cached=tokens_cached,
             )
-            if langfuse is not None and hasattr(langfuse, "flush"):
-                # Useful during local debugging and short-lived runs.
-                langfuse.flush()
-            if trace is not None and hasattr(trace, "end"):
-                try:
-                    trace.end()
-                except Exception:
-                    logger.exception("Failed to end Langfuse trace/span")
+            _end_trace(trace)
 
             return (
                 resp.text,
@@ -238,13 +444,10 @@ def call_model_with_retry(
 
             if is_last_attempt:
                 logger.exception("Gemini server error after %s attempts", max_retries)
-                if trace is not None and hasattr(trace, "end"):
-                    try:
-                        trace.end()
-                    except Exception:
-                        logger.exception("Failed to end Langfuse trace/span")
+                _end_trace(trace)
                 raise
 
+            keep_trace("retry")
             wait_seconds = 2**attempt
             logger.warning(
                 "Gemini server error on attempt %s/%s. Retrying in %ss",
@@ -252,17 +455,134 @@ def call_model_with_retry(
                 max_retries,
                 wait_seconds,
             )
-            time.sleep(wait_seconds)
+            if cancellation is None:
+                time.sleep(wait_seconds)
+                continue
+            try:
+                cancellation.sleep(wait_seconds)
+            except CallCancelled as cancelled:
+                _cancelled(trace, cancelled)
+                raise
+
+        except ClientError as exc:
+            if cache_name is None or exc.code not in (403, 404):
+                _trace_event(trace, name="unexpected_error", metadata={"error": str(exc)})
+                logger.exception("Gemini request failed with non-retryable error")
+                _end_trace(trace)
+                raise
+            # The cache expired or was deleted elsewhere; resend uncached.
+            logger.warning("Gemini context cache %s unavailable; sending uncached", cache_name)
+            context_caches.invalidate(cache_name)
+            contents = [prompt, *([note] if note else []), mode, prob_image, sol_image]
+            cache_name = None
+
+        except CallCancelled as cancelled:
+            _cancelled(trace, cancelled)
+            raise
 
         except Exception as exc:
+            if cancellation is not None and _is_timeout(exc):
+                # The HTTP timeout set from the deadline fired.
+                cancellation.cancel("deadline")
+                _cancelled(trace, CallCancelled("deadline"))
+                raise CallCancelled("deadline") from exc
             _trace_event(trace, name="unexpected_error", metadata={"error": str(exc)})
             logger.exception("Gemini request failed with non-retryable error")
-            if trace is not None and hasattr(trace, "end"):
-                try:
-                    trace.end()
-                except Exception:
-                    logger.exception("Failed to end Langfuse trace/span")
+            _end_trace(trace)
             raise
 
     # This point should be unreachable because we either return or raise.
     raise RuntimeError("Gemini request failed unexpectedly")
+
+
+CONTINUATION_INSTRUCTION = (
+    "Your previous answer was cut off before it was complete. Its verdict was {verdict!r} and its "
+    "response_type {response_type!r}. The message so far:\n\n{message}\n\n"
+    "Answer again with the same verdict and response_type and the complete message_is, keeping "
+    "the text above and finishing it."
+)
+
+
+def call_continuation(
+    prompt: str,
+    mode: str,
+    verdict: str,
+    response_type: str,
+    message: str,
+    model: str,
+    cancellation: Cancellation | None = None,
+):
+    """Finish a cut-off answer with a text-only call.
+
+    The verdict (the part that needs the images) is already known, so only
+    the tutor prompt, served from its context cache when there is one, and
+    the partial message are sent. One attempt; errors are raised to the
+    caller, which falls back to a full call. cancellation works as in
+    call_model_with_retry. Returns the call_model_with_retry tuple, with no
+    images.
+    """
+    if cancellation is not None:
+        cancellation.check()
+    client = get_client()
+    t0 = time.time()
+    trace = _start_trace(prompt=prompt, mode=mode)
+    instruction = CONTINUATION_INSTRUCTION.format(verdict=verdict, response_type=response_type, message=message)
+    config: dict[str, Any] = {
+        "response_mime_type": "application/json",
+        "response_json_schema": LLMResponse.model_json_schema(),
+    }
+    contents: list[Any] = [prompt, mode, instruction]
+    if GEMINI_CONTEXT_CACHE:
+        cache_name = context_caches.get_or_create(client, model, _prompt_cache_key(prompt), prompt)
+        if cache_name is not None:
+            config["cached_content"] = cache_name
+            contents = [mode, instruction]
+    if cancellation is not None:
+        config["http_options"] = _deadline_http_options(cancellation)
+    try:
+        resp = client.models.generate_content(model=model, contents=contents, config=config)
+    except Exception as exc:
+        if _is_timeout(exc) and cancellation is not None:
+            cancellation.cancel("deadline")
+            _cancelled(trace, CallCancelled("deadline"))
+            raise CallCancelled("deadline") from exc
+        _trace_event(trace, name="continuation_error", metadata={"error": str(exc)})
+        _end_trace(trace)
+        if "cached_content" in config:
+            context_caches.invalidate(config["cached_content"])
+        raise
+
+    usage = getattr(resp, "usage_metadata", None)
+    tokens_in = getattr(usage, "prompt_token_count", 0)
+    tokens_out = getattr(usage, "candidates_token_count", 0)
+    tokens_total = getattr(usage, "total_token_count", 0)
+    tokens_thoughts = getattr(usage, "thoughts_token_count", 0)
+    latency = time.time() - t0
+    _trace_generation(
+        trace,
+        model=model,
+        prompt=instruction,
+        output=resp.text,
+        mode=mode,
+        latency=latency,
+        tokens_in=tokens_in,
+        tokens_out=tokens_out,
+        tokens_total=tokens_total,
+        tokens_thoughts=tokens_thoughts,
+        tokens_cached=getattr(usage, "cached_content_token_count", 0) or 0,
+    )
+    _end_trace(trace)
+    return (
+        resp.text,
+        prompt,
+        None,
+        None,
+        mode,
+        model,
+        datetime.now(),
+        latency,
+        tokens_in,
+        tokens_out,
+        tokens_thoughts,
+        tokens_total,
+    )
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+
+from backend.metrics import metrics
+
+if TYPE_CHECKING:
+    from google import genai
+
+logger = logging.getLogger(__name__)
+
+# An entry this close to its expiry is treated as gone: a request that starts
+# now could reach Gemini after the cache has been dropped server-side.
+EXPIRY_SAFETY_S = 30.0
+
+# After a failed create (e.g. content below the model's minimum cacheable
+# size), skip that key for this long instead of retrying on every request.
+CREATE_FAILURE_BACKOFF_S = 600.0
+
+
+@dataclass
+class CacheEntry:
+    name: str
+    model: str
+    expires_at: float  # time.monotonic() deadline
+
+
+class ContextCacheManager:
+    """Explicit Gemini context caches for the static prompt and problem images.
+
+    Entries are keyed by (model, key) since a cache is bound to one model.
+    - get_or_create() returns a cache name, creating the cache on first use
+      and extending its TTL once less than half of it remains, so caches of
+      active sessions stay alive and idle ones expire on their own.
+    - At most max_entries caches are kept; the least recently used is deleted.
+    - evict_prefix() deletes caches of a problem the student has moved on from.
+    Failures never propagate: callers get None and send the content uncached.
+    """
+
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        self._key_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._failed_until: dict[tuple[str, str], float] = {}
+
+    def _ttl(self) -> str:
+        return f"{int(self.ttl_s)}s"
+
+    def _deadline(self, expire_time: datetime | None) -> float:
+        if expire_time is None:
+            return time.monotonic() + self.ttl_s
+        remaining = (expire_time - datetime.now(timezone.utc)).total_seconds()
+        return time.monotonic() + min(remaining, self.ttl_s)
+
+    def get_or_create(
+        self,
+        client: genai.Client,
+        model: str,
+        key: str,
+        system_instruction: str,
+        contents: list[Any] | None = None,
+    ) -> str | None:
+        cache_key = (model, key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+
+        # One create/refresh per key at a time; concurrent callers for the
+        # same problem wait and then reuse the result.
+        with key_lock:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(cache_key)
+                if entry is not None:
+                    self._entries.move_to_end(cache_key)
+                if self._failed_until.get(cache_key, 0.0) > now:
+                    return None
+
+            if entry is not None and entry.expires_at - EXPIRY_SAFETY_S > now:
+                metrics.incr("llm_cache_hit")
+                if entry.expires_at - now < self.ttl_s / 2:
+                    self._refresh(client, cache_key, entry)
+                return entry.name
+
+            if entry is not None:
+                self._drop(cache_key)
+            return self._create(client, cache_key, system_instruction, contents)
+
+    def _create(
+        self,
+        client: genai.Client,
+        cache_key: tuple[str, str],
+        system_instruction: str,
+        contents: list[Any] | None,
+    ) -> str | None:
+        model, key = cache_key
+        config: dict[str, Any] = {
+            "system_instruction": system_instruction,
+            "ttl": self._ttl(),
+            "display_name": key[:128],
+        }
+        if contents:
+            config["contents"] = contents
+        try:
+            cached = client.caches.create(model=model, config=config)
+        except Exception as exc:
+            logger.warning("Creating Gemini context cache %s failed: %s", key, exc)
+            metrics.incr("llm_cache_create_failed")
+            with self._lock:
+                self._failed_until[cache_key] = time.monotonic() + CREATE_FAILURE_BACKOFF_S
+            return None
+
+        metrics.incr("llm_cache_create")
+        evicted = []
+        with self._lock:
+            self._entries[cache_key] = CacheEntry(
+                name=cached.name, model=model, expires_at=self._deadline(cached.expire_time)
+            )
+            while len(self._entries) > self.max_entries:
+                old_key, old = self._entries.popitem(last=False)
+                self._key_locks.pop(old_key, None)
+                evicted.append(old)
+        for old in evicted:
+            metrics.incr("llm_cache_evict")
+            self._delete_remote(client, old.name)
+        return cached.name
+
+    def _refresh(self, client: genai.Client, cache_key: tuple[str, str], entry: CacheEntry) -> None:
+        try:
+            updated = client.caches.update(name=entry.name, config={"ttl": self._ttl()})
+        except Exception:
+            # The current deadline still holds; try again on the next use.
+            logger.warning("Extending Gemini context cache %s failed", entry.name, exc_info=True)
+            return
+        metrics.incr("llm_cache_refresh")
+        with self._lock:
+            entry.expires_at = self._deadline(updated.expire_time)
+
+    def _drop(self, cache_key: tuple[str, str]) -> None:
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def _delete_remote(self, client: genai.Client, name: str) -> None:
+        try:
+            client.caches.delete(name=name)
+        except Exception:
+            logger.info("Deleting Gemini context cache %s failed", name, exc_info=True)
+
+    def invalidate(self, name: str) -> None:
+        """Forget a cache Gemini no longer knows (e.g. expired server-side)."""
+        with self._lock:
+            for cache_key, entry in list(self._entries.items()):
+                if entry.name == name:
+                    del self._entries[cache_key]
+
+    def evict_prefix(self, client: genai.Client, prefix: str) -> int:
+        with self._lock:
+            doomed = [k for k in self._entries if k[1].startswith(prefix)]
+            entries = [self._entries.pop(k) for k in doomed]
+            for k in doomed:
+                self._key_locks.pop(k, None)
+        for entry in entries:
+            metrics.incr("llm_cache_evict")
+            self._delete_remote(client, entry.name)
+        return len(entries)
+
+    def clear(self, client: genai.Client | None) -> None:
+        """Delete every cache this process created (shutdown)."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._failed_until.clear()
+        if client is None:
+            return
+        for entry in entries:
+            self._delete_remote(client, entry.name)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -1,10 +1,95 @@
+import asyncio
+import contextlib
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
+from backend.config import (
+    JOB_DEADLINE_S,
+    JOB_STALE_S,
+    METRICS_ENABLED,
+    PROFILING_ENABLED,
+    PROFILING_TOKEN,
+    WARMUP_RETRY_MAX_S,
+)
+from backend.db import dispose_engine, warm_up_db
+from backend.interaction_log import interaction_log
+from backend.jobs import job_workers
+from backend.llm import close_llm_clients, warm_up_llm
+from backend.metrics import monitor_event_loop
 from backend.routes.auth import router as auth_router
+from backend.routes.jobs import router as jobs_router
+from backend.routes.problems import router as problems_router
 from backend.routes.query import router as query_router
+from backend.shadow import shadow
+from backend.tracing import TracingMiddleware
+from backend.uploads import BodySizeLimitMiddleware
+
+logger = logging.getLogger(__name__)
+
+if PROFILING_ENABLED and not PROFILING_TOKEN:
+    raise ValueError("PROFILING_ENABLED requires PROFILING_TOKEN")
+if JOB_DEADLINE_S >= JOB_STALE_S:
+    raise ValueError("JOB_DEADLINE_S must be shorter than JOB_STALE_S")
+
+
+async def _warm_up(app: FastAPI) -> None:
+    """Build DB/LLM clients off the event loop, retrying until both succeed.
+
+    Runs in the background so /health answers immediately; /ready flips to
+    200 only after this finishes.
+    """
+    delay = 0.5
+    while True:
+        try:
+            await asyncio.gather(run_in_threadpool(warm_up_db), run_in_threadpool(warm_up_llm))
+            app.state.ready = True
+            logger.info("Warm-up complete; ready to serve")
+            return
+        except Exception:
+            logger.exception("Warm-up failed; retrying in %.1fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_S)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    background = [asyncio.create_task(_warm_up(app))]
+    if METRICS_ENABLED:
+        background.append(asyncio.create_task(monitor_event_loop()))
+    if PROFILING_ENABLED:
+        from backend.profiling import loop_watchdog, start_tracemalloc
 
-app = FastAPI()
+        start_tracemalloc()
+        loop_watchdog.start()
+    job_workers.start()
+    if interaction_log is not None:
+        interaction_log.start()
+    if shadow is not None:
+        shadow.start()
+    yield
+    await job_workers.stop()
+    if PROFILING_ENABLED:
+        await loop_watchdog.stop()
+    if shadow is not None:
+        await shadow.stop()
+    if interaction_log is not None:
+        await interaction_log.stop()
+    for task in background:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await run_in_threadpool(close_llm_clients)
+    await run_in_threadpool(dispose_engine)
+
+
+# orjson for every route's JSON; /query sends the model's validated JSON as is.
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,10 +98,36 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(BodySizeLimitMiddleware)
+if PROFILING_ENABLED:
+    from backend.profiling import ProfilingMiddleware
+
+    app.add_middleware(ProfilingMiddleware)
+# Outermost, so the root span covers everything else.
+app.add_middleware(TracingMiddleware)
 
 app.include_router(auth_router)
+app.include_router(problems_router)
 app.include_router(query_router)
+app.include_router(jobs_router)
+
+if METRICS_ENABLED:
+    from backend.routes.metrics import router as metrics_router
+
+    app.include_router(metrics_router)
+
+if PROFILING_ENABLED:
+    from backend.routes.debug import router as debug_router
+
+    app.include_router(debug_router)
 
 @app.get("/health")
 def health():
     return {"ok": True}
+
+
+@app.get("/ready")
+def ready():
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+from typing import Any
+
+from backend.config import LOOP_LAG_INTERVAL_S
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per histogram; percentiles are computed over this window.
+HISTOGRAM_WINDOW = 4096
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class Metrics:
+    """Small in-process registry of counters, gauges and windowed histograms.
+
+    Recording is a dict update under a lock, cheap enough to call on every
+    request. snapshot() is what the /metrics route and the load-test harness
+    read.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._gauge_max: dict[str, float] = {}
+        self._histograms: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=HISTOGRAM_WINDOW)
+        )
+        self._histogram_max: dict[str, float] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+            if value > self._gauge_max.get(name, float("-inf")):
+                self._gauge_max[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self._histograms[name].append(value)
+            if value > self._histogram_max.get(name, float("-inf")):
+                self._histogram_max[name] = value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._gauge_max.clear()
+            self._histograms.clear()
+            self._histogram_max.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = {
+                name: {"value": value, "max": self._gauge_max[name]}
+                for name, value in self._gauges.items()
+            }
+            histograms = {}
+            for name, window in self._histograms.items():
+                values = sorted(window)
+                histograms[name] = {
+                    "count": len(values),
+                    "p50": _percentile(values, 50),
+                    "p95": _percentile(values, 95),
+                    "p99": _percentile(values, 99),
+                    "max": self._histogram_max.get(name, 0.0),
+                }
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+metrics = Metrics()
+
+
+def record_pool_stats() -> None:
+    """Sample DB pool and worker-thread saturation into gauges."""
+    from backend.db import engine_if_created
+
+    engine = engine_if_created()
+    pool = engine.pool if engine is not None else None
+    if pool is not None and hasattr(pool, "checkedout"):
+        metrics.set_gauge("db_pool_checked_out", pool.checkedout())
+        metrics.set_gauge("db_pool_size", pool.size())
+        metrics.set_gauge("db_pool_overflow", pool.overflow())
+
+    try:
+        import anyio.to_thread
+
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        metrics.set_gauge("threadpool_borrowed", limiter.borrowed_tokens)
+        metrics.set_gauge("threadpool_total", limiter.total_tokens)
+    except Exception:
+        # Only available from inside a running event loop.
+        pass
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL_S) -> None:
+    """Measure how late the loop wakes up from a fixed sleep.
+
+    Any lag beyond the sleep interval is time some callback held the loop.
+    Also samples pool/thread saturation on every tick.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - start - interval
+        metrics.observe("event_loop_lag_s", max(0.0, lag))
+        try:
+            record_pool_stats()
+        except Exception:
+            logger.exception("Failed to sample pool stats")
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from backend.config import (
+    MODEL_ROUTING,
+    ROUTER_DENSE_INK,
+    ROUTER_ESCALATE,
+    ROUTER_LONG_WORK_ROWS,
+    ROUTER_PRO_SCORE,
+)
+from backend.deadlines import CallCancelled
+from backend.images import ImageQuality
+from backend.llm import (
+    FLASH_MODEL,
+    PRO_MODEL,
+    LLMResponse,
+    call_continuation,
+    call_model_with_retry,
+)
+from backend.metrics import metrics
+from backend.output_guard import GuardResult, check, default_response_type
+from backend.structured_output import ParsedOutput, parse_response
+from backend.tracing import keep_trace
+
+if TYPE_CHECKING:
+    from backend.deadlines import Cancellation
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RouteFeatures:
+    mode: str
+    ink_fraction: float
+    ink_rows: int
+    prior_verdict: str | None
+
+
+@dataclass
+class RoutedCall:
+    """Outcome of call_routed().
+
+    result is the call_model_with_retry tuple of the answer kept, with
+    latency and token counts summed over every call made for it. parsed is
+    the answer after JSON repair and the output guard's repairs; it is None
+    (and error set) when even the last answer failed validation.
+    """
+
+    result: tuple
+    parsed: LLMResponse | None
+    error: str | None
+    escalated_from: str | None = None
+    repaired: bool = False
+
+    def body(self) -> bytes:
+        """The JSON to return: the model's own text unless it had to be repaired."""
+        if self.repaired and self.parsed is not None:
+            return self.parsed.model_dump_json().encode()
+        return self.result[0].encode()
+
+
+def route_features(mode: str, sol_quality: ImageQuality, prior_verdict: str | None) -> RouteFeatures:
+    return RouteFeatures(
+        mode=mode,
+        ink_fraction=sol_quality.ink_fraction,
+        ink_rows=sol_quality.ink_rows,
+        prior_verdict=prior_verdict,
+    )
+
+
+def difficulty_score(features: RouteFeatures) -> int:
+    """One point per sign that flash is likely to struggle."""
+    score = 0
+    if features.ink_fraction >= ROUTER_DENSE_INK:
+        score += 1
+    if features.ink_rows >= ROUTER_LONG_WORK_ROWS:
+        score += 1
+    if features.prior_verdict in ("incorrect", "unclear"):
+        score += 1
+    if features.mode == "reveal":
+        score += 1
+    return score
+
+
+def choose_model(features: RouteFeatures, regenerate: bool) -> str:
+    if regenerate:
+        return PRO_MODEL
+    if not MODEL_ROUTING:
+        return FLASH_MODEL
+    return PRO_MODEL if difficulty_score(features) >= ROUTER_PRO_SCORE else FLASH_MODEL
+
+
+@dataclass
+class _Checked:
+    parsed: LLMResponse | None
+    guard: GuardResult | None
+    reason: str | None  # why another call could do better
+    output: ParsedOutput
+
+    @property
+    def usable(self) -> bool:
+        return self.parsed is not None and (self.guard is None or self.guard.usable)
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.output.repairs) or (self.guard is not None and self.guard.repaired)
+
+
+def _validate(mode: str, text: str) -> _Checked:
+    output = parse_response(text)
+    parsed = output.response
+    if parsed is None and output.missing == ("response_type",) and output.cut_field is None:
+        # The guard sets it from (mode, verdict).
+        parsed = LLMResponse(response_type="", **output.fields)
+    if parsed is None:
+        return _Checked(None, None, f"invalid JSON ({', '.join(output.repairs)})", output)
+    if output.repairs:
+        metrics.incr("json_repaired")
+    guard = check(mode, parsed)
+    if guard.violation is not None:
+        return _Checked(guard.response, guard, guard.violation, output)
+    if guard.response.verdict == "unclear":
+        return _Checked(guard.response, guard, "unclear", output)
+    return _Checked(guard.response, guard, None, output)
+
+
+def _routed(result: tuple, checked: _Checked, escalated_from: str | None = None) -> RoutedCall:
+    usable = checked.usable
+    if usable and checked.guard is not None and checked.guard.violation is not None:
+        # Flagged (e.g. a possible leak) and not fixed by a retry; a hint that
+        # may say too much still beats a 502.
+        metrics.incr(f"guard_sent_{checked.guard.violation.replace(' ', '_')}")
+    return RoutedCall(
+        result=result,
+        parsed=checked.parsed if usable else None,
+        error=None if usable else checked.reason,
+        escalated_from=escalated_from,
+        repaired=checked.repaired,
+    )
+
+
+def _combined(first: tuple, final: tuple) -> tuple:
+    """The final call's tuple with latency and tokens of both calls added up."""
+    return (
+        *final[:7],
+        first[7] + final[7],
+        *((a or 0) + (b or 0) for a, b in zip(first[8:12], final[8:12])),
+    )
+
+
+def _continued(
+    prompt: str, mode: str, result: tuple, checked: _Checked, cancellation: Cancellation | None = None
+) -> tuple[tuple, _Checked]:
+    """Finish an answer whose message was cut off, with a text-only call.
+
+    Applies when the verdict was read, so only the message is missing; the
+    continuation keeps that verdict. Returns (result, checked) unchanged when
+    it does not apply or the continuation fails too.
+    """
+    fields = checked.output.fields
+    verdict = fields.get("verdict")
+    if checked.parsed is not None or verdict is None or "message_is" not in checked.output.missing:
+        return result, checked
+    response_type = fields.get("response_type") or default_response_type(mode, verdict) or ""
+    try:
+        continuation = call_continuation(
+            prompt, mode, verdict, response_type, checked.output.cut_value, model=result[5], cancellation=cancellation
+        )
+    except CallCancelled:
+        raise
+    except Exception:
+        logger.warning("Continuation of a cut-off %s answer failed", mode, exc_info=True)
+        metrics.incr("json_continuation_failed")
+        return result, checked
+    output = parse_response(continuation[0])
+    message = output.response.message_is if output.response is not None else None
+    if not message:
+        metrics.incr("json_continuation_failed")
+        return result, checked
+    metrics.incr("json_continued")
+    text = LLMResponse(verdict=verdict, response_type=response_type, message_is=message).model_dump_json()
+    combined = _combined(result, continuation)
+    return (text, *result[1:5], *combined[5:]), _validate(mode, text)
+
+
+def call_routed(
+    prompt: str,
+    prob_image: Any,
+    sol_image: Any,
+    mode: str,
+    sol_quality: ImageQuality,
+    prior_verdict: str | None = None,
+    regenerate: bool = False,
+    problem_cache_key: str | None = None,
+    note: str | None = None,
+    cancellation: Cancellation | None = None,
+) -> RoutedCall:
+    """Pick flash or pro for a tutor call and escalate a weak flash answer.
+
+    Every answer goes through backend.structured_output and
+    backend.output_guard first, so answers they can repair locally are never
+    re-requested, and a cut-off message is finished with a text-only call
+    instead of a full multimodal one.
+
+    sol_quality (of the normalized solution canvas) gives the features;
+    prior_verdict is the problem's last verdict. cancellation (see
+    backend.deadlines) stops the call, escalation and continuation included,
+    with CallCancelled. Blocking; call from a worker thread.
+    """
+    features = route_features(mode, sol_quality, prior_verdict)
+    model = choose_model(features, regenerate)
+    metrics.incr(f"router_{'pro' if model == PRO_MODEL else 'flash'}")
+
+    def call(model: str, correction: str | None = None) -> tuple:
+        return call_model_with_retry(
+            prompt=prompt,
+            prob_image=prob_image,
+            sol_image=sol_image,
+            mode=mode,
+            regenerate=regenerate,
+            problem_cache_key=problem_cache_key,
+            note="\n".join(filter(None, (note, correction))) or None,
+            model=model,
+            cancellation=cancellation,
+        )
+
+    result = call(model)
+    result, checked = _continued(prompt, mode, result, _validate(mode, result[0]), cancellation)
+    if checked.reason is None:
+        return _routed(result, checked)
+
+    # A flash answer that is weak escalates to pro; an answer the guard could
+    # not repair (e.g. a leaked hint) is regenerated once with a correction.
+    correction = checked.guard.correction if checked.guard is not None else None
+    if model == FLASH_MODEL and MODEL_ROUTING and ROUTER_ESCALATE:
+        retry_model = PRO_MODEL
+    elif correction is not None:
+        retry_model = model
+    else:
+        return _routed(result, checked)
+
+    logger.info("Retrying %s call on %s: %s", mode, retry_model, checked.reason)
+    metrics.incr("router_escalated" if retry_model != model else "router_regenerated")
+    keep_trace("retry")
+    try:
+        retry = call(retry_model, correction)
+    except CallCancelled:
+        raise
+    except Exception:
+        # A failed retry only costs the request if there is nothing to send.
+        logger.warning("Retrying %s call on %s failed", mode, retry_model, exc_info=True)
+        metrics.incr("router_escalation_failed")
+        if checked.usable:
+            return _routed(result, checked)
+        raise
+    retry, retry_checked = _continued(prompt, mode, retry, _validate(mode, retry[0]), cancellation)
+    if not retry_checked.usable and checked.usable:
+        # The retry is unusable; the first answer (e.g. "unclear") can be sent.
+        return _routed(_combined(retry, result), checked)
+    return _routed(_combined(result, retry), retry_checked, escalated_from=model if retry_model != model else None)
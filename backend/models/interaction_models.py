@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID, uuid4
+
+from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Step(SQLModel, table=True):
+    """One tutor request on a solution image (PRD: Step entity).
+
+    Only image hashes are kept; the images themselves live on the problem
+    (problem image, last checked canvas) or are discarded, along with the
+    solution's quality measures (backend.images.ImageQuality). preflight is
+    set when the call was answered by the pre-flight checks without a model
+    call. Rows are written in batches by backend.interaction_log.
+    """
+
+    __tablename__ = "steps"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+
+    user_id: UUID = Field(foreign_key="users.id", index=True)
+    problem_id: Optional[UUID] = Field(default=None, foreign_key="problems.id", index=True)
+
+    mode: str = Field(sa_column=Column(String(32), nullable=False))
+    incremental: bool = Field(default=False, sa_column=Column(Boolean, nullable=False))
+    regenerate: bool = Field(default=False, sa_column=Column(Boolean, nullable=False))
+
+    sol_image_sha256: str = Field(sa_column=Column(String(64), nullable=False))
+    prob_image_sha256: Optional[str] = Field(default=None, sa_column=Column(String(64), nullable=True))
+
+    sol_ink_fraction: Optional[float] = Field(default=None, sa_column=Column(Float, nullable=True))
+    sol_brightness: Optional[float] = Field(default=None, sa_column=Column(Float, nullable=True))
+    sol_contrast: Optional[float] = Field(default=None, sa_column=Column(Float, nullable=True))
+    sol_sharpness: Optional[float] = Field(default=None, sa_column=Column(Float, nullable=True))
+    preflight: Optional[str] = Field(default=None, sa_column=Column(String(32), nullable=True))
+
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True),
+    )
+
+
+class Feedback(SQLModel, table=True):
+    """The tutor's answer to a Step (PRD: Feedback entity).
+
+    error is set, and verdict/response_type are empty, when the model call
+    or its JSON failed.
+    """
+
+    __tablename__ = "feedback"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+
+    step_id: UUID = Field(foreign_key="steps.id", index=True)
+
+    model: Optional[str] = Field(default=None, sa_column=Column(String(64), nullable=True))
+    verdict: Optional[str] = Field(default=None, sa_column=Column(String(32), nullable=True))
+    response_type: Optional[str] = Field(default=None, sa_column=Column(String(32), nullable=True))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+
+    latency_ms: Optional[int] = Field(default=None, sa_column=Column(Integer, nullable=True))
+    tokens_in: int = Field(default=0, sa_column=Column(Integer, nullable=False))
+    tokens_out: int = Field(default=0, sa_column=Column(Integer, nullable=False))
+    tokens_thoughts: int = Field(default=0, sa_column=Column(Integer, nullable=False))
+    tokens_total: int = Field(default=0, sa_column=Column(Integer, nullable=False))
+
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID, uuid4
+
+from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import Boolean, DateTime, Index, Integer, LargeBinary, String, Text
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class LLMJob(SQLModel, table=True):
+    """A /jobs request: a /query-style LLM call executed by the worker pool.
+
+    Inputs are kept until the job finishes; the result (the model's JSON) is
+    kept so clients can fetch it after reconnecting or a server restart.
+    """
+
+    __tablename__ = "jobs"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+
+    user_id: UUID = Field(foreign_key="users.id", index=True)
+
+    status: str = Field(
+        default="queued", sa_column=Column(String(16), nullable=False)
+    )  # "queued" | "running" | "succeeded" | "failed"
+
+    mode: str = Field(sa_column=Column(String(32), nullable=False))
+    regenerate: bool = Field(default=False, sa_column=Column(Boolean, nullable=False))
+    incremental: bool = Field(default=False, sa_column=Column(Boolean, nullable=False))
+
+    problem_id: Optional[UUID] = Field(default=None, foreign_key="problems.id")
+    prob_image: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary, nullable=True))
+    sol_image: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary, nullable=True))
+
+    result: Optional[str] = Field(default=None, sa_column=Column(Text))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    attempts: int = Field(default=0, sa_column=Column(Integer, nullable=False))
+
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
+    started_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+    finished_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
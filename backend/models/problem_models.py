@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID, uuid4
+
+from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import String, DateTime, Integer, LargeBinary, Index, Text
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Problem(SQLModel, table=True):
+    """A problem the student is working on (PRD: Problem entity).
+
+    The normalized problem image is stored once; /query calls for this
+    problem reference it instead of re-uploading it.
+    """
+
+    __tablename__ = "problems"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+
+    user_id: UUID = Field(foreign_key="users.id", index=True)
+
+    status: str = Field(
+        default="active", sa_column=Column(String(16), nullable=False)
+    )  # "active" | "completed"
+
+    # Normalized image (see backend.images.normalize_image)
+    image_data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    image_mime: str = Field(sa_column=Column(String(64), nullable=False))
+    image_sha256: str = Field(sa_column=Column(String(64), nullable=False))
+    image_width: int = Field(sa_column=Column(Integer, nullable=False))
+    image_height: int = Field(sa_column=Column(Integer, nullable=False))
+
+    # Gemini Files API reference for the image; files expire server-side,
+    # so the expiry is tracked and the image re-uploaded when it lapses.
+    gemini_file_name: Optional[str] = Field(default=None, sa_column=Column(String(128)))
+    gemini_file_uri: Optional[str] = Field(default=None, sa_column=Column(String(512)))
+    gemini_file_expires_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+
+    # Last checked solution canvas and the tutor's verdict on it; incremental
+    # /query calls diff against it and send only the new step.
+    last_solution_data: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary, nullable=True))
+    last_verdict: Optional[str] = Field(default=None, sa_column=Column(String(32)))
+    last_response_type: Optional[str] = Field(default=None, sa_column=Column(String(32)))
+    last_message: Optional[str] = Field(default=None, sa_column=Column(Text))
+
+    # Matching backend.problem_bank problem, and how many of its ladder hints
+    # were served since the solution canvas last changed.
+    bank_problem_id: Optional[str] = Field(default=None, sa_column=Column(String(64)))
+    bank_hint_level: int = Field(default=0, sa_column=Column(Integer, nullable=False, server_default="0"))
+
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
+
+    __table_args__ = (
+        Index("ix_problems_user_id_created_at", "user_id", "created_at"),
+    )
+
+
+class TutoringSession(SQLModel, table=True):
+    """The user's active interaction context (PRD: Session entity)."""
+
+    __tablename__ = "sessions"
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+
+    user_id: UUID = Field(foreign_key="users.id")
+
+    active_problem_id: Optional[UUID] = Field(default=None, foreign_key="problems.id")
+
+    last_active_at: datetime = Field(
+        default_factory=utcnow,
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
+
+    __table_args__ = (
+        Index("ix_sessions_user_id", "user_id", unique=True),
+    )
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from uuid import UUID
+
+from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import BigInteger, Date, DateTime, Float, String
+
+
+class RateLimitBucket(SQLModel, table=True):
+    """Token-bucket state per user and bucket (the /query mode).
+
+    Only used with RATE_LIMIT_BACKEND=database, so several uvicorn workers
+    share one budget.
+    """
+
+    __tablename__ = "rate_limit_buckets"
+
+    user_id: UUID = Field(foreign_key="users.id", primary_key=True)
+    bucket: str = Field(sa_column=Column(String(32), primary_key=True))
+
+    tokens: float = Field(sa_column=Column(Float, nullable=False))
+    updated_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+
+class DailyTokenUsage(SQLModel, table=True):
+    """Gemini tokens (tokens_total) used per user per UTC day."""
+
+    __tablename__ = "daily_token_usage"
+
+    user_id: UUID = Field(foreign_key="users.id", primary_key=True)
+    day: date = Field(sa_column=Column(Date, primary_key=True))
+
+    tokens_used: int = Field(default=0, sa_column=Column(BigInteger, nullable=False))
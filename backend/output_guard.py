@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+
+from backend.llm import LLMResponse
+from backend.metrics import metrics
+
+# Serve-time versions of the offline checks in assignment3/qualitative_review.py
+# (detect_answer_leakage, is_response_type_policy_violation,
+# contradiction_with_verdict), compiled once at import.
+
+VERDICTS = ("fully_solved", "correct_so_far", "incorrect", "unclear")
+
+# Response types prompt.txt allows per (mode, verdict); the first is used to
+# repair a mismatched answer. "unclear" is ask_clarification in every mode.
+ALLOWED_RESPONSE_TYPES: dict[tuple[str, str], tuple[str, ...]] = {
+    ("hint", "fully_solved"): ("explanation",),
+    ("hint", "correct_so_far"): ("hint",),
+    ("hint", "incorrect"): ("fix_first",),
+    ("check_solution", "fully_solved"): ("explanation",),
+    ("check_solution", "correct_so_far"): ("explanation", "hint"),
+    ("check_solution", "incorrect"): ("fix_first", "explanation"),
+    ("reveal", "fully_solved"): ("full_solution",),
+    ("reveal", "correct_so_far"): ("full_solution",),
+    ("reveal", "incorrect"): ("full_solution",),
+}
+
+# Each check is a substring prefilter plus one regex over the lowercased
+# message; the prefilter skips the regex for most messages, keeping a check
+# in the low microseconds.
+_LEAKAGE = (
+    ("svar", "lausn"),
+    re.compile(r"\b(?:svari[dt]?\s+er\b|lokasvar\b|lausnin\s+er\b)"),
+)
+# "x = <number>": a value given away, except in a fix-first message, which
+# quotes the student's own (wrong) line.
+_LEAKAGE_VALUE = (("=",), re.compile(r"\bx\s*=\s*[-+]?\d"))
+# A one-line message that ends in "= <number>".
+_LEAKAGE_LINE = (("=",), re.compile(r"\s*\$?.*=\s*[-+]?\d+(?:[.,]\d+)?\s*$"))
+_POSITIVE = (
+    ("vel", "frab", "rett", "rétt"),
+    re.compile(r"\b(?:vel\s+gert|frab[ae]rt|r[eé]tt|[aá]\s+r[eé]ttri\s+lei[dh])\b"),
+)
+_NEGATIVE = (
+    ("ekki", "villa", "rangt", "mist"),
+    re.compile(r"\b(?:ekki\s+alveg\s+r[eé]tt|villa|rangt|mist[oe]k)\b"),
+)
+
+LEAKAGE_CORRECTION = (
+    "Your previous hint gave away the answer or the next step. Answer again with exactly one "
+    "Socratic question that does not contain the answer, the next step or any final value."
+)
+
+
+@dataclass(frozen=True)
+class GuardResult:
+    """A checked answer.
+
+    response is the answer to send, with any local repairs applied (listed in
+    repairs). violation is set when the answer cannot be repaired locally;
+    correction is then a note for a targeted regeneration, if one can help.
+    An answer with a correction can still be sent if the regeneration does
+    no better; one without (unknown verdict, empty message) cannot.
+    """
+
+    response: LLMResponse
+    repairs: tuple[str, ...] = ()
+    violation: str | None = None
+    correction: str | None = None
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.repairs)
+
+    @property
+    def usable(self) -> bool:
+        return self.violation is None or self.correction is not None
+
+
+def _allowed_response_types(mode: str, verdict: str) -> tuple[str, ...]:
+    if verdict == "unclear":
+        return ("ask_clarification",)
+    return ALLOWED_RESPONSE_TYPES.get((mode, verdict), ())
+
+
+def default_response_type(mode: str, verdict: str) -> str | None:
+    """The response_type prompt.txt prescribes for (mode, verdict), if known."""
+    allowed = _allowed_response_types(mode, verdict)
+    return allowed[0] if allowed else None
+
+
+def _search(text: str, check: tuple[tuple[str, ...], re.Pattern[str]]) -> bool:
+    keywords, pattern = check
+    return any(k in text for k in keywords) and pattern.search(text) is not None
+
+
+def leaks_answer(message: str, verdict: str) -> bool:
+    text = message.lower()
+    if _search(text, _LEAKAGE) or ("=" in text and _LEAKAGE_LINE[1].match(text) is not None):
+        return True
+    return verdict != "incorrect" and _search(text, _LEAKAGE_VALUE)
+
+
+def contradicts_verdict(verdict: str, message: str) -> bool:
+    """Praise for an incorrect answer, or only criticism for a correct one."""
+    if verdict not in ("incorrect", "fully_solved", "correct_so_far"):
+        return False
+    text = message.lower()
+    positive = _search(text, _POSITIVE)
+    negative = _search(text, _NEGATIVE)
+    if verdict == "incorrect":
+        return positive and not negative
+    return negative and not positive
+
+
+def check(mode: str, response: LLMResponse) -> GuardResult:
+    """Validate an answer against the tutoring policy, repairing what it can.
+
+    - verdict/response_type are normalized and response_type is set from
+      (mode, verdict) when it does not fit;
+    - a hint that gives the answer away cannot be repaired here and asks for
+      a regeneration with LEAKAGE_CORRECTION; it is still sent if the
+      regeneration leaks too;
+    - praise contradicting the verdict is only counted (guard_contradiction):
+      the prompt asks for encouragement even on errors, so it is too noisy to
+      regenerate on.
+    """
+    repairs = []
+    verdict = response.verdict.strip().lower()
+    response_type = response.response_type.strip().lower()
+    if (verdict, response_type) != (response.verdict, response.response_type):
+        repairs.append("normalized")
+
+    if verdict not in VERDICTS:
+        return GuardResult(response, violation=f"unknown verdict {verdict!r}")
+    if not response.message_is.strip():
+        return GuardResult(response, violation="empty message")
+
+    allowed = _allowed_response_types(mode, verdict)
+    if allowed and response_type not in allowed:
+        repairs.append(f"response_type {response_type} -> {allowed[0]}")
+        response_type = allowed[0]
+
+    if repairs:
+        metrics.incr("guard_repaired")
+        response = response.model_copy(update={"verdict": verdict, "response_type": response_type})
+
+    if mode == "hint" and verdict in ("correct_so_far", "incorrect") and leaks_answer(response.message_is, verdict):
+        metrics.incr("guard_leakage")
+        return GuardResult(response, tuple(repairs), violation="answer leakage", correction=LEAKAGE_CORRECTION)
+
+    if contradicts_verdict(verdict, response.message_is):
+        metrics.incr("guard_contradiction")
+    return GuardResult(response, tuple(repairs))
@@ -0,0 +1,99 @@
+"""Per-request cost of access-token authentication.
+
+Times, for one access token presented over and over:
+
+- decode_access_token with the verified-token cache off (a full JWT decode
+  and HMAC check, with each installed JWT backend) and on (a cache hit);
+- the whole get_current_user dependency, i.e. the decode plus loading the
+  user from a SQLite database, with the cache off and on.
+
+    python -m backend.perf.auth_bench
+    python -m backend.perf.auth_bench --number 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable
+
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlmodel import Session, create_engine
+
+from backend.auth import jwt as auth_jwt
+from backend.auth.deps import get_current_user
+from backend.models.auth_models import User
+from backend.perf.loadtest import create_schema
+
+
+def per_call_us(fn: Callable[[], object], number: int, repeat: int) -> float:
+    fn()
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def backends() -> list:
+    found = []
+    for cls in (auth_jwt._JoseBackend, auth_jwt._PyJWTBackend):
+        try:
+            found.append(cls())
+        except ImportError:
+            print(f"({cls.name} not installed; skipped)")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs; the fastest is reported")
+    args = parser.parse_args()
+
+    db = Path(tempfile.mkdtemp()) / "auth_bench.db"
+    url = f"sqlite:///{db}"
+    create_schema(url)
+    engine = create_engine(url)
+    with Session(engine) as session:
+        user = User(email="bench@example.com", password_hash="x")
+        session.add(user)
+        session.commit()
+        user_id = user.id
+
+    token = auth_jwt.create_access_token(user_id)
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    cache = auth_jwt.VerifiedTokenCache(max_entries=10000)
+    default_backend, default_cache = auth_jwt._backend, auth_jwt.token_cache
+
+    def dependency() -> User:
+        with Session(engine) as session:
+            return get_current_user(creds, session)
+
+    def decode() -> object:
+        return auth_jwt.decode_access_token(token)
+
+    def timed(fn: Callable[[], object]) -> float:
+        return per_call_us(fn, args.number, args.repeat)
+
+    rows = []
+    try:
+        auth_jwt.token_cache = None
+        for backend in backends():
+            auth_jwt._backend = backend
+            rows.append((f"decode ({backend.name})", timed(decode)))
+        auth_jwt._backend = default_backend
+        rows.append((f"dependency ({default_backend.name})", timed(dependency)))
+
+        auth_jwt.token_cache = cache
+        rows.append(("decode (cache hit)", timed(decode)))
+        rows.append(("dependency (cache hit)", timed(dependency)))
+    finally:
+        auth_jwt._backend, auth_jwt.token_cache = default_backend, default_cache
+        engine.dispose()
+
+    print(f"{'case':<28}{'us/request':>12}")
+    for name, us in rows:
+        print(f"{name:<28}{us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
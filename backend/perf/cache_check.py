@@ -0,0 +1,133 @@
+"""Context-cache lifecycle check against the local Gemini stand-in.
+
+Starts backend/perf/fake_gemini.py and walks the ContextCacheManager and
+call_model_with_retry through create, reuse, TTL refresh, server-side
+expiry, LRU eviction, explicit eviction and shutdown, checking the fake
+server's view of the caches after each step. Exits non-zero on failure.
+
+    python -m backend.perf.cache_check
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from backend.perf.loadtest import DEFAULT_IMAGES, spawn_uvicorn, wait_until_up
+
+failures: list[str] = []
+
+
+def check(condition: bool, label: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'}  {label}")
+    if not condition:
+        failures.append(label)
+
+
+def remote_caches(base_url: str) -> list[str]:
+    resp = httpx.get(f"{base_url}/v1beta/cachedContents", timeout=5.0)
+    return [c["name"] for c in resp.json()["cachedContents"]]
+
+
+def run(base_url: str, image: bytes) -> None:
+    # backend.config reads the environment at import time.
+    os.environ.update(
+        GEMINI_API_KEY="fake-key",
+        GEMINI_BASE_URL=base_url,
+        GEMINI_CONTEXT_CACHE="true",
+        LANGFUSE_PUBLIC_KEY="",
+        LANGFUSE_SECRET_KEY="",
+    )
+    from backend import llm
+    from backend.llm_cache import ContextCacheManager
+    from backend.metrics import metrics
+
+    prompt = (Path(llm.__file__).parent / "prompt.txt").read_text(encoding="utf-8")
+    client = llm.get_client()
+    name, uri, _ = llm.upload_image(image, "image/png")
+    part = llm.file_part(uri, "image/png")
+    key = llm.problem_cache_key("p1", name)
+
+    print("create and reuse")
+    first = llm.call_model_with_retry(prompt, part, part, "hint", problem_cache_key=key)
+    second = llm.call_model_with_retry(prompt, part, part, "hint", problem_cache_key=key)
+    caches = remote_caches(base_url)
+    check(len(caches) == 1, "one cache for two calls on the same problem")
+    counters = metrics.snapshot()["counters"]
+    check(counters.get("llm_cache_create") == 1 and counters.get("llm_cache_hit") == 1,
+          "second call served from the cache")
+    check(second[8] == first[8], "prompt tokens include the cached prefix")
+
+    print("TTL refresh")
+    entry = llm.context_caches._entries[(llm.FLASH_MODEL, key)]
+    before = client.caches.get(name=entry.name).expire_time
+    entry.expires_at = time.monotonic() + llm.context_caches.ttl_s / 2 - 1
+    time.sleep(1.1)
+    llm.call_model_with_retry(prompt, part, part, "hint", problem_cache_key=key)
+    after = client.caches.get(name=entry.name).expire_time
+    check(after > before, "cache TTL extended once half of it had passed")
+
+    print("server-side expiry")
+    client.caches.delete(name=entry.name)
+    result = llm.call_model_with_retry(prompt, part, part, "hint", problem_cache_key=key)
+    check(result[0] is not None, "call falls back to uncached content when the cache is gone")
+    llm.call_model_with_retry(prompt, part, part, "hint", problem_cache_key=key)
+    check(len(remote_caches(base_url)) == 1, "a new cache is created on the next call")
+
+    print("explicit eviction")
+    llm.evict_problem_caches("p1")
+    check(remote_caches(base_url) == [], "evicting a problem deletes its caches")
+
+    print("LRU eviction")
+    manager = ContextCacheManager(ttl_s=600, max_entries=2)
+    names = [manager.get_or_create(client, llm.FLASH_MODEL, f"k{i}", prompt, [part]) for i in range(3)]
+    remote = remote_caches(base_url)
+    check(names[0] not in remote and set(names[1:]) <= set(remote), "least recently used cache deleted")
+    check(len(manager) == 2, "manager holds at most max_entries")
+
+    print("too small to cache")
+    check(manager.get_or_create(client, llm.FLASH_MODEL, "tiny", "short prompt") is None,
+          "create failure returns None")
+    check(len(manager) == 2, "failed create is not stored")
+
+    print("shutdown")
+    manager.clear(client)
+    llm.close_llm_clients()
+    check(remote_caches(base_url) == [], "clear() deletes every cache created")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gemini-port", type=int, default=8768)
+    args = parser.parse_args()
+
+    images = sorted(DEFAULT_IMAGES.glob("*.png"))
+    if not images:
+        raise SystemExit(f"No PNG images found in {DEFAULT_IMAGES}")
+
+    proc = spawn_uvicorn(
+        "backend.perf.fake_gemini:app",
+        args.gemini_port,
+        {"FAKE_GEMINI_LATENCY_MEDIAN_S": "0.01", "FAKE_GEMINI_LATENCY_SIGMA": "0"},
+    )
+    base_url = f"http://127.0.0.1:{args.gemini_port}"
+    try:
+        wait_until_up(f"{base_url}/v1beta/models/x")
+        run(base_url, images[0].read_bytes())
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\nall checks passed")
+
+
+if __name__ == "__main__":
+    main()
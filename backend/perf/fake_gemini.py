@@ -0,0 +1,316 @@
+"""Local stand-in for the Gemini REST API used by load tests.
+
+Implements just enough of generativelanguage.googleapis.com for
+google-genai's Client(http_options={"base_url": ...}) to work:
+
+- POST /v1beta/models/{model}:generateContent
+- GET  /v1beta/models/{model} (used by the app's warm-up ping)
+- POST /upload/v1beta/files (resumable start + finalize, files.upload)
+- GET  /v1beta/files/{id}
+- /v1beta/cachedContents (create, list, get, patch ttl, delete); generateContent
+  honours "cachedContent" and reports cachedContentTokenCount; a request for
+  backend.problem_bank's ladder schema gets a fixed ladder
+
+Latency and failures are drawn from configurable distributions so the app
+can be exercised against a realistic (or hostile) upstream:
+
+    FAKE_GEMINI_LATENCY_MEDIAN_S   median latency (lognormal), default 1.5
+    FAKE_GEMINI_LATENCY_SIGMA      lognormal sigma, default 0.4 (0 = fixed)
+    FAKE_GEMINI_PRO_FACTOR         latency multiplier for *-pro-* models, default 3
+    FAKE_GEMINI_ERROR_RATE         probability of a 503 response, default 0.0
+    FAKE_GEMINI_MALFORMED_RATE     probability of malformed JSON (code fence, trailing
+                                   comma or cut-off message), default 0.0
+    FAKE_GEMINI_SEED               RNG seed (optional)
+    FAKE_GEMINI_CACHE_MIN_TOKENS   smallest cacheable content, default 1024
+
+Run:
+    uvicorn backend.perf.fake_gemini:app --port 8090
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+LATENCY_MEDIAN_S = float(os.getenv("FAKE_GEMINI_LATENCY_MEDIAN_S", "1.5"))
+LATENCY_SIGMA = float(os.getenv("FAKE_GEMINI_LATENCY_SIGMA", "0.4"))
+PRO_FACTOR = float(os.getenv("FAKE_GEMINI_PRO_FACTOR", "3"))
+ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0.0"))
+MALFORMED_RATE = float(os.getenv("FAKE_GEMINI_MALFORMED_RATE", "0.0"))
+CACHE_MIN_TOKENS = int(os.getenv("FAKE_GEMINI_CACHE_MIN_TOKENS", "1024"))
+
+# Gemini bills a typical image at a flat ~258 tokens; text is ~4 chars/token.
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+rng = random.Random(os.getenv("FAKE_GEMINI_SEED"))
+
+# Uploaded files, by id; contents are discarded, only metadata is kept.
+files: dict[str, dict] = {}
+
+# Context caches, by id, with their token count and expiry.
+caches: dict[str, dict] = {}
+
+VERDICTS = {
+    "fully_solved": "explanation",
+    "correct_so_far": "hint",
+    "incorrect": "fix_first",
+    "unclear": "ask_clarification",
+}
+
+
+def sample_latency(model: str) -> float:
+    latency = LATENCY_MEDIAN_S
+    if LATENCY_SIGMA > 0:
+        latency = math.exp(rng.gauss(math.log(LATENCY_MEDIAN_S), LATENCY_SIGMA))
+    if "pro" in model:
+        latency *= PRO_FACTOR
+    return latency
+
+
+def count_prompt_tokens(body: dict) -> tuple[int, str]:
+    """Rough token count of the request, plus the last text part (the mode)."""
+    tokens = 0
+    last_text = ""
+    contents = list(body.get("contents", []))
+    if body.get("systemInstruction"):
+        contents.insert(0, body["systemInstruction"])
+    for content in contents:
+        for part in content.get("parts", []):
+            if "text" in part:
+                tokens += len(part["text"]) // CHARS_PER_TOKEN + 1
+                last_text = part["text"]
+            elif "inlineData" in part or "fileData" in part:
+                tokens += IMAGE_TOKENS
+    return tokens, last_text
+
+
+def parse_ttl(value: str) -> float:
+    return float(value.rstrip("s"))
+
+
+def live_cache(name: str) -> dict | None:
+    cache = caches.get(name.rpartition("/")[2])
+    if cache is None or cache["expires_at"] <= datetime.now(timezone.utc):
+        return None
+    return cache
+
+
+def cache_resource(cache: dict) -> dict:
+    return {
+        "name": cache["name"],
+        "model": cache["model"],
+        "displayName": cache["displayName"],
+        "createTime": cache["created_at"].isoformat(),
+        "updateTime": cache["updated_at"].isoformat(),
+        "expireTime": cache["expires_at"].isoformat(),
+        "usageMetadata": {"totalTokenCount": cache["tokens"]},
+    }
+
+
+def fake_answer(mode: str) -> dict[str, str]:
+    if mode == "reveal":
+        return {
+            "verdict": "fully_solved",
+            "response_type": "full_solution",
+            "message_is": "Skref 1: ...\\nSkref 2: ...\\nSkref 3: ...",
+        }
+    verdict = rng.choice(list(VERDICTS))
+    return {
+        "verdict": verdict,
+        "response_type": VERDICTS[verdict],
+        "message_is": "Vel gert! Hvaða reglu getur þú notað næst?",
+    }
+
+
+def fake_ladder() -> dict:
+    """An answer to backend.problem_bank's ladder generation call."""
+    return {
+        "hints": [
+            "Hvaða reglu þekkir þú um svona jöfnur?",
+            "Prófaðu að einangra $x$ öðrum megin.",
+            "Byrjaðu á að draga sama fasta frá báðum hliðum.",
+        ],
+        "common_errors": [{"error": "sign error", "feedback_is": "Athugaðu formerkið í öðru skrefi."}],
+    }
+
+
+def malformed(text: str) -> str:
+    """text with one of the defects seen from the real API."""
+    defect = rng.choice(("fence", "trailing_comma", "cut"))
+    if defect == "fence":
+        return f"```json\n{text}\n```"
+    if defect == "trailing_comma":
+        return text[:-1] + ",}"
+    return text[: text.index('"message_is"') + 20]
+
+
+def error_response(code: int, status: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"code": code, "message": message, "status": status}},
+        status_code=code,
+    )
+
+
+async def generate_content(request: Request) -> JSONResponse:
+    model = request.path_params["model"]
+    body = await request.json()
+
+    await asyncio.sleep(sample_latency(model))
+    if rng.random() < ERROR_RATE:
+        return error_response(503, "UNAVAILABLE", "The model is overloaded (fake).")
+
+    prompt_tokens, mode = count_prompt_tokens(body)
+    cached_tokens = 0
+    if body.get("cachedContent"):
+        cache = live_cache(body["cachedContent"])
+        if cache is None:
+            return error_response(403, "PERMISSION_DENIED", "CachedContent not found (or expired) (fake).")
+        cached_tokens = cache["tokens"]
+        prompt_tokens += cached_tokens
+    mode = mode.strip()
+    schema = body.get("generationConfig", {}).get("responseJsonSchema") or {}
+    if "hints" in schema.get("properties", {}):
+        text = json.dumps(fake_ladder(), ensure_ascii=False)
+    else:
+        text = json.dumps(fake_answer(mode), ensure_ascii=False)
+    if mode in ("hint", "check_solution", "reveal") and rng.random() < MALFORMED_RATE:
+        text = malformed(text)
+    out_tokens = len(text) // CHARS_PER_TOKEN + 1
+    thought_tokens = rng.randint(100, 600)
+
+    return JSONResponse(
+        {
+            "candidates": [
+                {
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": out_tokens,
+                "thoughtsTokenCount": thought_tokens,
+                "totalTokenCount": prompt_tokens + out_tokens + thought_tokens,
+            },
+            "modelVersion": model,
+        }
+    )
+
+
+async def dispatch_model_action(request: Request) -> JSONResponse:
+    # Starlette cannot route on the ":action" suffix, so split it here.
+    model, _, action = request.path_params["model_action"].rpartition(":")
+    request.path_params["model"] = model
+    if action == "generateContent":
+        return await generate_content(request)
+    return error_response(404, "NOT_FOUND", f"Unsupported action {action!r} (fake).")
+
+
+async def get_model(request: Request) -> JSONResponse:
+    model = request.path_params["model_action"]
+    return JSONResponse({"name": f"models/{model}", "displayName": f"{model} (fake)"})
+
+
+async def start_upload(request: Request) -> JSONResponse:
+    body = await request.json()
+    file_id = uuid.uuid4().hex[:12]
+    files[file_id] = {
+        "name": f"files/{file_id}",
+        "mimeType": body.get("file", {}).get("mimeType", "application/octet-stream"),
+        "state": "PROCESSING",
+    }
+    upload_url = str(request.url_for("finish_upload", file_id=file_id))
+    return JSONResponse({}, headers={"x-goog-upload-url": upload_url, "x-goog-upload-status": "active"})
+
+
+async def finish_upload(request: Request) -> JSONResponse:
+    file_id = request.path_params["file_id"]
+    if file_id not in files:
+        return error_response(404, "NOT_FOUND", "Unknown upload session (fake).")
+    data = await request.body()
+    now = datetime.now(timezone.utc)
+    files[file_id].update(
+        sizeBytes=str(len(data)),
+        createTime=now.isoformat(),
+        expirationTime=(now + timedelta(hours=48)).isoformat(),
+        uri=str(request.url_for("get_file", file_id=file_id)),
+        state="ACTIVE",
+    )
+    return JSONResponse({"file": files[file_id]}, headers={"x-goog-upload-status": "final"})
+
+
+async def get_file(request: Request) -> JSONResponse:
+    file_id = request.path_params["file_id"]
+    if file_id not in files:
+        return error_response(404, "NOT_FOUND", "File not found (fake).")
+    return JSONResponse(files[file_id])
+
+
+async def create_cache(request: Request) -> JSONResponse:
+    body = await request.json()
+    tokens, _ = count_prompt_tokens(body)
+    if tokens < CACHE_MIN_TOKENS:
+        return error_response(
+            400, "INVALID_ARGUMENT",
+            f"Cached content is too small. total_token_count={tokens}, min_total_token_count={CACHE_MIN_TOKENS} (fake).",
+        )
+    cache_id = uuid.uuid4().hex[:12]
+    now = datetime.now(timezone.utc)
+    caches[cache_id] = {
+        "name": f"cachedContents/{cache_id}",
+        "model": body.get("model", ""),
+        "displayName": body.get("displayName", ""),
+        "tokens": tokens,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(seconds=parse_ttl(body.get("ttl", "3600s"))),
+    }
+    return JSONResponse(cache_resource(caches[cache_id]))
+
+
+async def list_caches(request: Request) -> JSONResponse:
+    live = [cache_resource(c) for c in caches.values() if live_cache(c["name"])]
+    return JSONResponse({"cachedContents": live})
+
+
+async def cache_item(request: Request) -> JSONResponse:
+    cache_id = request.path_params["cache_id"]
+    cache = live_cache(cache_id)
+    if cache is None:
+        return error_response(403, "PERMISSION_DENIED", "CachedContent not found (or expired) (fake).")
+    if request.method == "DELETE":
+        del caches[cache_id]
+        return JSONResponse({})
+    if request.method == "PATCH":
+        body = await request.json()
+        now = datetime.now(timezone.utc)
+        cache["updated_at"] = now
+        cache["expires_at"] = now + timedelta(seconds=parse_ttl(body.get("ttl", "3600s")))
+    return JSONResponse(cache_resource(cache))
+
+
+app = Starlette(
+    routes=[
+        Route("/v1beta/models/{model_action:path}", get_model, methods=["GET"]),
+        Route("/v1beta/models/{model_action:path}", dispatch_model_action, methods=["POST"]),
+        Route("/upload/v1beta/files", start_upload, methods=["POST"]),
+        Route("/upload/v1beta/files/{file_id}", finish_upload, methods=["POST"], name="finish_upload"),
+        Route("/v1beta/files/{file_id}", get_file, methods=["GET"], name="get_file"),
+        Route("/v1beta/cachedContents", create_cache, methods=["POST"]),
+        Route("/v1beta/cachedContents", list_caches, methods=["GET"]),
+        Route("/v1beta/cachedContents/{cache_id}", cache_item, methods=["GET", "PATCH", "DELETE"]),
+    ]
+)
@@ -0,0 +1,459 @@
+"""Load-test harness for backend.main:app.
+
+Starts the fake Gemini server (backend/perf/fake_gemini.py) and the app
+under uvicorn against a local database. It then drives an open-loop mix of
+/auth/login, /auth/refresh and multipart /query traffic at a fixed request
+rate. Each virtual user registers a problem (POST /problems) up front and
+/query sends only the solution image plus problem_id; --inline-images sends
+both images on every call instead. Open-loop means requests are started on schedule whether or not
+earlier ones have finished, so queueing inside the app shows up as latency
+instead of silently lowering the offered load.
+
+Reported:
+- client side: throughput, status codes and p50/p95/p99/max latency per endpoint
+- server side (/metrics, enabled via METRICS_ENABLED): event-loop lag,
+  DB pool checked-out connections and worker-thread usage
+
+Examples (from the repo root):
+    python -m backend.perf.loadtest --rps 20 --duration 60
+    python -m backend.perf.loadtest --rps 50 --mix login=1,refresh=2,query=7 \\
+        --gemini-latency 2.0 --gemini-error-rate 0.05 --json run.json
+    python -m backend.perf.loadtest --rps 20 --baseline run.json     # regression check
+    python -m backend.perf.loadtest --target http://127.0.0.1:8000   # existing app, no spawn
+
+With no --database-url a fresh SQLite file is used and the schema is created
+with SQLModel.metadata.create_all. For Postgres pass --database-url and run
+the Alembic migrations first.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_IMAGES = REPO_ROOT / "assignment3" / "img"
+PASSWORD = "loadtest-password"
+
+MODES = {"hint": 0.5, "check_solution": 0.4, "reveal": 0.1}
+
+
+@dataclass
+class VirtualUser:
+    email: str
+    access_token: str = ""
+    refresh_cookie: str = ""
+    problem_id: str = ""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class Results:
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: dict[str, dict[str, int]] = field(
+        default_factory=lambda: defaultdict(lambda: defaultdict(int))
+    )
+    upload_bytes: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    server_samples: list[dict[str, Any]] = field(default_factory=list)
+
+    def record(self, endpoint: str, status: str, latency: float, sent: int = 0) -> None:
+        self.latencies[endpoint].append(latency)
+        self.statuses[endpoint][status] += 1
+        self.upload_bytes[endpoint] += sent
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, weight = item.split("=")
+        if name not in ("login", "refresh", "query"):
+            raise argparse.ArgumentTypeError(f"unknown endpoint in mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+# -------------------------
+# Process management
+# -------------------------
+def spawn_uvicorn(app: str, port: int, env: dict[str, str], workers: int = 1) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", app,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(cmd, cwd=REPO_ROOT, env={**os.environ, **env})
+
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def create_schema(database_url: str) -> None:
+    """Create tables directly (SQLite runs); Postgres should use Alembic."""
+    from sqlmodel import SQLModel, create_engine
+
+    import backend.models.auth_models  # noqa: F401
+    import backend.models.problem_models  # noqa: F401
+    import backend.models.usage_models  # noqa: F401
+    import backend.models.job_models  # noqa: F401
+    import backend.models.interaction_models  # noqa: F401
+
+    engine = create_engine(database_url)
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+
+
+# -------------------------
+# Traffic
+# -------------------------
+async def register_users(
+    client: httpx.AsyncClient, n_users: int, images: list[bytes], inline_images: bool
+) -> list[VirtualUser]:
+    run_id = int(time.time())
+    users = []
+    for i in range(n_users):
+        user = VirtualUser(email=f"load-{run_id}-{i}@example.com")
+        resp = await client.post("/auth/register", json={"email": user.email, "password": PASSWORD})
+        resp.raise_for_status()
+        user.access_token = resp.json()["access_token"]
+        user.refresh_cookie = resp.cookies.get("refresh_token", "")
+        if not inline_images:
+            resp = await client.post(
+                "/problems",
+                headers={"authorization": f"Bearer {user.access_token}"},
+                files={"problem_image": ("prob.png", images[i % len(images)], "image/png")},
+            )
+            resp.raise_for_status()
+            user.problem_id = resp.json()["problem_id"]
+        users.append(user)
+    return users
+
+
+async def do_login(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    async with user.lock:
+        resp = await client.post("/auth/login", json={"email": user.email, "password": PASSWORD})
+        if resp.status_code == 200:
+            user.access_token = resp.json()["access_token"]
+            user.refresh_cookie = resp.cookies.get("refresh_token", user.refresh_cookie)
+        return resp
+
+
+async def do_refresh(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    # Refresh rotates the cookie, so one refresh per user at a time.
+    async with user.lock:
+        resp = await client.post(
+            "/auth/refresh", headers={"cookie": f"refresh_token={user.refresh_cookie}"}
+        )
+        if resp.status_code == 200:
+            user.access_token = resp.json()["access_token"]
+            user.refresh_cookie = resp.cookies.get("refresh_token", user.refresh_cookie)
+        return resp
+
+
+async def do_query(
+    client: httpx.AsyncClient, user: VirtualUser, images: list[bytes]
+) -> tuple[httpx.Response, int]:
+    mode = random.choices(list(MODES), weights=list(MODES.values()))[0]
+    prob, sol = random.sample(images, 2) if len(images) > 1 else (images[0], images[0])
+    files = {"sol_image": ("sol.png", sol, "image/png")}
+    data = {"mode": mode}
+    if user.problem_id:
+        data["problem_id"] = user.problem_id
+    else:
+        files["prob_image"] = ("prob.png", prob, "image/png")
+    resp = await client.post(
+        "/query",
+        headers={"authorization": f"Bearer {user.access_token}"},
+        data=data,
+        files=files,
+    )
+    return resp, sum(len(f[1]) for f in files.values())
+
+
+async def one_request(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    users: list[VirtualUser],
+    images: list[bytes],
+    results: Results,
+) -> None:
+    user = random.choice(users)
+    sent = 0
+    t0 = time.perf_counter()
+    try:
+        if endpoint == "login":
+            resp = await do_login(client, user)
+        elif endpoint == "refresh":
+            resp = await do_refresh(client, user)
+        else:
+            resp, sent = await do_query(client, user, images)
+        status = str(resp.status_code)
+    except httpx.TimeoutException:
+        status = "timeout"
+    except httpx.HTTPError as exc:
+        status = type(exc).__name__
+    results.record(endpoint, status, time.perf_counter() - t0, sent)
+
+
+async def poll_server_metrics(
+    client: httpx.AsyncClient, results: Results, stop: asyncio.Event, interval: float = 1.0
+) -> None:
+    while not stop.is_set():
+        try:
+            resp = await client.get("/metrics", timeout=5.0)
+            if resp.status_code == 200:
+                results.server_samples.append(resp.json())
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(
+    base_url: str,
+    rps: float,
+    duration: float,
+    mix: dict[str, float],
+    n_users: int,
+    images: list[bytes],
+    timeout: float,
+    poisson: bool,
+    inline_images: bool,
+) -> tuple[Results, float]:
+    results = Results()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        users = await register_users(client, n_users, images, inline_images)
+        await client.post("/metrics/reset")
+
+        stop = asyncio.Event()
+        poller = asyncio.create_task(poll_server_metrics(client, results, stop))
+        endpoints, weights = list(mix), list(mix.values())
+        tasks: list[asyncio.Task] = []
+
+        start = time.perf_counter()
+        next_at = start
+        while next_at - start < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = random.choices(endpoints, weights=weights)[0]
+            tasks.append(asyncio.create_task(one_request(client, endpoint, users, images, results)))
+            next_at += random.expovariate(rps) if poisson else 1.0 / rps
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await poller
+        # One final sample so the histograms include the tail of the run.
+        try:
+            resp = await client.get("/metrics", timeout=5.0)
+            if resp.status_code == 200:
+                results.server_samples.append(resp.json())
+        except httpx.HTTPError:
+            pass
+    return results, elapsed
+
+
+# -------------------------
+# Reporting
+# -------------------------
+def build_report(results: Results, elapsed: float, offered_rps: float) -> dict[str, Any]:
+    endpoints = {}
+    total = 0
+    for endpoint, latencies in sorted(results.latencies.items()):
+        statuses = dict(results.statuses[endpoint])
+        ok = sum(n for s, n in statuses.items() if s.startswith("2"))
+        total += len(latencies)
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            "ok": ok,
+            "statuses": statuses,
+            "throughput_rps": round(ok / elapsed, 2),
+            "p50_ms": round(1000 * percentile(latencies, 50), 1),
+            "p95_ms": round(1000 * percentile(latencies, 95), 1),
+            "p99_ms": round(1000 * percentile(latencies, 99), 1),
+            "max_ms": round(1000 * max(latencies), 1),
+            "upload_kb_per_req": round(results.upload_bytes[endpoint] / len(latencies) / 1024, 1),
+        }
+
+    server: dict[str, Any] = {}
+    if results.server_samples:
+        last = results.server_samples[-1]
+        lag = last.get("histograms", {}).get("event_loop_lag_s", {})
+        server["loop_lag_p99_ms"] = round(1000 * lag.get("p99", 0.0), 1)
+        server["loop_lag_max_ms"] = round(1000 * lag.get("max", 0.0), 1)
+        for gauge in ("db_pool_checked_out", "db_pool_overflow", "threadpool_borrowed"):
+            values = [s.get("gauges", {}).get(gauge, {}).get("max", 0) for s in results.server_samples]
+            server[f"{gauge}_max"] = max(values) if values else 0
+        gauges = last.get("gauges", {})
+        if "db_pool_size" in gauges:
+            server["db_pool_size"] = gauges["db_pool_size"]["value"]
+        if "threadpool_total" in gauges:
+            server["threadpool_total"] = gauges["threadpool_total"]["value"]
+
+    return {
+        "offered_rps": offered_rps,
+        "duration_s": round(elapsed, 1),
+        "requests": total,
+        "achieved_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        "server": server,
+    }
+
+
+def print_report(report: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    print(
+        f"\nOffered {report['offered_rps']} rps for {report['duration_s']}s: "
+        f"{report['requests']} requests, {report['achieved_rps']} rps achieved\n"
+    )
+    header = (
+        f"{'endpoint':<10}{'reqs':>7}{'ok':>7}{'ok rps':>9}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}{'up KB':>8}  statuses"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, ep in report["endpoints"].items():
+        line = (
+            f"{name:<10}{ep['requests']:>7}{ep['ok']:>7}{ep['throughput_rps']:>9}"
+            f"{ep['p50_ms']:>10}{ep['p95_ms']:>10}{ep['p99_ms']:>10}{ep['max_ms']:>10}"
+            f"{ep.get('upload_kb_per_req', 0):>8}  {ep['statuses']}"
+        )
+        print(line)
+        if baseline and name in baseline.get("endpoints", {}):
+            base = baseline["endpoints"][name]
+            deltas = "  ".join(
+                f"{k}: {ep[k] - base[k]:+.1f}" for k in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+            )
+            print(f"{'':<10}vs baseline  {deltas}")
+
+    if report["server"]:
+        print("\nServer:")
+        for key, value in report["server"].items():
+            base = (baseline or {}).get("server", {}).get(key)
+            suffix = f"  (baseline {base})" if base is not None else ""
+            print(f"  {key:<28}{value}{suffix}")
+    else:
+        print("\nServer metrics unavailable (start the app with METRICS_ENABLED=true).")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10.0, help="offered request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("login=1,refresh=2,query=7"))
+    parser.add_argument("--users", type=int, default=20, help="virtual users to register")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGES, help="directory of PNGs for /query")
+    parser.add_argument("--inline-images", action="store_true",
+                        help="send prob_image on every /query instead of registering problems")
+    parser.add_argument("--target", help="base URL of an already running app (skips spawning)")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--gemini-port", type=int, default=8766)
+    parser.add_argument("--gemini-latency", type=float, default=1.5, help="median fake Gemini latency (s)")
+    parser.add_argument("--gemini-sigma", type=float, default=0.4, help="lognormal sigma (0 = fixed)")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="fraction of 503s")
+    parser.add_argument("--app-env", action="append", default=[], help="extra KEY=VALUE for the app")
+    parser.add_argument("--json", type=Path, help="write the report as JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON report to compare against")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    images = [p.read_bytes() for p in sorted(args.images.glob("*.png"))][:20]
+    if not images:
+        raise SystemExit(f"No PNG images found in {args.images}")
+
+    procs: list[subprocess.Popen] = []
+    base_url = args.target
+    try:
+        if base_url is None:
+            gemini_env = {
+                "FAKE_GEMINI_LATENCY_MEDIAN_S": str(args.gemini_latency),
+                "FAKE_GEMINI_LATENCY_SIGMA": str(args.gemini_sigma),
+                "FAKE_GEMINI_ERROR_RATE": str(args.gemini_error_rate),
+            }
+            procs.append(spawn_uvicorn("backend.perf.fake_gemini:app", args.gemini_port, gemini_env))
+
+            database_url = args.database_url
+            if database_url is None:
+                db_path = Path(tempfile.mkdtemp(prefix="loadtest-")) / "app.db"
+                database_url = f"sqlite:///{db_path}"
+                create_schema(database_url)
+
+            app_env = {
+                "DATABASE_URL": database_url,
+                "GEMINI_API_KEY": "fake-key",
+                "GEMINI_BASE_URL": f"http://127.0.0.1:{args.gemini_port}",
+                "METRICS_ENABLED": "true",
+                # Virtual users would trip the per-user limits; enable via --app-env.
+                "RATE_LIMIT_ENABLED": "false",
+                "LANGFUSE_PUBLIC_KEY": "",
+                "LANGFUSE_SECRET_KEY": "",
+            }
+            app_env.update(dict(item.split("=", 1) for item in args.app_env))
+            procs.append(spawn_uvicorn("backend.main:app", args.app_port, app_env, args.workers))
+
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            wait_until_up(f"http://127.0.0.1:{args.gemini_port}/v1beta/models/x:ping")
+            wait_until_up(f"{base_url}/ready")
+
+        results, elapsed = asyncio.run(
+            drive(
+                base_url, args.rps, args.duration, args.mix, args.users, images,
+                args.timeout, args.poisson, args.inline_images,
+            )
+        )
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    report = build_report(results, elapsed, args.rps)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_report(report, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Pre-flight calibration check.
+
+Runs every image in assignment3/img through normalize_image and the
+pre-flight checks: none may be rejected, since the thresholds are meant to
+catch only obviously unusable images. Then checks synthetic canvases that
+must pass (light pencil on white, chalk on a dark board, a dark-mode canvas)
+and ones that must be rejected (blank, dark and flat). Exits non-zero on
+failure.
+
+    python -m backend.perf.preflight_check
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from backend.images import normalize_image
+from backend.perf.loadtest import DEFAULT_IMAGES
+from backend.preflight import preflight
+
+failures: list[str] = []
+
+
+def check(condition: bool, label: str) -> None:
+    print(f"  {'ok  ' if condition else 'FAIL'}  {label}")
+    if not condition:
+        failures.append(label)
+
+
+def canvas(page: int, ink: int, size: tuple[int, int] = (1200, 800)) -> bytes:
+    """A handwriting-like canvas: lines of strokes in grey level ink on a page of grey level page."""
+    from PIL import Image, ImageDraw
+
+    img = Image.new("L", size, page)
+    draw = ImageDraw.Draw(img)
+    for row in range(4):
+        y = 120 + row * 150
+        for col in range(12):
+            x = 80 + col * 85
+            draw.line([(x, y + 50), (x + 25, y), (x + 50, y + 50), (x + 65, y + 20)], fill=ink, width=4)
+    out = BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+def reason_for(data: bytes) -> tuple[str | None, str]:
+    quality = normalize_image(data).quality
+    summary = (
+        f"ink={quality.ink_fraction:.4f} brightness={quality.brightness:.0f} "
+        f"contrast={quality.contrast:.1f} sharpness={quality.sharpness:.3f}"
+    )
+    return preflight("check_solution", quality), summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGES)
+    args = parser.parse_args()
+
+    print(f"calibration images ({args.images})")
+    for path in sorted(args.images.glob("*.png")):
+        reason, summary = reason_for(path.read_bytes())
+        check(reason is None, f"{path.name} passes ({reason or summary})")
+
+    print("synthetic canvases that must pass")
+    for label, data in (
+        ("pencil grey 150 on white", canvas(255, 150)),
+        ("pencil grey 140 on white", canvas(255, 140)),
+        ("pen on off-white paper", canvas(225, 40)),
+        ("chalk on a dark board", canvas(35, 220)),
+        ("dark-mode canvas", canvas(18, 235)),
+    ):
+        reason, summary = reason_for(data)
+        check(reason is None, f"{label} passes ({reason or summary})")
+
+    print("synthetic canvases that must be rejected")
+    for label, data, expected in (
+        ("blank white canvas", canvas(255, 255), "blank_solution"),
+        ("blank grey page", canvas(200, 200), "blank_solution"),
+        ("dark, flat photo", canvas(40, 44), "dark"),
+    ):
+        reason, summary = reason_for(data)
+        check(reason == expected, f"{label} -> {expected} (got {reason}; {summary})")
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
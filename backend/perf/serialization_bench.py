@@ -0,0 +1,113 @@
+"""Per-request JSON serialization cost, before and after the orjson switch.
+
+Times the serialization work each route does on a typical payload, with
+the stdlib path the app used before and the path it uses now:
+
+- /query: json.loads of Gemini's text, then JSONResponse re-encoding it,
+  versus one pydantic-core validation of the text, which is then sent as is.
+- /auth/*: TokenResponse/MeResponse dumped to a dict by FastAPI, then
+  rendered by JSONResponse versus ORJSONResponse.
+- /jobs/{id}: a finished job's body (the stored JSON parsed and nested)
+  with json versus orjson.
+
+    python -m backend.perf.serialization_bench
+    python -m backend.perf.serialization_bench --number 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from typing import Callable
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from backend.llm import LLMResponse
+from backend.schemas.auth import MeResponse, TokenResponse
+
+GEMINI_TEXT = json.dumps(
+    {
+        "verdict": "partially_correct",
+        "response_type": "fix_first",
+        "message_is": (
+            "Vel gert með fyrsta skrefið! Athugaðu formerkið þegar þú færir 3x yfir "
+            "jafnaðarmerkið. Hvað gerist við formerkið?"
+        ),
+    },
+    ensure_ascii=False,
+)
+TOKEN = TokenResponse(access_token="eyJhbGciOiJIUzI1NiJ9." + "x" * 180 + ".sig")
+ME = MeResponse(id="5b2f0c1e-8d0a-4c55-9b8e-3f1d2a6c7e90", email="student@example.com")
+
+
+def query_before() -> bytes:
+    payload = json.loads(GEMINI_TEXT)
+    return JSONResponse(content=payload).body
+
+
+def query_after() -> bytes:
+    LLMResponse.model_validate_json(GEMINI_TEXT)
+    return GEMINI_TEXT.encode()
+
+
+def auth_before() -> bytes:
+    JSONResponse(content=ME.model_dump(mode="json"))
+    return JSONResponse(content=TOKEN.model_dump(mode="json")).body
+
+
+def auth_after() -> bytes:
+    ORJSONResponse(content=ME.model_dump(mode="json"))
+    return ORJSONResponse(content=TOKEN.model_dump(mode="json")).body
+
+
+def _job_body(loads: Callable[[str], object]) -> dict:
+    return {
+        "job_id": "0d6a6a8e-1c2b-4b8e-a2f4-2b7f1f3f5e11",
+        "status": "succeeded",
+        "mode": "reveal",
+        "regenerate": True,
+        "created_at": "2026-10-19T14:12:03.511203+00:00",
+        "started_at": "2026-10-19T14:12:03.601992+00:00",
+        "finished_at": "2026-10-19T14:12:09.013877+00:00",
+        "result": loads(GEMINI_TEXT),
+        "error": None,
+    }
+
+
+def jobs_before() -> bytes:
+    return JSONResponse(content=_job_body(json.loads)).body
+
+
+def jobs_after() -> bytes:
+    return ORJSONResponse(content=_job_body(orjson.loads)).body
+
+
+CASES = [
+    ("/query", query_before, query_after),
+    ("/auth (token + me)", auth_before, auth_after),
+    ("/jobs/{id}", jobs_before, jobs_after),
+]
+
+
+def per_call_us(fn: Callable[[], bytes], number: int, repeat: int) -> float:
+    fn()
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs; the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'route':<22}{'before us':>12}{'after us':>12}{'speedup':>10}")
+    for name, before, after in CASES:
+        before_us = per_call_us(before, args.number, args.repeat)
+        after_us = per_call_us(after, args.number, args.repeat)
+        print(f"{name:<22}{before_us:>12.2f}{after_us:>12.2f}{before_us / after_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
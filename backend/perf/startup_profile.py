@@ -0,0 +1,129 @@
+"""Startup-time profile for the backend.
+
+Two measurements:
+
+1. Import-time breakdown: runs `python -X importtime -c "import backend.main"`
+   in a fresh interpreter and aggregates the per-module self time by
+   top-level package, plus the slowest modules by cumulative time.
+2. Time to live/ready (--serve): starts uvicorn and measures how long until
+   /health answers and until /ready returns 200 (clients warmed).
+
+Examples (from the repo root):
+    python -m backend.perf.startup_profile
+    python -m backend.perf.startup_profile --top 25 --module backend.routes.query
+    python -m backend.perf.startup_profile --serve --app-env DATABASE_URL=sqlite:///tmp/app.db \\
+        --app-env GEMINI_API_KEY=fake --app-env LLM_WARMUP_PING=false
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def run_importtime(module: str, env: dict[str, str]) -> tuple[list[tuple[str, int, int, int]], float]:
+    """Import module in a fresh interpreter; return (module, self_us, cumulative_us, depth) rows."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise SystemExit(f"import {module} failed:\n{tail}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cum_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cum_us), len(indent) // 2))
+    return rows, wall
+
+
+def print_import_report(module: str, rows: list[tuple[str, int, int, int]], wall: float, top: int) -> None:
+    by_package: dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    total_us = sum(by_package.values())
+
+    top_level = [r for r in rows if r[0] == module]
+    module_cum = top_level[-1][2] if top_level else total_us
+
+    print(f"import {module}: {module_cum / 1000:.1f} ms cumulative, {len(rows)} modules, "
+          f"{wall * 1000:.0f} ms interpreter wall time\n")
+
+    print(f"{'package':<32}{'self ms':>10}{'share':>8}")
+    print("-" * 50)
+    for package, self_us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"{package:<32}{self_us / 1000:>10.1f}{100 * self_us / total_us:>7.1f}%")
+
+    print(f"\n{'slowest modules (cumulative)':<52}{'cum ms':>10}{'self ms':>10}")
+    print("-" * 72)
+    for name, self_us, cum_us, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"{name:<52}{cum_us / 1000:>10.1f}{self_us / 1000:>10.1f}")
+
+
+def measure_serve(port: int, env: dict[str, str], timeout: float) -> None:
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env={**os.environ, **env},
+    )
+    live_at = ready_at = None
+    try:
+        while time.perf_counter() - t0 < timeout and ready_at is None:
+            try:
+                if live_at is None and httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                    live_at = time.perf_counter() - t0
+                if live_at is not None and httpx.get(f"http://127.0.0.1:{port}/ready", timeout=0.5).status_code == 200:
+                    ready_at = time.perf_counter() - t0
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    print("\nServe:")
+    print(f"  /health 200 after  {live_at * 1000:.0f} ms" if live_at else "  /health never answered")
+    print(f"  /ready 200 after   {ready_at * 1000:.0f} ms" if ready_at else f"  /ready not 200 within {timeout:.0f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main", help="module to import")
+    parser.add_argument("--top", type=int, default=15, help="rows per table")
+    parser.add_argument("--serve", action="store_true", help="also measure time to /health and /ready")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--app-env", action="append", default=[], help="extra KEY=VALUE for the app")
+    args = parser.parse_args()
+
+    env = dict(item.split("=", 1) for item in args.app_env)
+    rows, wall = run_importtime(args.module, env)
+    print_import_report(args.module, rows, wall, args.top)
+    if args.serve:
+        measure_serve(args.port, env, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
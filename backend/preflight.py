@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from backend.config import (
+    PREFLIGHT_ENABLED,
+    PREFLIGHT_MIN_BRIGHTNESS,
+    PREFLIGHT_MIN_CONTRAST,
+    PREFLIGHT_MIN_INK,
+    PREFLIGHT_MIN_SHARPNESS,
+)
+from backend.images import ImageQuality
+from backend.llm import LLMResponse
+from backend.metrics import metrics
+
+# Local checks on the normalized images of a tutor call. A blank canvas or a
+# photo too dark or blurred to read would only get "unclear" from Gemini
+# after seconds of work, so it gets the same clarification request at once.
+
+# The clarification sent, by rejection reason.
+MESSAGES = {
+    "blank_solution": "Ég sé enga skrift á myndinni af lausninni. Skrifaðu lausnina þína og sendu hana aftur.",
+    "blank_problem": "Ég sé ekkert dæmi á myndinni af verkefninu. Geturðu sent hana aftur?",
+    "dark": "Myndin er of dökk til að ég geti lesið hana. Geturðu tekið nýja mynd í betri birtu?",
+    "low_contrast": "Ég get ekki greint skriftina á myndinni. Geturðu tekið nýja mynd þar sem hún sést betur?",
+    "blurry": "Myndin er of óskýr til að ég geti lesið hana. Geturðu tekið nýja og skarpari mynd?",
+}
+
+
+def _unreadable(quality: ImageQuality, blank_reason: str) -> str | None:
+    # A dark image is only unreadable if it is flat too: chalk on a board or
+    # a dark-mode canvas is dark but has plenty of contrast.
+    if quality.brightness < PREFLIGHT_MIN_BRIGHTNESS and quality.contrast < PREFLIGHT_MIN_CONTRAST:
+        return "dark"
+    if quality.ink_fraction < PREFLIGHT_MIN_INK:
+        return blank_reason
+    if quality.contrast < PREFLIGHT_MIN_CONTRAST:
+        return "low_contrast"
+    if quality.sharpness < PREFLIGHT_MIN_SHARPNESS:
+        return "blurry"
+    return None
+
+
+def problem_preflight(prob: ImageQuality) -> str | None:
+    """Why a problem image is unreadable, or None."""
+    if not PREFLIGHT_ENABLED:
+        return None
+    return _unreadable(prob, "blank_problem")
+
+
+def preflight(mode: str, sol: ImageQuality, prob: ImageQuality | None = None) -> str | None:
+    """Why the call can be answered without the model, or None.
+
+    prob is the quality of a one-off problem image (stored problems are
+    checked by problem_preflight() on upload). The solution is not checked
+    for reveal, which does not need any work on the canvas.
+    """
+    if not PREFLIGHT_ENABLED:
+        return None
+    reason = None
+    if prob is not None:
+        reason = problem_preflight(prob)
+    if reason is None and mode != "reveal":
+        reason = _unreadable(sol, "blank_solution")
+    if reason is not None:
+        metrics.incr(f"preflight_{reason}")
+    return reason
+
+
+def clarification(reason: str) -> LLMResponse:
+    return LLMResponse(verdict="unclear", response_type="ask_clarification", message_is=MESSAGES[reason])
@@ -0,0 +1,277 @@
+"""Curated problem bank: reviewed hint ladders for known textbook problems.
+
+Many students submit the same textbook problems. Each bank problem has an
+image, a ladder of hints from a first nudge to the method, and feedback for
+its common errors, generated offline by Gemini and then reviewed by hand.
+Only entries marked "reviewed" are served. /query in hint mode answers from
+the ladder while the student's canvas is blank, or unchanged since the last
+rung they got; any other canvas goes to Gemini, with the reviewed feedback
+in its note.
+
+The bank is a directory with bank.json and the problem images:
+
+    python -m backend.problem_bank generate BANK_DIR   # draft entries for new images/*
+    python -m backend.problem_bank check BANK_DIR      # validate, report near-duplicates
+
+then review the drafts in bank.json, set "reviewed": true, and point
+PROBLEM_BANK_PATH at BANK_DIR/bank.json.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from backend.config import PREFLIGHT_MIN_INK, PROBLEM_BANK_MAX_DISTANCE, PROBLEM_BANK_PATH
+from backend.images import ImageQuality, hash_distance
+from backend.llm import LLMResponse
+
+logger = logging.getLogger(__name__)
+
+LADDER_PROMPT_PATH = Path(__file__).resolve().parent / "ladder_prompt.txt"
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+
+BANK_NOTE = (
+    "This is a known problem. Reviewed hints for it, in order:\n{hints}\n"
+    "Reviewed feedback for its common errors:\n{errors}\n"
+    "If the student's first error is one of these, base your message on its feedback; "
+    "if they need a hint, prefer the first of these they have not reached yet."
+)
+
+
+class CommonError(BaseModel):
+    error: str
+    feedback_is: str
+
+
+class LadderDraft(BaseModel):
+    """What the generation call returns for one problem."""
+
+    hints: list[str]
+    common_errors: list[CommonError]
+
+
+@dataclass(frozen=True)
+class BankProblem:
+    id: str
+    dhash: str
+    hints: tuple[str, ...]
+    common_errors: tuple[CommonError, ...]
+
+    def hint(self, rung: int) -> LLMResponse:
+        return LLMResponse(verdict="correct_so_far", response_type="hint", message_is=self.hints[rung])
+
+    def note(self) -> str:
+        """Context for a Gemini call on this problem."""
+        return BANK_NOTE.format(
+            hints="\n".join(f"{i}. {hint}" for i, hint in enumerate(self.hints, 1)),
+            errors="\n".join(f"- {e.error}: {e.feedback_is}" for e in self.common_errors) or "-",
+        )
+
+
+class ProblemBank:
+    """The reviewed bank problems, by id and by image dHash."""
+
+    def __init__(self, problems: list[BankProblem], max_distance: int) -> None:
+        self.max_distance = max_distance
+        self._by_id = {problem.id: problem for problem in problems}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, bank_id: str | None) -> BankProblem | None:
+        return self._by_id.get(bank_id) if bank_id else None
+
+    def match(self, dhash: str) -> BankProblem | None:
+        """The bank problem whose image is nearest to dhash, if within max_distance."""
+        best, best_distance = None, self.max_distance + 1
+        for problem in self._by_id.values():
+            distance = hash_distance(dhash, problem.dhash)
+            if distance < best_distance:
+                best, best_distance = problem, distance
+        return best
+
+
+def load_entries(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    entries = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: expected a list of bank problems")
+    return entries
+
+
+def load_bank(path: Path, max_distance: int) -> ProblemBank:
+    problems = []
+    for entry in load_entries(path):
+        if not entry.get("reviewed"):
+            continue
+        problems.append(
+            BankProblem(
+                id=entry["id"],
+                dhash=entry["dhash"],
+                hints=tuple(entry["hints"]),
+                common_errors=tuple(CommonError(**e) for e in entry.get("common_errors", [])),
+            )
+        )
+    return ProblemBank(problems, max_distance)
+
+
+def ladder_rung(
+    problem: BankProblem, level: int, solution: ImageQuality, same_canvas: bool
+) -> int | None:
+    """The ladder rung a hint request gets, or None to ask Gemini.
+
+    level is how many rungs the student has had since their canvas last
+    changed (Problem.bank_hint_level); same_canvas says the canvas is the one
+    that was last answered. Only a blank canvas, or one unchanged since the
+    last rung, is a state the ladder was written for, and only while it has
+    rungs left.
+    """
+    blank = solution.ink_fraction < PREFLIGHT_MIN_INK
+    rung = level if same_canvas else 0
+    if not (blank or (same_canvas and level > 0)) or rung >= len(problem.hints):
+        return None
+    return rung
+
+
+def _build_bank() -> ProblemBank | None:
+    if not PROBLEM_BANK_PATH:
+        return None
+    bank = load_bank(Path(PROBLEM_BANK_PATH), PROBLEM_BANK_MAX_DISTANCE)
+    logger.info("Problem bank: %d reviewed problems from %s", len(bank), PROBLEM_BANK_PATH)
+    return bank
+
+
+problem_bank = _build_bank()
+
+
+# -------------------------
+# Offline generation (CLI)
+# -------------------------
+def draft_ladder(image_bytes: bytes, model: str) -> tuple[dict[str, Any], int]:
+    """A draft entry (without id) for one problem image, and the tokens used."""
+    from backend.llm import get_client, image_part
+    from backend.uploads import normalize_upload
+
+    image = normalize_upload(image_bytes, None)
+    resp = get_client().models.generate_content(
+        model=model,
+        contents=[LADDER_PROMPT_PATH.read_text(encoding="utf-8"), image_part(image.data, image.mime_type)],
+        config={
+            "response_mime_type": "application/json",
+            "response_json_schema": LadderDraft.model_json_schema(),
+        },
+    )
+    draft = LadderDraft.model_validate_json(resp.text)
+    usage = getattr(resp, "usage_metadata", None)
+    entry = {
+        "dhash": image.dhash,
+        "reviewed": False,
+        "model": model,
+        **draft.model_dump(),
+    }
+    return entry, getattr(usage, "total_token_count", 0) or 0
+
+
+def generate(bank_dir: Path, model: str, concurrency: int) -> int:
+    """Draft entries for images in bank_dir/images that bank.json lacks.
+
+    Entries are keyed by image file stem, which becomes the bank id. Returns
+    the number of failures.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    bank_path = bank_dir / "bank.json"
+    entries = load_entries(bank_path)
+    known = {entry["id"] for entry in entries}
+    images = sorted(
+        p for p in (bank_dir / "images").iterdir() if p.suffix.lower() in IMAGE_SUFFIXES and p.stem not in known
+    )
+    print(f"{len(images)} new images, {len(entries)} entries in {bank_path}")
+
+    failures = 0
+    tokens = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        drafts = pool.map(lambda p: _try_draft(p, model), images)
+        for path, result in zip(images, drafts):
+            if result is None:
+                failures += 1
+                continue
+            entry, used = result
+            tokens += used
+            entries.append({"id": path.stem, "image": f"images/{path.name}", **entry})
+            print(f"  drafted {path.stem}: {len(entry['hints'])} hints, {len(entry['common_errors'])} errors")
+
+    bank_path.write_text(json.dumps(entries, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"{len(images) - failures} drafted, {failures} failed, {tokens} tokens; review them in {bank_path}")
+    return failures
+
+
+def _try_draft(path: Path, model: str) -> tuple[dict[str, Any], int] | None:
+    try:
+        return draft_ladder(path.read_bytes(), model)
+    except Exception as exc:
+        print(f"  FAILED {path.name}: {exc}")
+        return None
+
+
+def check(bank_dir: Path, max_distance: int) -> int:
+    """Validate bank.json; report unreviewed entries and images close enough
+    to be mistaken for each other. Returns the number of problems found."""
+    entries = load_entries(bank_dir / "bank.json")
+    issues = 0
+    ids: set[str] = set()
+    for entry in entries:
+        missing = [key for key in ("id", "dhash", "hints") if not entry.get(key)]
+        if missing or entry["id"] in ids:
+            print(f"  {entry.get('id')}: {'duplicate id' if not missing else 'missing ' + ', '.join(missing)}")
+            issues += 1
+            continue
+        ids.add(entry["id"])
+        try:
+            tuple(CommonError(**e) for e in entry.get("common_errors", []))
+        except Exception as exc:
+            print(f"  {entry['id']}: invalid common_errors: {exc}")
+            issues += 1
+    for i, a in enumerate(entries):
+        for b in entries[i + 1 :]:
+            if a.get("dhash") and b.get("dhash") and hash_distance(a["dhash"], b["dhash"]) <= max_distance:
+                print(f"  {a['id']} and {b['id']} are within {max_distance} bits of each other")
+                issues += 1
+    reviewed = sum(1 for entry in entries if entry.get("reviewed"))
+    print(f"{len(entries)} entries, {reviewed} reviewed, {issues} problems")
+    return issues
+
+
+def main() -> None:
+    import argparse
+    import sys
+
+    from backend.llm import PRO_MODEL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    gen = commands.add_parser("generate", help="draft ladders for new images")
+    gen.add_argument("bank_dir", type=Path)
+    gen.add_argument("--model", default=PRO_MODEL)
+    gen.add_argument("--concurrency", type=int, default=4)
+    chk = commands.add_parser("check", help="validate bank.json")
+    chk.add_argument("bank_dir", type=Path)
+    chk.add_argument("--max-distance", type=int, default=PROBLEM_BANK_MAX_DISTANCE)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        failed = generate(args.bank_dir, args.model, args.concurrency)
+    else:
+        failed = check(args.bank_dir, args.max_distance)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
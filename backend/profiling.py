@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timezone
+from types import FrameType
+from typing import Any
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.config import (
+    LOOP_BLOCK_THRESHOLD_S,
+    PROFILE_INTERVAL_S,
+    PROFILE_KEEP,
+    PROFILE_SAMPLE_RATE,
+    PROFILING_TOKEN,
+    TRACEMALLOC_FRAMES,
+)
+from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Opt-in profiling (PROFILING_ENABLED): sampling profiles of single requests,
+# a watchdog for callbacks that block the event loop, and tracemalloc
+# snapshots. Nothing here is imported or installed when it is off.
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+# Functions listed per profile, by samples.
+PROFILE_TOP = 25
+# Blocked-loop reports kept for GET /debug/loop-stalls.
+STALLS_KEEP = 20
+# Threads of this module, left out of profiles.
+OWN_THREADS = frozenset({"request-profiler", "loop-watchdog"})
+# Where an idle event loop waits: select() for asyncio, or the frame that
+# entered the loop for uvloop, whose own loop has no Python frames.
+_LOOP_IDLE_LEAVES = frozenset(
+    {
+        ("selectors.py", "select"),
+        ("base_events.py", "run_forever"),
+        ("base_events.py", "run_until_complete"),
+        ("runners.py", "run"),
+    }
+)
+
+
+def token_matches(token: str | None) -> bool:
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+def _label(frame: FrameType) -> str:
+    path = frame.f_code.co_filename
+    return f"{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}:{frame.f_code.co_name}"
+
+
+def _stack(frame: FrameType | None) -> list[FrameType]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _idle(frames: list[FrameType]) -> bool:
+    """A thread waiting for work: the event loop between callbacks, or a pool
+    thread parked in threading/queue code without any of our frames below it."""
+    leaf = frames[-1].f_code
+    if (os.path.basename(leaf.co_filename), leaf.co_name) in _LOOP_IDLE_LEAVES:
+        return True
+    ours = any(f"{os.sep}backend{os.sep}" in f.f_code.co_filename for f in frames)
+    return not ours and leaf.co_filename.endswith(("threading.py", "queue.py"))
+
+
+class _Sampler:
+    """Samples every thread's stack each interval_s from a thread of its own.
+
+    Stacks are counted in folded form ("thread;frame;frame") as flamegraph
+    tools read them. The event loop thread is shared, so concurrent requests
+    show up in a profile too; the request's own frames are named in it.
+    """
+
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = interval_s
+        self.folded: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if names.get(ident) in OWN_THREADS:
+                    continue
+                frames = _stack(frame)
+                if not frames or _idle(frames):
+                    continue
+                labels = [names.get(ident, str(ident))] + [_label(f) for f in frames]
+                self.folded[";".join(labels)] += 1
+
+
+def _top(folded: Counter[str]) -> list[dict[str, Any]]:
+    own: Counter[str] = Counter()
+    total: Counter[str] = Counter()
+    for stack, count in folded.items():
+        labels = stack.split(";")[1:]
+        own[labels[-1]] += count
+        for label in set(labels):
+            total[label] += count
+    # By self samples: where threads actually were, rather than the
+    # framework frames every stack passes through.
+    return [
+        {"function": label, "self_samples": count, "total_samples": total[label]}
+        for label, count in own.most_common(PROFILE_TOP)
+    ]
+
+
+class ProfileStore:
+    """The last `keep` request profiles, for the /debug/profiles routes.
+
+    One request is profiled at a time: stacks are sampled from all threads,
+    so two overlapping profiles would count each other's work.
+    """
+
+    def __init__(self, keep: int) -> None:
+        self._profiles: deque[dict[str, Any]] = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def try_begin(self) -> int | None:
+        if not self._busy.acquire(blocking=False):
+            metrics.incr("profiles_skipped_busy")
+            return None
+        return next(self._ids)
+
+    def finish(self, profile: dict[str, Any]) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+        self._busy.release()
+        metrics.incr(f"profiles_{profile['reason']}")
+
+    def list(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [{k: v for k, v in p.items() if k not in ("top", "folded")} for p in self._profiles]
+
+    def get(self, profile_id: int) -> dict[str, Any] | None:
+        with self._lock:
+            return next((p for p in self._profiles if p["id"] == profile_id), None)
+
+
+profile_store = ProfileStore(PROFILE_KEEP)
+
+
+class ProfilingMiddleware:
+    """Profiles requests carrying X-Profile-Token, and a sample of the rest.
+
+    A profiled response carries X-Profile-Id; the profile itself is at
+    GET /debug/profiles/{id}.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith("/debug"):
+            await self.app(scope, receive, send)
+            return
+        token = dict(scope["headers"]).get(PROFILE_TOKEN_HEADER)
+        if token is not None and token_matches(token.decode("latin-1")):
+            reason = "requested"
+        elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            reason = "sampled"
+        else:
+            await self.app(scope, receive, send)
+            return
+        profile_id = profile_store.try_begin()
+        if profile_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+
+        async def profiled_send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER, str(profile_id).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = _Sampler(PROFILE_INTERVAL_S)
+        started_at = datetime.now(timezone.utc)
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            duration = time.perf_counter() - t0
+            # Joining the sampler takes at most one interval.
+            sampler.stop()
+            profile_store.finish(
+                {
+                    "id": profile_id,
+                    "reason": reason,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "started_at": started_at.isoformat(),
+                    "duration_s": round(duration, 4),
+                    "interval_s": PROFILE_INTERVAL_S,
+                    "samples": sampler.samples,
+                    "top": _top(sampler.folded),
+                    "folded": dict(sampler.folded),
+                }
+            )
+
+
+class LoopWatchdog:
+    """Reports event-loop callbacks that hold the loop longer than threshold_s.
+
+    A task on the loop updates a heartbeat; a thread checks it and, when it is
+    late, records the loop thread's stack at that moment (the blocking
+    callback), logs it and counts event_loop_blocked. The stall's length is
+    known once the heartbeat resumes (event_loop_blocked_s).
+    """
+
+    def __init__(self, threshold_s: float) -> None:
+        self.threshold_s = threshold_s
+        self.stalls: deque[dict[str, Any]] = deque(maxlen=STALLS_KEEP)
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._current: dict[str, Any] | None = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread is not None:
+            self._thread.join()
+
+    def recent(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return list(self.stalls)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.threshold_s / 4)
+            now = time.monotonic()
+            with self._lock:
+                stall, self._current = self._current, None
+                if stall is not None:
+                    stall["blocked_s"] = round(now - self._beat, 4)
+                    metrics.observe("event_loop_blocked_s", stall["blocked_s"])
+                self._beat = now
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold_s / 4):
+            with self._lock:
+                late = time.monotonic() - self._beat
+                if late <= self.threshold_s or self._current is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+                self._current = {
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "blocked_s": None,
+                    "stack": stack,
+                }
+                self.stalls.append(self._current)
+            metrics.incr("event_loop_blocked")
+            logger.warning("Event loop blocked for over %.3fs in:\n%s", late, stack)
+
+
+loop_watchdog = LoopWatchdog(LOOP_BLOCK_THRESHOLD_S)
+
+_MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+_last_snapshot: tracemalloc.Snapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def start_tracemalloc() -> None:
+    if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def memory_report(limit: int) -> dict[str, Any] | None:
+    """Top allocation sites now, and their growth since the previous report.
+
+    None when tracemalloc is not tracing. Blocking: taking a snapshot walks
+    every traced allocation.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return None
+    with _snapshot_lock:
+        snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+        previous, _last_snapshot = _last_snapshot, snapshot
+    if previous is not None:
+        stats = snapshot.compare_to(previous, "lineno")
+    else:
+        stats = snapshot.statistics("lineno")
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "compared_to_previous": previous is not None,
+        "top": [
+            {
+                "where": str(stat.traceback[0]),
+                "size_bytes": stat.size,
+                "count": stat.count,
+                "size_diff_bytes": getattr(stat, "size_diff", None),
+                "count_diff": getattr(stat, "count_diff", None),
+            }
+            for stat in stats[:limit]
+        ],
+    }
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlmodel import Session
+
+from backend.config import (
+    DAILY_TOKEN_BUDGET,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMITS,
+)
+from backend.db import get_engine
+from backend.metrics import metrics
+from backend.repositories.usage_repo import add_daily_usage, get_daily_usage, take_token
+
+# Idle buckets are dropped from memory once this many are held.
+MEMORY_SWEEP_THRESHOLD = 10_000
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    capacity: float
+    refill_per_s: float
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_limits(value: str) -> dict[str, BucketSpec]:
+    """Parse "mode=burst/per_minute,..." (e.g. "hint=10/20") into bucket specs."""
+    specs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        burst, _, per_minute = rate.partition("/")
+        specs[name.strip()] = BucketSpec(capacity=float(burst), refill_per_s=float(per_minute) / 60)
+    return specs
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def seconds_until_utc_midnight() -> float:
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return (midnight - now).total_seconds()
+
+
+class MemoryBackend:
+    """Per-process state; each uvicorn worker enforces its own limits.
+
+    idle_s is how long an untouched bucket takes to refill completely; such
+    buckets carry no state and are swept once the map grows large.
+    """
+
+    def __init__(self, idle_s: float) -> None:
+        self.idle_s = idle_s
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple[UUID, str], tuple[float, float]] = {}
+        self._usage_day: date | None = None
+        self._usage: dict[UUID, int] = {}
+
+    def take(self, user_id: UUID, bucket: str, spec: BucketSpec) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get((user_id, bucket), (spec.capacity, now))
+            tokens = min(spec.capacity, tokens + (now - updated) * spec.refill_per_s)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / spec.refill_per_s
+            self._buckets[(user_id, bucket)] = (tokens, now)
+            if len(self._buckets) > MEMORY_SWEEP_THRESHOLD:
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < self.idle_s}
+        return retry_after
+
+    def usage(self, user_id: UUID, day: date) -> int:
+        with self._lock:
+            return self._usage.get(user_id, 0) if day == self._usage_day else 0
+
+    def add_usage(self, user_id: UUID, day: date, tokens: int) -> None:
+        with self._lock:
+            if day != self._usage_day:
+                self._usage_day = day
+                self._usage = {}
+            self._usage[user_id] = self._usage.get(user_id, 0) + tokens
+
+
+class DatabaseBackend:
+    """State in the application database, shared by all workers."""
+
+    def take(self, user_id: UUID, bucket: str, spec: BucketSpec) -> float:
+        with Session(get_engine()) as session:
+            return take_token(
+                session, user_id, bucket, spec.capacity, spec.refill_per_s, datetime.now(timezone.utc)
+            )
+
+    def usage(self, user_id: UUID, day: date) -> int:
+        with Session(get_engine()) as session:
+            return get_daily_usage(session, user_id, day)
+
+    def add_usage(self, user_id: UUID, day: date, tokens: int) -> None:
+        with Session(get_engine()) as session:
+            add_daily_usage(session, user_id, day, tokens)
+
+
+class RateLimiter:
+    """Per-user, per-mode token buckets plus a daily Gemini token budget.
+
+    acquire() is called before an LLM call and raises RateLimitExceeded;
+    record_tokens() adds the call's tokens_total to today's usage afterwards,
+    so the budget is checked against usage up to the previous call.
+    Blocking (the database backend does I/O); call from a worker thread.
+    """
+
+    def __init__(
+        self,
+        backend: MemoryBackend | DatabaseBackend,
+        limits: dict[str, BucketSpec],
+        daily_token_budget: int,
+    ) -> None:
+        self.backend = backend
+        self.limits = limits
+        self.daily_token_budget = daily_token_budget
+
+    def acquire(self, user_id: UUID, bucket: str) -> None:
+        if self.daily_token_budget > 0:
+            used = self.backend.usage(user_id, utc_today())
+            if used >= self.daily_token_budget:
+                metrics.incr("rate_limit_budget_rejected")
+                raise RateLimitExceeded("Daily token budget exhausted", seconds_until_utc_midnight())
+
+        spec = self.limits.get(bucket)
+        if spec is None or spec.refill_per_s <= 0:
+            return
+        retry_after = self.backend.take(user_id, bucket, spec)
+        if retry_after > 0:
+            metrics.incr(f"rate_limit_rejected_{bucket}")
+            raise RateLimitExceeded(f"Too many {bucket} requests", retry_after)
+
+    def record_tokens(self, user_id: UUID, tokens: int) -> None:
+        if self.daily_token_budget > 0 and tokens:
+            self.backend.add_usage(user_id, utc_today(), int(tokens))
+
+
+def _build_rate_limiter() -> RateLimiter | None:
+    if not RATE_LIMIT_ENABLED:
+        return None
+    limits = parse_limits(RATE_LIMITS)
+    if RATE_LIMIT_BACKEND == "database":
+        backend = DatabaseBackend()
+    elif RATE_LIMIT_BACKEND == "memory":
+        idle_s = max((s.capacity / s.refill_per_s for s in limits.values() if s.refill_per_s > 0), default=0.0)
+        backend = MemoryBackend(idle_s)
+    else:
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND {RATE_LIMIT_BACKEND!r}")
+    return RateLimiter(backend, limits, DAILY_TOKEN_BUDGET)
+
+
+rate_limiter = _build_rate_limiter()
+
+
+def retry_after_header(exc: RateLimitExceeded) -> dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
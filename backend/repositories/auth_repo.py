@@ -10,6 +10,7 @@ from passlib.context import CryptContext
 from sqlmodel import Session, select
 
 from backend.models.auth_models import User, RefreshToken
+from backend.repositories.timestamps import as_utc
 
 # Avoid bcrypt backend issues (and the 72-byte input limit) by using PBKDF2-SHA256.
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
@@ -122,7 +123,7 @@ def is_refresh_token_valid(rt: RefreshToken) -> bool:
     now = utcnow()
     if rt.revoked_at is not None:
         return False
-    if rt.expires_at <= now:
+    if as_utc(rt.expires_at) <= now:
         return False
     return True
 
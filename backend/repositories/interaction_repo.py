@@ -0,0 +1,25 @@
+# app/repositories/interaction_repo.py
+from __future__ import annotations
+
+from typing import Any
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from backend.models.interaction_models import Feedback, Step
+
+
+# -------------------------
+# Steps and feedback
+# -------------------------
+def insert_interactions(session: Session, steps: list[dict[str, Any]], feedback: list[dict[str, Any]]) -> None:
+    """
+    Inserts a batch of steps and their feedback in one transaction.
+    Each list goes out as a single executemany, which SQLAlchemy sends as
+    multi-row INSERT ... VALUES statements.
+    """
+    if steps:
+        session.exec(insert(Step.__table__), params=steps)
+    if feedback:
+        session.exec(insert(Feedback.__table__), params=feedback)
+    session.commit()
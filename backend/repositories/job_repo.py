@@ -0,0 +1,122 @@
+# app/repositories/job_repo.py
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from backend.models.job_models import LLMJob
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def create_job(
+    session: Session,
+    user_id: UUID,
+    mode: str,
+    regenerate: bool,
+    incremental: bool,
+    problem_id: UUID | None,
+    prob_image: bytes | None,
+    sol_image: bytes,
+) -> LLMJob:
+    job = LLMJob(
+        user_id=user_id,
+        mode=mode,
+        regenerate=regenerate,
+        incremental=incremental,
+        problem_id=problem_id,
+        prob_image=prob_image,
+        sol_image=sol_image,
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def get_job_for_user(session: Session, job_id: UUID, user_id: UUID) -> Optional[LLMJob]:
+    job = session.get(LLMJob, job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
+
+
+def claim_next_job(session: Session) -> Optional[LLMJob]:
+    """
+    Marks the oldest queued job running and returns it, or None.
+    The conditional UPDATE makes the claim safe across workers even where
+    SKIP LOCKED is unavailable (SQLite).
+    """
+    stmt = (
+        select(LLMJob.id)
+        .where(LLMJob.status == "queued")
+        .order_by(LLMJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job_id = session.exec(stmt).first()
+    if job_id is None:
+        session.rollback()
+        return None
+
+    claimed = session.exec(
+        update(LLMJob)
+        .where(LLMJob.id == job_id, LLMJob.status == "queued")
+        .values(status="running", started_at=utcnow(), attempts=LLMJob.attempts + 1)
+    )
+    session.commit()
+    if claimed.rowcount != 1:
+        return None
+    return session.get(LLMJob, job_id)
+
+
+def finish_job(
+    session: Session, job_id: UUID, attempt: int, result: str | None = None, error: str | None = None
+) -> bool:
+    """
+    Stores the outcome of the run that claimed the job as its attempt-th
+    attempt. Returns False, storing nothing, when the job is no longer that
+    run's (it was re-queued as stale and claimed again, or failed).
+    """
+    finished = session.exec(
+        update(LLMJob)
+        .where(LLMJob.id == job_id, LLMJob.status == "running", LLMJob.attempts == attempt)
+        .values(
+            status="failed" if error is not None else "succeeded",
+            result=result,
+            error=error,
+            finished_at=utcnow(),
+            # Inputs are only needed until the job has run.
+            prob_image=None,
+            sol_image=None,
+        )
+    )
+    session.commit()
+    return finished.rowcount == 1
+
+
+def requeue_stale_jobs(session: Session, stale_s: float, max_attempts: int) -> int:
+    """
+    Jobs left running by a worker that died go back to the queue, or fail
+    once they have used up max_attempts.
+    """
+    cutoff = utcnow() - timedelta(seconds=stale_s)
+    stale = LLMJob.status == "running", LLMJob.started_at < cutoff
+    session.exec(
+        update(LLMJob)
+        .where(*stale, LLMJob.attempts >= max_attempts)
+        .values(status="failed", error="Worker stopped while running the job", finished_at=utcnow())
+    )
+    requeued = session.exec(
+        update(LLMJob).where(*stale, LLMJob.attempts < max_attempts).values(status="queued")
+    )
+    session.commit()
+    return requeued.rowcount
@@ -0,0 +1,123 @@
+# app/repositories/problem_repo.py
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+from sqlmodel import Session, select
+
+from backend.images import NormalizedImage
+from backend.models.problem_models import Problem, TutoringSession
+from backend.repositories.timestamps import as_utc
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# -------------------------
+# Problem queries
+# -------------------------
+def get_problem_for_user(session: Session, problem_id: UUID, user_id: UUID) -> Optional[Problem]:
+    problem = session.get(Problem, problem_id)
+    if problem is None or problem.user_id != user_id:
+        return None
+    return problem
+
+
+def get_active_problem_id(session: Session, user_id: UUID) -> Optional[UUID]:
+    stmt = select(TutoringSession.active_problem_id).where(TutoringSession.user_id == user_id)
+    return session.exec(stmt).first()
+
+
+def create_problem(
+    session: Session, user_id: UUID, image: NormalizedImage, bank_problem_id: str | None = None
+) -> Problem:
+    """
+    Stores the normalized problem image and makes it the user's active problem.
+    """
+    problem = Problem(
+        user_id=user_id,
+        image_data=image.data,
+        image_mime=image.mime_type,
+        image_sha256=image.sha256,
+        image_width=image.width,
+        image_height=image.height,
+        bank_problem_id=bank_problem_id,
+    )
+    session.add(problem)
+    session.flush()
+
+    _touch_session(session, user_id, active_problem_id=problem.id)
+    session.commit()
+    session.refresh(problem)
+    return problem
+
+
+# -------------------------
+# Gemini file handle
+# -------------------------
+def has_fresh_gemini_file(problem: Problem, margin_s: float) -> bool:
+    """True if the uploaded file is still usable for at least margin_s seconds."""
+    if not problem.gemini_file_uri or problem.gemini_file_expires_at is None:
+        return False
+    return as_utc(problem.gemini_file_expires_at) - timedelta(seconds=margin_s) > utcnow()
+
+
+def set_gemini_file(
+    session: Session,
+    problem: Problem,
+    name: str,
+    uri: str,
+    expires_at: datetime,
+) -> None:
+    problem.gemini_file_name = name
+    problem.gemini_file_uri = uri
+    problem.gemini_file_expires_at = expires_at
+    session.add(problem)
+    session.commit()
+
+
+def record_solution(
+    session: Session,
+    problem: Problem,
+    solution: bytes,
+    verdict: str | None,
+    response_type: str | None,
+    message: str | None,
+) -> None:
+    problem.last_solution_data = solution
+    problem.last_verdict = verdict
+    problem.last_response_type = response_type
+    problem.last_message = message
+    problem.bank_hint_level = 0
+    session.add(problem)
+    session.commit()
+
+
+def record_bank_hint(session: Session, problem: Problem, solution: bytes, bank_hint_level: int) -> None:
+    """
+    A ladder rung was served for this canvas. Only the canvas (to tell
+    whether the next request changed it) and the rung count are stored; the
+    last verdict and message stay those of the last model answer.
+    """
+    problem.last_solution_data = solution
+    problem.bank_hint_level = bank_hint_level
+    session.add(problem)
+    session.commit()
+
+
+# -------------------------
+# Session (active problem)
+# -------------------------
+def _touch_session(session: Session, user_id: UUID, active_problem_id: UUID | None = None) -> TutoringSession:
+    stmt = select(TutoringSession).where(TutoringSession.user_id == user_id)
+    tutoring = session.exec(stmt).first()
+    if tutoring is None:
+        tutoring = TutoringSession(user_id=user_id)
+    if active_problem_id is not None:
+        tutoring.active_problem_id = active_problem_id
+    tutoring.last_active_at = utcnow()
+    session.add(tutoring)
+    return tutoring
@@ -0,0 +1,12 @@
+# app/repositories/timestamps.py
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+
+def as_utc(value: datetime) -> datetime:
+    """A stored timestamp as an aware UTC datetime.
+
+    SQLite (local load tests) drops the offset; stored values are UTC.
+    """
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
@@ -0,0 +1,82 @@
+# app/repositories/usage_repo.py
+from __future__ import annotations
+
+from datetime import date, datetime
+from uuid import UUID
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from backend.models.usage_models import DailyTokenUsage, RateLimitBucket
+from backend.repositories.timestamps import as_utc
+
+
+# -------------------------
+# Token buckets
+# -------------------------
+def take_token(
+    session: Session,
+    user_id: UUID,
+    bucket: str,
+    capacity: float,
+    refill_per_s: float,
+    now: datetime,
+) -> float:
+    """
+    Takes one token from the bucket inside a row lock.
+    Returns 0 on success, else the seconds until a token is available.
+    """
+    stmt = (
+        select(RateLimitBucket)
+        .where(RateLimitBucket.user_id == user_id, RateLimitBucket.bucket == bucket)
+        .with_for_update()
+    )
+    row = session.exec(stmt).first()
+    if row is None:
+        row = RateLimitBucket(user_id=user_id, bucket=bucket, tokens=capacity, updated_at=now)
+        session.add(row)
+        try:
+            session.flush()
+        except IntegrityError:
+            # Another worker created it first; lock and use theirs.
+            session.rollback()
+            row = session.exec(stmt).one()
+
+    elapsed = max((now - as_utc(row.updated_at)).total_seconds(), 0.0)
+    tokens = min(capacity, row.tokens + elapsed * refill_per_s)
+    retry_after = 0.0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        retry_after = (1 - tokens) / refill_per_s
+    row.tokens = tokens
+    row.updated_at = now
+    session.add(row)
+    session.commit()
+    return retry_after
+
+
+# -------------------------
+# Daily token usage
+# -------------------------
+def get_daily_usage(session: Session, user_id: UUID, day: date) -> int:
+    row = session.get(DailyTokenUsage, (user_id, day))
+    return row.tokens_used if row is not None else 0
+
+
+def add_daily_usage(session: Session, user_id: UUID, day: date, tokens: int) -> None:
+    """Atomic increment (INSERT ... ON CONFLICT DO UPDATE on Postgres and SQLite)."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    table = DailyTokenUsage.__table__
+    stmt = insert(table).values(user_id=user_id, day=day, tokens_used=tokens)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day],
+        set_={"tokens_used": table.c.tokens_used + tokens},
+    )
+    session.exec(stmt)
+    session.commit()
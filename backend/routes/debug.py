@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from backend.profiling import loop_watchdog, memory_report, profile_store, token_matches
+
+
+def require_profiling_token(x_profile_token: str | None = Header(default=None)) -> None:
+    if not token_matches(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_profiling_token)])
+
+
+@router.get("/profiles")
+def list_profiles():
+    """Recent request profiles, newest last (without their stacks)."""
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: int):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {k: v for k, v in profile.items() if k != "folded"}
+
+
+@router.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse)
+def get_profile_folded(profile_id: int):
+    """The profile as folded stacks, for flamegraph.pl or speedscope."""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return "".join(f"{stack} {count}\n" for stack, count in profile["folded"].items())
+
+
+@router.get("/loop-stalls")
+def get_loop_stalls():
+    """Recent callbacks that blocked the event loop, with its stack."""
+    return {"threshold_s": loop_watchdog.threshold_s, "stalls": loop_watchdog.recent()}
+
+
+@router.get("/memory")
+def get_memory(limit: int = Query(default=25, ge=1, le=500)):
+    """Top allocation sites, and their growth since the previous call."""
+    report = memory_report(limit)
+    if report is None:
+        raise HTTPException(status_code=409, detail="tracemalloc is off; set TRACEMALLOC_FRAMES")
+    return report
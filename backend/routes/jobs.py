@@ -0,0 +1,121 @@
+# app/routes/jobs.py
+from __future__ import annotations
+
+import asyncio
+from typing import Literal
+from uuid import UUID
+
+import orjson
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.auth.deps import get_current_user
+from backend.config import JOB_POLL_INTERVAL_S
+from backend.db import get_engine, get_session
+from backend.jobs import job_workers
+from backend.models.auth_models import User
+from backend.models.job_models import LLMJob
+from backend.repositories.job_repo import TERMINAL_STATUSES, create_job, get_job_for_user
+from backend.uploads import normalize_upload, read_image_upload
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# SSE comment sent while waiting so proxies keep the stream open.
+SSE_KEEPALIVE_S = 15.0
+
+
+def _job_out(job: LLMJob) -> dict:
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "mode": job.mode,
+        "regenerate": job.regenerate,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result": orjson.loads(job.result) if job.result else None,
+        "error": job.error,
+    }
+
+
+def _normalized(upload: UploadFile, field: str) -> bytes:
+    return normalize_upload(read_image_upload(upload, field), field).data
+
+
+@router.post("", status_code=202)
+def submit(
+    mode: Literal["hint", "check_solution", "reveal"] = Form(...),
+    sol_image: UploadFile = File(...),
+    problem_id: UUID | None = Form(None),
+    incremental: bool = Form(False),
+    regenerate: bool = Form(False),
+    prob_image: UploadFile | None = File(None),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """Queue a /query call (same fields, plus regenerate) and return its job id.
+
+    Meant for slow calls (regenerate with the pro model, reveal); poll
+    GET /jobs/{id} or stream GET /jobs/{id}/events for the result.
+    """
+    if (problem_id is None) == (prob_image is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of problem_id or prob_image")
+
+    sol_bytes = _normalized(sol_image, "sol_image")
+    prob_bytes = _normalized(prob_image, "prob_image") if prob_image is not None else None
+
+    job = create_job(session, user.id, mode, regenerate, incremental, problem_id, prob_bytes, sol_bytes)
+    job_workers.notify()
+    return {"job_id": str(job.id), "status": job.status}
+
+
+@router.get("/{job_id}")
+def get(
+    job_id: UUID,
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    job = get_job_for_user(session, job_id, user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_out(job)
+
+
+def _load_job_out(job_id: UUID, user_id: UUID) -> dict | None:
+    # A fresh session per poll so each read sees the worker's latest commit.
+    with Session(get_engine()) as session:
+        job = get_job_for_user(session, job_id, user_id)
+        return _job_out(job) if job is not None else None
+
+
+@router.get("/{job_id}/events")
+async def events(job_id: UUID, user: User = Depends(get_current_user)):
+    """Server-sent events: a "status" event on each change, then "result" and end."""
+    first = await run_in_threadpool(_load_job_out, job_id, user.id)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        out, last_status, idle = first, None, 0.0
+        while True:
+            if out["status"] != last_status:
+                last_status = out["status"]
+                yield b"event: status\ndata: " + orjson.dumps({"status": last_status}) + b"\n\n"
+                idle = 0.0
+            if last_status in TERMINAL_STATUSES:
+                yield b"event: result\ndata: " + orjson.dumps(out) + b"\n\n"
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL_S / 4)
+            idle += JOB_POLL_INTERVAL_S / 4
+            if idle >= SSE_KEEPALIVE_S:
+                yield b": keepalive\n\n"
+                idle = 0.0
+            out = await run_in_threadpool(_load_job_out, job_id, user.id) or out
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+
+from backend.metrics import metrics, record_pool_stats
+from backend.shadow import shadow
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+def get_metrics():
+    record_pool_stats()
+    return metrics.snapshot()
+
+
+@router.get("/metrics/shadow")
+def get_shadow_report():
+    """Agreement, latency and token statistics per shadow candidate."""
+    if shadow is None:
+        return {"enabled": False}
+    return {"enabled": True, **shadow.report()}
+
+
+@router.post("/metrics/reset")
+def reset_metrics():
+    metrics.reset()
+    return {"ok": True}
@@ -0,0 +1,88 @@
+# app/routes/problems.py
+from __future__ import annotations
+
+import logging
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from sqlmodel import Session
+
+from backend.auth.deps import get_current_user
+from backend.db import get_session
+from backend.llm import evict_problem_caches
+from backend.metrics import metrics
+from backend.models.auth_models import User
+from backend.models.problem_models import Problem
+from backend.preflight import problem_preflight
+from backend.problem_bank import problem_bank
+from backend.repositories.problem_repo import create_problem, get_active_problem_id, get_problem_for_user
+from backend.tutor import problem_image_part
+from backend.uploads import normalize_upload, read_image_upload
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/problems", tags=["problems"])
+
+
+def _problem_out(problem: Problem) -> dict:
+    return {
+        "problem_id": str(problem.id),
+        "status": problem.status,
+        "width": problem.image_width,
+        "height": problem.image_height,
+        "bank_problem_id": problem.bank_problem_id,
+        "created_at": problem.created_at.isoformat(),
+    }
+
+
+@router.post("")
+def create(
+    problem_image: UploadFile = File(...),
+    bank_id: str | None = Form(None, max_length=64),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """Store the problem the student is working on.
+
+    bank_id names a problem bank problem (e.g. picked from a textbook list);
+    without it the image is matched against the bank. The response's
+    bank_problem_id is the match, or null.
+    """
+    data = read_image_upload(problem_image, "problem_image")
+    image = normalize_upload(data, "problem_image")
+    reason = problem_preflight(image.quality)
+    if reason is not None:
+        metrics.incr(f"preflight_{reason}")
+        raise HTTPException(status_code=422, detail=f"Problem image is unreadable ({reason})")
+
+    bank_problem = None
+    if problem_bank is not None:
+        bank_problem = problem_bank.get(bank_id) or problem_bank.match(image.dhash)
+        metrics.incr("problem_bank_matched" if bank_problem is not None else "problem_bank_unmatched")
+
+    previous_id = get_active_problem_id(session, user.id)
+    problem = create_problem(session, user.id, image, bank_problem.id if bank_problem else None)
+    if previous_id is not None:
+        # The student moved on; free the old problem's context caches.
+        evict_problem_caches(previous_id)
+
+    # Upload now so the first hint does not pay for it; /query retries
+    # the upload if this fails or the file later expires.
+    try:
+        problem_image_part(session, problem)
+    except Exception:
+        logger.warning("Gemini upload for problem %s failed; deferring", problem.id, exc_info=True)
+
+    return {"problem_id": str(problem.id), "status": problem.status, "bank_problem_id": problem.bank_problem_id}
+
+
+@router.get("/{problem_id}")
+def get(
+    problem_id: UUID,
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    problem = get_problem_for_user(session, problem_id, user.id)
+    if problem is None:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    return _problem_out(problem)
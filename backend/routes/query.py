@@ -1,75 +1,330 @@
 from __future__ import annotations
 
-import json
-from io import BytesIO
-from pathlib import Path
-from typing import Literal
+import contextlib
+import hashlib
+from typing import Any, AsyncContextManager, Callable, Literal
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
-from PIL import Image, UnidentifiedImageError
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+from sqlmodel import Session
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
 from backend.auth.deps import get_current_user
-from backend.llm import call_model_with_retry
+from backend.config import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_S, QUERY_DEADLINE_S
+from backend.db import get_engine
+from backend.deadlines import CallCancelled, Cancellation, until_disconnected
+from backend.images import ImageQuality, sha256_hex
+from backend.interaction_log import Interaction, interaction_log
+from backend.llm import image_part
+from backend.metrics import metrics
+from backend.model_router import call_routed
+from backend.ratelimit import RateLimitExceeded, rate_limiter, retry_after_header
+from backend.scheduler import llm_scheduler, tenant_of
+from backend.shadow import ShadowCase, shadow
+from backend.tracing import span
 from backend.models.auth_models import User
+from backend.models.problem_models import Problem
+from backend.preflight import clarification, preflight
+from backend.problem_bank import ladder_rung, problem_bank
+from backend.repositories.problem_repo import record_bank_hint, record_solution
+from backend.singleflight import IdempotencyStore, SingleFlight
+from backend.tutor import ProblemImageUnavailable, ProblemNotFound, StoredStep, load_prompt, stored_problem_step
+from backend.uploads import normalize_upload, read_image_upload
 
 router = APIRouter(tags=["query"])
 
-PROMPT_PATH = Path(__file__).resolve().parents[1] / "prompt.txt"
+# Double taps and flaky-network resubmits of the same request share one
+# Gemini call; Idempotency-Key retries get the stored answer.
+_inflight: SingleFlight[bytes] = SingleFlight()
+_idempotent_results = IdempotencyStore(ttl_s=IDEMPOTENCY_TTL_S, max_entries=IDEMPOTENCY_MAX_ENTRIES)
 
 
-def _load_prompt() -> str:
-    try:
-        return PROMPT_PATH.read_text(encoding="utf-8")
-    except FileNotFoundError as exc:
-        raise HTTPException(status_code=500, detail="Prompt file not found") from exc
+def _one_off_parts(prob_bytes: bytes, sol_bytes: bytes) -> tuple[Any, Any, ImageQuality, ImageQuality, str]:
+    # Decoded and verified here, in a worker thread, rather than lazily
+    # inside the SDK call. Also returns both images' quality measures for the
+    # pre-flight checks and routing, and the problem's dHash for the bank.
+    prob = normalize_upload(prob_bytes, "prob_image")
+    sol = normalize_upload(sol_bytes, "sol_image")
+    return (
+        image_part(prob.data, prob.mime_type),
+        image_part(sol.data, sol.mime_type),
+        prob.quality,
+        sol.quality,
+        prob.dhash,
+    )
 
 
-def _to_pil_image(upload: UploadFile, data: bytes) -> Image.Image:
-    try:
-        return Image.open(BytesIO(data))
-    except UnidentifiedImageError as exc:
-        raise HTTPException(
-            status_code=422,
-            detail=f"Invalid image uploaded for field '{upload.filename}'",
-        ) from exc
+def _stored_step(
+    problem_id: UUID, user_id: UUID, sol_bytes: bytes, mode: str, incremental: bool
+) -> StoredStep:
+    """stored_problem_step() for an uploaded canvas, with its errors mapped to HTTP responses.
+
+    Runs in a session of its own, closed before the model call so no pooled
+    connection is held while Gemini answers; the step's problem stays
+    readable (expire_on_commit=False) once detached.
+    """
+    solution = normalize_upload(sol_bytes, "sol_image")
+    with Session(get_engine(), expire_on_commit=False) as session:
+        try:
+            return stored_problem_step(session, problem_id, user_id, solution, mode, incremental)
+        except ProblemNotFound as exc:
+            raise HTTPException(status_code=404, detail=str(exc)) from exc
+        except ProblemImageUnavailable as exc:
+            raise HTTPException(status_code=502, detail=str(exc)) from exc
+
+
+def _save(record: Callable[..., None], problem: Problem, *args: Any) -> None:
+    """A problem_repo record_* call on a step's (detached) problem, in a short session."""
+    with Session(get_engine()) as session:
+        record(session, problem, *args)
+
+
+def _llm_slot(tenant: str, mode: str, cancellation: Cancellation) -> AsyncContextManager[None]:
+    if llm_scheduler is None:
+        return contextlib.nullcontext()
+    return llm_scheduler.slot(tenant, mode, False, cancellation)
+
+
+def _request_hash(
+    user_id: UUID,
+    mode: str,
+    problem_id: UUID | None,
+    incremental: bool,
+    prob_sha256: str | None,
+    sol_sha256: str,
+) -> str:
+    h = hashlib.sha256()
+    h.update(f"{user_id}|{mode}|{problem_id}|{incremental}|{prob_sha256 or ''}|{sol_sha256}".encode())
+    return h.hexdigest()
 
 
 @router.post("/query")
 async def query(
+    request: Request,
     mode: Literal["hint", "check_solution", "reveal"] = Form(...),
-    prob_image: UploadFile = File(...),
     sol_image: UploadFile = File(...),
-    _: User = Depends(get_current_user),
+    problem_id: UUID | None = Form(None),
+    incremental: bool = Form(False),
+    prob_image: UploadFile | None = File(None),
+    idempotency_key: str | None = Header(None, max_length=255),
+    x_request_timeout: float | None = Header(None, gt=0),
+    user: User = Depends(get_current_user),
 ):
-    prompt = _load_prompt()
+    """Ask the tutor about a solution image.
+
+    Pass problem_id (from POST /problems) to reuse the stored problem image;
+    prob_image is still accepted for one-off calls. With problem_id,
+    incremental=true sends only what was added since the last check.
 
-    prob_bytes = await prob_image.read()
-    sol_bytes = await sol_image.read()
+    Model calls are limited per user and mode (429 with Retry-After), and by
+    a daily Gemini token budget. Identical concurrent requests from a user are
+    answered by one model call.
+    With an Idempotency-Key header, a repeat of a completed request returns the
+    stored answer (Idempotent-Replayed: true) instead of generating again.
 
-    if not prob_bytes or not sol_bytes:
-        raise HTTPException(status_code=422, detail="Both images are required")
+    A hint on a problem bank problem (backend.problem_bank) is answered from
+    its reviewed ladder while the canvas is blank or unchanged since the last
+    rung; asking again without writing anything gets the next rung.
 
-    prob_pil = _to_pil_image(prob_image, prob_bytes)
-    sol_pil = _to_pil_image(sol_image, sol_bytes)
+    The model call is given QUERY_DEADLINE_S, or X-Request-Timeout seconds if
+    shorter (504 when it runs out), and is stopped if the client disconnects.
+    """
+    if (problem_id is None) == (prob_image is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of problem_id or prob_image")
 
     try:
-        result = call_model_with_retry(
-            prompt=prompt,
-            prob_image=prob_pil,
-            sol_image=sol_pil,
+        prompt = load_prompt()
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=500, detail="Prompt file not found") from exc
+
+    sol_bytes = await run_in_threadpool(read_image_upload, sol_image, "sol_image")
+    prob_bytes = None
+    if prob_image is not None:
+        prob_bytes = await run_in_threadpool(read_image_upload, prob_image, "prob_image")
+
+    sol_sha256 = sha256_hex(sol_bytes)
+    prob_sha256 = sha256_hex(prob_bytes) if prob_bytes is not None else None
+    request_hash = _request_hash(user.id, mode, problem_id, incremental, prob_sha256, sol_sha256)
+    scoped_key = f"{user.id}:{idempotency_key}" if idempotency_key else None
+    if scoped_key is not None:
+        stored = _idempotent_results.get(scoped_key)
+        if stored is not None:
+            if stored.request_hash != request_hash:
+                raise HTTPException(
+                    status_code=422, detail="Idempotency-Key was already used for a different request"
+                )
+            metrics.incr("query_idempotent_replay")
+            return Response(
+                content=stored.payload, media_type="application/json", headers={"Idempotent-Replayed": "true"}
+            )
+
+    shadow_case: ShadowCase | None = None
+    # The shared call below can outlive this request (it may disconnect while
+    # others wait on the call), so it gets plain values rather than this
+    # request's user, and short sessions of its own around the model call.
+    user_id, tenant = user.id, tenant_of(user)
+
+    async def answer() -> bytes:
+        nonlocal shadow_case
+        step = None
+        with span("query.prepare"):
+            if problem_id is not None:
+                step = await run_in_threadpool(
+                    _stored_step, problem_id, user_id, sol_bytes, mode, incremental
+                )
+                prob_part, sol_part = step.prob_part, step.sol_part
+                prob_quality, sol_quality = None, step.solution.quality
+                bank_problem = problem_bank.get(step.problem.bank_problem_id) if problem_bank else None
+            else:
+                prob_part, sol_part, prob_quality, sol_quality, prob_dhash = await run_in_threadpool(
+                    _one_off_parts, prob_bytes, sol_bytes
+                )
+                bank_problem = problem_bank.match(prob_dhash) if problem_bank else None
+
+        interaction = Interaction(
+            user_id=user_id,
+            problem_id=problem_id,
             mode=mode,
+            incremental=incremental,
+            regenerate=False,
+            sol_image_sha256=sol_sha256,
+            prob_image_sha256=step.problem.image_sha256 if step else prob_sha256,
+            sol_quality=sol_quality,
         )
-    except Exception as exc:
-        raise HTTPException(status_code=502, detail=f"LLM request failed: {exc}") from exc
 
-    if not result:
-        raise HTTPException(status_code=502, detail="LLM request failed")
+        def log(error: str | None = None) -> None:
+            if interaction_log is not None:
+                interaction.error = error
+                interaction_log.record(interaction)
+
+        if bank_problem is not None and mode == "hint":
+            same_canvas = step is not None and step.problem.last_solution_data == step.solution.data
+            level = step.problem.bank_hint_level if step else 0
+            rung = ladder_rung(bank_problem, level, sol_quality, same_canvas)
+            if rung is not None:
+                # Nothing new on the canvas: the next reviewed hint, without the model.
+                parsed = bank_problem.hint(rung)
+                interaction.with_bank_hint(parsed)
+                log()
+                metrics.incr("problem_bank_hint")
+                if step is not None:
+                    with span("db.record_bank_hint"):
+                        await run_in_threadpool(
+                            _save, record_bank_hint, step.problem, step.solution.data, rung + 1
+                        )
+                return parsed.model_dump_json().encode()
+            metrics.incr("problem_bank_fallback")
+
+        note = step.note if step else None
+        if bank_problem is not None and mode != "reveal":
+            note = "\n\n".join(filter(None, (note, bank_problem.note())))
+
+        reason = preflight(mode, sol_quality, prob_quality)
+        if reason is not None:
+            # A blank or unreadable image: the clarification Gemini would
+            # ask for, without the call.
+            parsed = clarification(reason)
+            interaction.with_preflight(reason, parsed)
+            log()
+            return parsed.model_dump_json().encode()
 
-    resp_text = result[0] if isinstance(result, tuple) else result
+        # Only a model call takes from the rate limits: coalesced and replayed
+        # requests never get here, and bank and pre-flight answers return above.
+        if rate_limiter is not None:
+            try:
+                await run_in_threadpool(rate_limiter.acquire, user_id, mode)
+            except RateLimitExceeded as exc:
+                raise HTTPException(
+                    status_code=429, detail=exc.reason, headers=retry_after_header(exc)
+                ) from exc
+
+        try:
+            with span("query.llm", mode=mode):
+                async with _llm_slot(tenant, mode, cancellation):
+                    # Blocking SDK call(s); the worker thread keeps the event loop
+                    # free for the requests coalescing onto this one.
+                    routed = await run_in_threadpool(
+                        call_routed,
+                        prompt=prompt,
+                        prob_image=prob_part,
+                        sol_image=sol_part,
+                        mode=mode,
+                        sol_quality=sol_quality,
+                        prior_verdict=step.problem.last_verdict if step else None,
+                        problem_cache_key=step.cache_key if step else None,
+                        note=note,
+                        cancellation=cancellation,
+                    )
+        except CallCancelled as exc:
+            log(error=str(exc))
+            raise
+        except Exception as exc:
+            log(error=str(exc))
+            raise HTTPException(status_code=502, detail=f"LLM request failed: {exc}") from exc
+
+        result = routed.result
+        if rate_limiter is not None:
+            await run_in_threadpool(rate_limiter.record_tokens, user_id, result[11])
+
+        # The answer was parsed and checked against the response schema in
+        # one pydantic-core pass, then by the output guard; the model's JSON
+        # is sent on as it came unless the guard repaired it.
+        parsed = routed.parsed
+        interaction.with_result(result, parsed)
+        if parsed is None:
+            log(error=routed.error)
+            raise HTTPException(status_code=502, detail=f"Model returned {routed.error}")
+        log()
+
+        if shadow is not None and shadow.sample():
+            shadow_case = ShadowCase(
+                prompt=prompt,
+                prob_image=prob_part,
+                sol_image=sol_part,
+                mode=mode,
+                note=note,
+                verdict=parsed.verdict,
+                response_type=parsed.response_type,
+                model=result[5],
+                latency_s=result[7],
+                tokens_total=result[11] or 0,
+            )
+
+        if step is not None:
+            # Baseline for the next incremental check.
+            with span("db.record_solution"):
+                await run_in_threadpool(
+                    _save,
+                    record_solution,
+                    step.problem,
+                    step.solution.data,
+                    parsed.verdict,
+                    parsed.response_type,
+                    parsed.message_is,
+                )
+        return routed.body()
+
+    # Requests coalescing onto this one share its call, and so its deadline;
+    # the call is stopped once none of them is still waiting.
+    cancellation = Cancellation(min(x_request_timeout or QUERY_DEADLINE_S, QUERY_DEADLINE_S))
     try:
-        payload = json.loads(resp_text)
-    except json.JSONDecodeError as exc:
-        raise HTTPException(status_code=502, detail=f"Model returned invalid JSON: {exc}") from exc
+        body, shared = await until_disconnected(
+            request,
+            _inflight.do(request_hash, answer, on_abandoned=lambda: cancellation.cancel("disconnected")),
+            cancellation,
+        )
+    except CallCancelled as exc:
+        if exc.reason == "deadline":
+            raise HTTPException(status_code=504, detail="LLM request timed out") from exc
+        # Nobody is left to read this; 499 is what the access log shows.
+        raise HTTPException(status_code=499, detail="Client closed request") from exc
+    if shared:
+        metrics.incr("query_coalesced")
+    if scoped_key is not None:
+        _idempotent_results.put(scoped_key, request_hash, body)
 
-    return JSONResponse(content=payload)
+    # Replayed against the shadow candidates once the response is sent.
+    background = BackgroundTask(shadow.submit, shadow_case) if shadow_case is not None else None
+    return Response(content=body, media_type="application/json", background=background)
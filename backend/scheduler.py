@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator
+
+from backend.config import (
+    LLM_BATCH_MAX_CONCURRENCY,
+    LLM_BATCH_MAX_WAIT_S,
+    LLM_CALL_COSTS,
+    LLM_MAX_CONCURRENCY,
+    LLM_TENANT,
+)
+from backend.metrics import metrics
+
+if TYPE_CHECKING:
+    from backend.deadlines import Cancellation
+    from backend.models.auth_models import User
+
+# Tutor calls that arrive while LLM_MAX_CONCURRENCY are running wait here.
+# Interactive hint/check_solution calls are served before queued reveal and
+# regenerate ("batch") calls, and within a lane each tenant gets an equal
+# share of the slots however many calls it queues, so one class doing its
+# homework at once cannot crowd out everyone else.
+
+# How often a queued call with a cancellation checks it.
+CANCEL_POLL_S = 0.25
+# Idle tenants' finish tags are dropped once a lane holds this many.
+TENANT_SWEEP_THRESHOLD = 10_000
+
+
+def lane_for(mode: str, regenerate: bool) -> str:
+    return "batch" if regenerate or mode == "reveal" else "interactive"
+
+
+def tenant_of(user: User) -> str:
+    """The fair-share unit: the user, or with LLM_TENANT=domain their school's
+    email domain."""
+    if LLM_TENANT == "domain":
+        return user.email.rpartition("@")[2].lower()
+    return str(user.id)
+
+
+def parse_costs(value: str) -> dict[str, float]:
+    """Parse "mode=cost,..." (e.g. "reveal=3") into relative call costs."""
+    costs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, cost = item.partition("=")
+        costs[name.strip()] = float(cost)
+    return costs
+
+
+@dataclass(eq=False)
+class _Waiter:
+    lane: str
+    start: float
+    seq: int
+    enqueued_at: float
+    wake: Callable[[], None]
+    granted: bool = False
+    abandoned: bool = False
+
+    def __lt__(self, other: _Waiter) -> bool:
+        return (self.start, self.seq) < (other.start, other.seq)
+
+
+@dataclass
+class _Lane:
+    name: str
+    max_running: int
+    running: int = 0
+    depth: int = 0
+    # Start-time fair queuing: a call's start tag is the later of the lane's
+    # virtual time and its tenant's last finish tag, and calls run in start
+    # tag order. A tenant with many queued calls has ever later tags, while
+    # one that was idle starts at the current virtual time, without credit.
+    virtual_time: float = 0.0
+    finish: dict[str, float] = field(default_factory=dict)
+    heap: list[_Waiter] = field(default_factory=list)
+
+    def head(self) -> _Waiter | None:
+        while self.heap and self.heap[0].abandoned:
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else None
+
+
+class LLMScheduler:
+    """Admission of tutor calls: at most `slots` run at once per process.
+
+    Free slots go to the interactive lane first. The batch lane is capped at
+    batch_slots so interactive calls always find room soon, and a batch call
+    that has waited batch_max_wait_s goes ahead of interactive ones so it
+    is not starved. costs weights a call by mode in its tenant's share.
+
+    Both can give up on a Cancellation while queued: slot() is for the
+    event loop, slot_sync() blocks a worker thread.
+    """
+
+    def __init__(self, slots: int, batch_slots: int, batch_max_wait_s: float, costs: dict[str, float]) -> None:
+        self.slots = slots
+        self.batch_max_wait_s = batch_max_wait_s
+        self.costs = costs
+        self._lock = threading.Lock()
+        self._lanes = {
+            "interactive": _Lane("interactive", slots),
+            "batch": _Lane("batch", max(1, min(batch_slots, slots))),
+        }
+        self._running = 0
+        self._seq = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self, tenant: str, mode: str, regenerate: bool, cancellation: Cancellation | None = None
+    ) -> AsyncIterator[None]:
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        waiter = self._enqueue(tenant, mode, regenerate, lambda: loop.call_soon_threadsafe(granted.set))
+        try:
+            while not granted.is_set():
+                if cancellation is None:
+                    await granted.wait()
+                    break
+                cancellation.check()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(granted.wait(), timeout=min(cancellation.remaining(), CANCEL_POLL_S))
+            yield
+        finally:
+            self._done(waiter)
+
+    @contextlib.contextmanager
+    def slot_sync(
+        self, tenant: str, mode: str, regenerate: bool, cancellation: Cancellation | None = None
+    ) -> Iterator[None]:
+        granted = threading.Event()
+        waiter = self._enqueue(tenant, mode, regenerate, granted.set)
+        try:
+            while not granted.is_set():
+                if cancellation is None:
+                    granted.wait()
+                    break
+                cancellation.check()
+                granted.wait(min(cancellation.remaining(), CANCEL_POLL_S))
+            yield
+        finally:
+            self._done(waiter)
+
+    def _enqueue(self, tenant: str, mode: str, regenerate: bool, wake: Callable[[], None]) -> _Waiter:
+        with self._lock:
+            lane = self._lanes[lane_for(mode, regenerate)]
+            start = max(lane.virtual_time, lane.finish.get(tenant, 0.0))
+            lane.finish[tenant] = start + self.costs.get(mode, 1.0)
+            if len(lane.finish) > TENANT_SWEEP_THRESHOLD:
+                lane.finish = {t: f for t, f in lane.finish.items() if f > lane.virtual_time}
+            waiter = _Waiter(lane.name, start, next(self._seq), time.monotonic(), wake)
+            heapq.heappush(lane.heap, waiter)
+            lane.depth += 1
+            metrics.set_gauge(f"llm_queue_depth_{lane.name}", lane.depth)
+            self._dispatch()
+            return waiter
+
+    def _done(self, waiter: _Waiter) -> None:
+        with self._lock:
+            lane = self._lanes[waiter.lane]
+            if waiter.granted:
+                lane.running -= 1
+                self._running -= 1
+                metrics.set_gauge("llm_slots_busy", self._running)
+                self._dispatch()
+            else:
+                # Cancelled while queued; skipped when it reaches the head.
+                waiter.abandoned = True
+                lane.depth -= 1
+                metrics.set_gauge(f"llm_queue_depth_{lane.name}", lane.depth)
+                metrics.incr(f"llm_queue_abandoned_{lane.name}")
+
+    def _next(self) -> _Waiter | None:
+        if self._running >= self.slots:
+            return None
+        interactive, batch = self._lanes["interactive"], self._lanes["batch"]
+        first = interactive.head()
+        queued_batch = batch.head() if batch.running < batch.max_running else None
+        if queued_batch is not None and (
+            first is None or time.monotonic() - queued_batch.enqueued_at >= self.batch_max_wait_s
+        ):
+            return queued_batch
+        return first
+
+    def _dispatch(self) -> None:
+        # Called with the lock held.
+        while (waiter := self._next()) is not None:
+            lane = self._lanes[waiter.lane]
+            heapq.heappop(lane.heap)
+            lane.depth -= 1
+            lane.running += 1
+            self._running += 1
+            lane.virtual_time = max(lane.virtual_time, waiter.start)
+            waiter.granted = True
+            metrics.set_gauge(f"llm_queue_depth_{lane.name}", lane.depth)
+            metrics.set_gauge("llm_slots_busy", self._running)
+            metrics.observe(f"llm_queue_wait_s_{lane.name}", time.monotonic() - waiter.enqueued_at)
+            waiter.wake()
+
+
+def _build_scheduler() -> LLMScheduler | None:
+    if LLM_MAX_CONCURRENCY <= 0:
+        return None
+    return LLMScheduler(
+        LLM_MAX_CONCURRENCY, LLM_BATCH_MAX_CONCURRENCY, LLM_BATCH_MAX_WAIT_S, parse_costs(LLM_CALL_COSTS)
+    )
+
+
+llm_scheduler = _build_scheduler()
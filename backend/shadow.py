@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from backend.config import (
+    SHADOW_CANDIDATES,
+    SHADOW_DAILY_TOKEN_BUDGET,
+    SHADOW_MAX_CONCURRENCY,
+    SHADOW_MAX_PENDING,
+    SHADOW_SAMPLE_RATE,
+)
+from backend.llm import call_model_with_retry
+from backend.metrics import metrics
+from backend.ratelimit import utc_today
+from backend.structured_output import parse_response
+
+logger = logging.getLogger(__name__)
+
+# Shadow evaluation of candidate prompts and models on live /query traffic.
+# A sample of answered calls is replayed against each candidate once the
+# student's response has been sent, and the candidate's verdict compared with
+# the one the student got. Nothing from a shadow call reaches the student or
+# their problem; shadow calls have their own workers and daily token budget,
+# so they take no capacity from real requests.
+
+PROMPT_DIR = Path(__file__).resolve().parent
+
+
+@dataclass(frozen=True)
+class Candidate:
+    name: str
+    prompt: str | None  # None: the production prompt
+    model: str | None  # None: the model the production call used
+
+
+def parse_candidates(value: str, base_dir: Path = PROMPT_DIR) -> list[Candidate]:
+    """Parse "name=prompt_file@model,..." (prompt_file relative to backend/).
+
+    Either part may be left out: "v2=prompts/v2.txt" tries a prompt on the
+    production model, "pro=@gemini-3-pro-preview" a model with the
+    production prompt.
+    """
+    candidates = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, spec = item.partition("=")
+        prompt_file, _, model = spec.partition("@")
+        if not sep or not name.strip() or not (prompt_file.strip() or model.strip()):
+            raise ValueError(f"Invalid SHADOW_CANDIDATES entry {item!r}: expected name=prompt_file@model")
+        prompt = (base_dir / prompt_file.strip()).read_text(encoding="utf-8") if prompt_file.strip() else None
+        candidates.append(Candidate(name.strip(), prompt, model.strip() or None))
+    return candidates
+
+
+@dataclass
+class ShadowCase:
+    """A production /query call and its answer, to replay."""
+
+    prompt: str
+    prob_image: Any
+    sol_image: Any
+    mode: str
+    note: str | None
+    verdict: str
+    response_type: str
+    model: str
+    latency_s: float
+    tokens_total: int
+
+
+@dataclass
+class CandidateStats:
+    calls: int = 0
+    errors: int = 0
+    agree: int = 0
+    response_type_agree: int = 0
+    # (production verdict, candidate verdict) -> calls
+    verdicts: Counter = field(default_factory=Counter)
+    latency_s: float = 0.0
+    production_latency_s: float = 0.0
+    tokens_total: int = 0
+    production_tokens_total: int = 0
+
+    def summary(self) -> dict[str, Any]:
+        answered = self.calls - self.errors
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "agreement": round(self.agree / answered, 4) if answered else None,
+            "response_type_agreement": round(self.response_type_agree / answered, 4) if answered else None,
+            "verdicts": {f"{prod}->{cand}": n for (prod, cand), n in sorted(self.verdicts.items())},
+            "mean_latency_s": round(self.latency_s / self.calls, 3) if self.calls else None,
+            "production_mean_latency_s": round(self.production_latency_s / self.calls, 3) if self.calls else None,
+            "mean_tokens_total": round(self.tokens_total / self.calls, 1) if self.calls else None,
+            "production_mean_tokens_total": round(self.production_tokens_total / self.calls, 1)
+            if self.calls
+            else None,
+        }
+
+
+class ShadowEvaluator:
+    """Replays sampled /query calls against candidates, off the request path.
+
+    sample() decides per call; submit() only enqueues (at most max_pending
+    cases, the rest are dropped) and is meant to run after the response is
+    sent. max_concurrency workers run the shadow calls, one attempt each, until
+    today's shadow tokens reach daily_token_budget.
+    """
+
+    def __init__(
+        self,
+        candidates: list[Candidate],
+        sample_rate: float,
+        max_concurrency: int,
+        max_pending: int,
+        daily_token_budget: int,
+    ) -> None:
+        self.candidates = candidates
+        self.sample_rate = sample_rate
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.daily_token_budget = daily_token_budget
+        self._lock = threading.Lock()
+        self._stats = {candidate.name: CandidateStats() for candidate in candidates}
+        self._usage_day: date | None = None
+        self._tokens_today = 0
+        self._queue: asyncio.Queue[ShadowCase] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def _budget_left(self) -> bool:
+        with self._lock:
+            if self._usage_day != utc_today():
+                self._usage_day, self._tokens_today = utc_today(), 0
+            return self.daily_token_budget <= 0 or self._tokens_today < self.daily_token_budget
+
+    def sample(self) -> bool:
+        return random.random() < self.sample_rate and self._budget_left()
+
+    async def submit(self, case: ShadowCase) -> None:
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(case)
+        except asyncio.QueueFull:
+            metrics.incr("shadow_dropped")
+
+    def report(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "tokens_today": self._tokens_today,
+                "daily_token_budget": self.daily_token_budget,
+                "candidates": {name: stats.summary() for name, stats in self._stats.items()},
+            }
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self) -> None:
+        # Pending cases are dropped; they only ever feed the statistics.
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def _worker(self) -> None:
+        while True:
+            case = await self._queue.get()
+            for candidate in self.candidates:
+                if not self._budget_left():
+                    metrics.incr("shadow_budget_exhausted")
+                    break
+                try:
+                    await run_in_threadpool(self.run, candidate, case)
+                except Exception:
+                    logger.exception("Shadow call for candidate %s failed", candidate.name)
+
+    def run(self, candidate: Candidate, case: ShadowCase) -> None:
+        """One shadow call and its comparison. Blocking."""
+        t0 = time.perf_counter()
+        try:
+            result = call_model_with_retry(
+                prompt=candidate.prompt or case.prompt,
+                prob_image=case.prob_image,
+                sol_image=case.sol_image,
+                mode=case.mode,
+                max_retries=1,
+                note=case.note,
+                model=candidate.model or case.model,
+            )
+        except Exception as exc:
+            logger.warning("Shadow call for candidate %s failed: %s", candidate.name, exc)
+            result = None
+        parsed = parse_response(result[0]).response if result is not None else None
+        tokens = (result[11] or 0) if result is not None else 0
+
+        with self._lock:
+            self._tokens_today += tokens
+            stats = self._stats[candidate.name]
+            stats.calls += 1
+            stats.latency_s += time.perf_counter() - t0
+            stats.production_latency_s += case.latency_s
+            stats.tokens_total += tokens
+            stats.production_tokens_total += case.tokens_total
+            if parsed is None:
+                stats.errors += 1
+            else:
+                stats.agree += parsed.verdict == case.verdict
+                stats.response_type_agree += parsed.response_type == case.response_type
+                stats.verdicts[(case.verdict, parsed.verdict)] += 1
+        if parsed is None:
+            metrics.incr(f"shadow_{candidate.name}_error")
+        else:
+            metrics.incr(f"shadow_{candidate.name}_{'agree' if parsed.verdict == case.verdict else 'disagree'}")
+
+
+def _build_shadow() -> ShadowEvaluator | None:
+    candidates = parse_candidates(SHADOW_CANDIDATES)
+    if not candidates or SHADOW_SAMPLE_RATE <= 0:
+        return None
+    return ShadowEvaluator(
+        candidates, SHADOW_SAMPLE_RATE, SHADOW_MAX_CONCURRENCY, SHADOW_MAX_PENDING, SHADOW_DAILY_TOKEN_BUDGET
+    )
+
+
+shadow = _build_shadow()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Flight(Generic[T]):
+    task: asyncio.Task[T]
+    on_abandoned: Callable[[], None] | None
+    waiters: int = 0
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls that share a key onto one asyncio task.
+
+    The first caller starts the work; callers arriving while it runs await the
+    same task and get the same result (or exception). The task is shielded,
+    so a caller that disconnects does not cancel the work for the others;
+    when every caller has gone before it finished, the first caller's
+    on_abandoned() is called so the work can be stopped.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, _Flight[T]] = {}
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[T]], on_abandoned: Callable[[], None] | None = None
+    ) -> tuple[T, bool]:
+        """Run fn() once per key at a time; returns (result, shared)."""
+        flight = self._inflight.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()), on_abandoned)
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda t: self._forget(key, t))
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done() and flight.on_abandoned is not None:
+                flight.on_abandoned()
+
+    def _forget(self, key: str, task: asyncio.Task[T]) -> None:
+        flight = self._inflight.get(key)
+        if flight is not None and flight.task is task:
+            del self._inflight[key]
+        # Mark the exception retrieved even if every waiter went away.
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+@dataclass
+class StoredResult:
+    request_hash: str
+    payload: Any
+    expires_at: float  # time.monotonic() deadline
+
+
+class IdempotencyStore:
+    """Bounded in-process store of completed results by Idempotency-Key."""
+
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, StoredResult] = OrderedDict()
+
+    def get(self, key: str) -> StoredResult | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry
+
+    def put(self, key: str, request_hash: str, payload: Any) -> None:
+        with self._lock:
+            self._entries[key] = StoredResult(
+                request_hash=request_hash,
+                payload=payload,
+                expires_at=time.monotonic() + self.ttl_s,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
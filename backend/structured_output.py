@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+
+from pydantic import ValidationError
+
+from backend.llm import LLMResponse
+
+# Tolerant parsing of the model's JSON answer. Gemini's structured output is
+# almost always valid; when it is not, the usual defects are a code fence
+# around it, a trailing comma, a raw newline inside a string or an answer cut
+# off mid-string (token limit, dropped stream). Repairing those locally keeps
+# the answer; at worst a cut-off message can be finished with a short
+# text-only call (llm.call_continuation) instead of resending the images.
+
+FIELDS = tuple(LLMResponse.model_fields)
+
+_FENCE = re.compile(r"\A```[a-zA-Z]*\s*(.*?)\s*(?:```\s*)?\Z", re.DOTALL)
+
+
+@dataclass(frozen=True)
+class ParsedOutput:
+    """What could be recovered from a model answer.
+
+    response is set when the answer (possibly repaired) validates. fields
+    holds the string fields read in full from a malformed answer (empty for
+    a clean one); cut_field/cut_value are the field whose value was cut off
+    and the text it got so far. repairs names the defects that were fixed.
+    """
+
+    response: LLMResponse | None
+    fields: dict[str, str]
+    repairs: tuple[str, ...] = ()
+    cut_field: str | None = None
+    cut_value: str = ""
+
+    @property
+    def missing(self) -> tuple[str, ...]:
+        return tuple(name for name in FIELDS if name not in self.fields)
+
+
+def parse_response(text: str) -> ParsedOutput:
+    """Validate text as an LLMResponse, repairing malformed JSON if needed."""
+    try:
+        return ParsedOutput(LLMResponse.model_validate_json(text), {})
+    except ValidationError:
+        pass
+
+    repaired = repair_json(text)
+    if repaired is None:
+        return ParsedOutput(None, {}, ("no JSON object",))
+    data_text, repairs, cut_key = repaired
+    try:
+        data = json.loads(data_text)
+    except ValueError:
+        return ParsedOutput(None, {}, (*repairs, "unparseable"))
+    if not isinstance(data, dict):
+        return ParsedOutput(None, {}, (*repairs, "not an object"))
+
+    fields = {name: value for name, value in data.items() if name in FIELDS and isinstance(value, str)}
+    cut_value = ""
+    if cut_key in fields:
+        cut_value = fields.pop(cut_key)
+    else:
+        cut_key = None
+    response = None
+    if cut_key is None and not any(name not in fields for name in FIELDS):
+        response = LLMResponse(**fields)
+    return ParsedOutput(response, fields, tuple(repairs), cut_key, cut_value)
+
+
+def repair_json(text: str) -> tuple[str, list[str], str | None] | None:
+    """Turn an almost-JSON object into JSON.
+
+    Returns (json text, repairs, cut key): cut key is the top-level key whose
+    string value was unterminated and has been closed. Incomplete trailing
+    members are dropped and open brackets closed. None if there is no "{".
+    """
+    repairs: list[str] = []
+    text = text.strip()
+    fenced = _FENCE.match(text)
+    if fenced is not None:
+        text = fenced.group(1)
+        repairs.append("code fence")
+    start = text.find("{")
+    if start < 0:
+        return None
+    if start > 0:
+        repairs.append("leading text")
+
+    out: list[str] = []
+    stack: list[str] = []
+    in_string = escape = False
+    string_start = 0
+    # Top-level member state: "key", "colon", "value" or "comma".
+    expect = "key"
+    member_start = 0
+    key: str | None = None
+    end = len(text)
+
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+                if len(stack) == 1:
+                    if expect == "key":
+                        key = _decode(out[string_start:] + ['"'])
+                        expect = "colon"
+                    elif expect == "value":
+                        expect = "comma"
+            elif c in "\n\r\t":
+                out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}[c])
+                if "control character" not in repairs:
+                    repairs.append("control character")
+                continue
+            out.append(c)
+            continue
+
+        if c == '"':
+            in_string = True
+            string_start = len(out)
+        elif c in "{[":
+            if len(stack) == 1 and expect == "value":
+                expect = "comma"
+            stack.append("}" if c == "{" else "]")
+            if len(stack) == 1:
+                member_start = len(out) + 1
+        elif c in "}]":
+            if _drop_trailing_comma(out):
+                repairs.append("trailing comma")
+            out.append(stack.pop())
+            if not stack:
+                end = i + 1
+                break
+            continue
+        elif c == ",":
+            if len(stack) == 1:
+                expect = "key"
+                member_start = len(out) + 1
+        elif c == ":":
+            if len(stack) == 1 and expect == "colon":
+                expect = "value"
+        elif not c.isspace() and len(stack) == 1 and expect == "value":
+            expect = "comma"
+        out.append(c)
+
+    if text[end:].strip():
+        repairs.append("trailing text")
+    if not stack:
+        return "".join(out), repairs, None
+
+    # Cut off: close what is open, dropping a member that has no value yet.
+    cut_key = None
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+        if len(stack) == 1 and expect == "value":
+            cut_key = key
+            expect = "comma"
+    if len(stack) == 1 and expect != "comma":
+        del out[member_start:]
+    _drop_trailing_comma(out)
+    while stack:
+        out.append(stack.pop())
+    repairs.append("truncated")
+    return "".join(out), repairs, cut_key
+
+
+def _decode(chars: list[str]) -> str | None:
+    try:
+        return json.loads("".join(chars))
+    except ValueError:
+        return None
+
+
+def _drop_trailing_comma(out: list[str]) -> bool:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i:]
+        return True
+    return False
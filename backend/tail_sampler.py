@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import random
+import threading
+from collections import OrderedDict, defaultdict, deque
+from typing import Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, SynchronousMultiSpanProcessor, TracerProvider
+from opentelemetry.trace import StatusCode
+
+from backend.metrics import metrics
+
+# Imported only when tracing is on (see backend.tracing): the OpenTelemetry
+# SDK is slow to import.
+
+# Root span durations kept per root name for the slow-trace threshold, and
+# how many are needed before it applies.
+SLOW_WINDOW = 500
+SLOW_MIN_SAMPLES = 50
+SLOW_PERCENTILE = 0.95
+
+
+class TailSampler(SpanProcessor):
+    """Holds a trace's spans until its root span ends, then exports or drops it.
+
+    A trace is kept if keep() was called for it (e.g. on a Gemini retry), if
+    any span ended with an error status, if the root took longer than the
+    rolling p95 of roots with its name, or else with probability
+    sample_rate. Spans ending after their trace was decided follow the
+    decision. At most max_buffered undecided traces are held; the oldest are
+    dropped beyond that.
+    """
+
+    def __init__(self, delegate: SpanProcessor, sample_rate: float, max_buffered: int) -> None:
+        self.delegate = delegate
+        self.sample_rate = sample_rate
+        self.max_buffered = max_buffered
+        self._lock = threading.Lock()
+        self._buffers: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._forced: OrderedDict[int, str] = OrderedDict()
+        self._decided: OrderedDict[int, bool] = OrderedDict()
+        self._durations: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=SLOW_WINDOW))
+
+    def keep(self, trace_id: int, reason: str) -> None:
+        with self._lock:
+            self._forced.setdefault(trace_id, reason)
+            _trim(self._forced, self.max_buffered)
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self.delegate.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            decided = self._decided.get(trace_id)
+            if decided is not None:
+                export = [span] if decided else []
+            elif not is_root:
+                self._buffers.setdefault(trace_id, []).append(span)
+                if len(self._buffers) > self.max_buffered:
+                    self._buffers.popitem(last=False)
+                    metrics.incr("traces_evicted")
+                return
+            else:
+                spans = self._buffers.pop(trace_id, [])
+                spans.append(span)
+                reason = self._reason(trace_id, span, spans)
+                self._decided[trace_id] = reason is not None
+                _trim(self._decided, self.max_buffered)
+                metrics.incr(f"traces_kept_{reason}" if reason is not None else "traces_dropped")
+                export = spans if reason is not None else []
+        for kept in export:
+            self.delegate.on_end(kept)
+
+    def _reason(self, trace_id: int, root: ReadableSpan, spans: list[ReadableSpan]) -> str | None:
+        forced = self._forced.pop(trace_id, None)
+        if forced is not None:
+            return forced
+        if any(s.status.status_code is StatusCode.ERROR for s in spans):
+            return "error"
+        duration = (root.end_time - root.start_time) / 1e9
+        window = self._durations[root.name]
+        slow = False
+        if len(window) >= SLOW_MIN_SAMPLES:
+            slow = duration > sorted(window)[int(SLOW_PERCENTILE * (len(window) - 1))]
+        window.append(duration)
+        if slow:
+            return "slow"
+        if random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+
+def _trim(entries: OrderedDict, limit: int) -> None:
+    while len(entries) > limit:
+        entries.popitem(last=False)
+
+
+class TailSampledTracerProvider(TracerProvider):
+    """A TracerProvider whose span processors (Langfuse's, OTLP) all sit
+    behind one TailSampler, so every exporter gets the same traces."""
+
+    def __init__(self, sample_rate: float, max_buffered: int) -> None:
+        super().__init__()
+        self._exporters = SynchronousMultiSpanProcessor()
+        self.tail_sampler = TailSampler(self._exporters, sample_rate, max_buffered)
+        super().add_span_processor(self.tail_sampler)
+
+    def add_span_processor(self, span_processor: SpanProcessor) -> None:
+        self._exporters.add_span_processor(span_processor)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, ContextManager, Iterator
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.config import (
+    OTLP_ENDPOINT,
+    PROMPT_VERSION,
+    TRACE_MAX_BUFFERED,
+    TRACE_PROMPT_BODIES,
+    TRACE_SAMPLE_RATE,
+    TRACING_ENABLED,
+)
+
+if TYPE_CHECKING:
+    from backend.tail_sampler import TailSampledTracerProvider
+
+logger = logging.getLogger(__name__)
+
+# One OpenTelemetry trace per request (or job): a root span for the route,
+# with child spans for its DB session and stages and the Langfuse Gemini
+# spans below those. Whether a trace is exported is decided when its root
+# span ends (backend.tail_sampler), so every error, retry and slow request is
+# kept while only TRACE_SAMPLE_RATE of ordinary ones are.
+
+TRACER_NAME = "backend"
+
+# Probes and metrics scrapes are not traced.
+UNTRACED_PATHS = frozenset({"/health", "/ready", "/metrics"})
+
+_UNSET: Any = object()
+_provider: TailSampledTracerProvider | None = _UNSET
+_provider_lock = threading.Lock()
+
+
+def _exporting() -> bool:
+    langfuse = bool(os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"))
+    return TRACING_ENABLED and (langfuse or bool(OTLP_ENDPOINT))
+
+
+def _build_provider() -> TailSampledTracerProvider | None:
+    if not _exporting():
+        return None
+    from opentelemetry import trace
+
+    from backend.tail_sampler import TailSampledTracerProvider
+
+    provider = TailSampledTracerProvider(TRACE_SAMPLE_RATE, TRACE_MAX_BUFFERED)
+    if OTLP_ENDPOINT:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        # The exporter reads OTEL_EXPORTER_OTLP_ENDPOINT/HEADERS itself.
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def get_tracer_provider() -> TailSampledTracerProvider | None:
+    """The process's tracer provider, or None when nothing exports traces.
+
+    Langfuse is given this provider too (see backend.llm), so its spans join
+    the request's trace and go through the same sampling.
+    """
+    global _provider
+    if _provider is _UNSET:
+        with _provider_lock:
+            if _provider is _UNSET:
+                _provider = _build_provider()
+    return _provider
+
+
+def span(name: str, **attributes: Any) -> ContextManager[Any]:
+    """A child span of the current one, or a no-op when tracing is off."""
+    provider = get_tracer_provider()
+    if provider is None:
+        return contextlib.nullcontext()
+    return provider.get_tracer(TRACER_NAME).start_as_current_span(name, attributes=attributes)
+
+
+@contextlib.contextmanager
+def detached_span(name: str) -> Iterator[None]:
+    """A span that is not made current, for generator dependencies whose
+    enter and exit may run in different contexts."""
+    provider = get_tracer_provider()
+    if provider is None:
+        yield
+        return
+    current = provider.get_tracer(TRACER_NAME).start_span(name)
+    try:
+        yield
+    finally:
+        current.end()
+
+
+def keep_trace(reason: str) -> None:
+    """Export the current trace whatever the sampling decision."""
+    provider = get_tracer_provider()
+    if provider is None:
+        return
+    from opentelemetry import trace
+
+    context = trace.get_current_span().get_span_context()
+    if context.is_valid:
+        provider.tail_sampler.keep(context.trace_id, reason)
+
+
+@functools.lru_cache(maxsize=16)
+def _prompt_sha256(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_ref(prompt: str) -> str | dict[str, Any]:
+    """What traces record of a prompt: its version and hash, not the text
+    (unless TRACE_PROMPT_BODIES)."""
+    if TRACE_PROMPT_BODIES:
+        return prompt
+    return {
+        "prompt_version": PROMPT_VERSION or None,
+        "prompt_sha256": _prompt_sha256(prompt),
+        "chars": len(prompt),
+    }
+
+
+class TracingMiddleware:
+    """Root span per HTTP request, named after the matched route."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        provider = get_tracer_provider()
+        if scope["type"] != "http" or provider is None or scope["path"] in UNTRACED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        from opentelemetry.trace import Status, StatusCode
+
+        tracer = provider.get_tracer(TRACER_NAME)
+        method = scope["method"]
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}", attributes={"http.request.method": method}
+        ) as root:
+
+            async def traced_send(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    root.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        root.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                route = scope.get("route")
+                if route is not None and hasattr(route, "path"):
+                    # The template, not the path, so /jobs/{job_id} is one name.
+                    root.update_name(f"{method} {route.path}")
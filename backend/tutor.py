@@ -0,0 +1,112 @@
+"""Inputs of a tutor call, shared by /query and the job workers.
+
+Nothing here knows about HTTP: errors are raised as the exceptions below
+and the routes map them to responses.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from sqlmodel import Session
+
+from backend.config import GEMINI_FILE_REFRESH_MARGIN_S
+from backend.images import NormalizedImage, crop_png, new_region
+from backend.llm import file_part, image_part, problem_cache_key, upload_image
+from backend.models.problem_models import Problem
+from backend.repositories.problem_repo import get_problem_for_user, has_fresh_gemini_file, set_gemini_file
+
+PROMPT_PATH = Path(__file__).resolve().parent / "prompt.txt"
+
+STEP_NOTE = (
+    "Incremental check: the solution image shows only the part of the student's work "
+    "written since their last check (region {box} of the canvas). The earlier work was "
+    "already reviewed with verdict={verdict}, response_type={response_type}. "
+    "Previous feedback: {message}\n"
+    "Judge the new step as a continuation of that earlier work."
+)
+STEP_NOTE_MESSAGE_CHARS = 300
+
+
+class ProblemNotFound(LookupError):
+    """The stored problem does not exist or belongs to another user."""
+
+
+class ProblemImageUnavailable(Exception):
+    """The stored problem image could not be uploaded to Gemini."""
+
+
+def load_prompt() -> str:
+    """The tutor prompt; raises FileNotFoundError if prompt.txt is missing."""
+    return PROMPT_PATH.read_text(encoding="utf-8")
+
+
+def problem_image_part(session: Session, problem: Problem) -> Any:
+    """Gemini Part referencing the problem image, re-uploading it if the file lapsed."""
+    if not has_fresh_gemini_file(problem, GEMINI_FILE_REFRESH_MARGIN_S):
+        name, uri, expires_at = upload_image(problem.image_data, problem.image_mime)
+        set_gemini_file(session, problem, name, uri, expires_at)
+    return file_part(problem.gemini_file_uri, problem.image_mime)
+
+
+@dataclass
+class StoredStep:
+    problem: Problem
+    prob_part: Any
+    cache_key: str
+    solution: NormalizedImage
+    sol_part: Any
+    note: str | None
+
+
+def stored_problem_step(
+    session: Session,
+    problem_id: UUID,
+    user_id: UUID,
+    solution: NormalizedImage,
+    mode: str,
+    incremental: bool,
+) -> StoredStep:
+    """Problem Part, cache key and solution Part for a call on a stored problem.
+
+    For incremental hint/check calls the solution canvas is diffed against the
+    last checked one and only the new region is sent, with a note carrying the
+    previous verdict. Falls back to the full canvas when the diff is unusable,
+    or when the last canvas got a problem bank hint and was never checked.
+    """
+    problem = get_problem_for_user(session, problem_id, user_id)
+    if problem is None:
+        raise ProblemNotFound("Problem not found")
+
+    try:
+        prob_part = problem_image_part(session, problem)
+    except Exception as exc:
+        raise ProblemImageUnavailable(f"Problem image upload failed: {exc}") from exc
+
+    sol_part = None
+    note = None
+    reviewed = problem.last_solution_data is not None and not problem.bank_hint_level
+    if incremental and mode != "reveal" and reviewed:
+        box = new_region(problem.last_solution_data, solution.data)
+        if box is not None:
+            sol_part = image_part(crop_png(solution.data, box), solution.mime_type)
+            note = STEP_NOTE.format(
+                box=list(box),
+                verdict=problem.last_verdict,
+                response_type=problem.last_response_type,
+                message=(problem.last_message or "")[:STEP_NOTE_MESSAGE_CHARS],
+            )
+    if sol_part is None:
+        sol_part = image_part(solution.data, solution.mime_type)
+
+    return StoredStep(
+        problem=problem,
+        prob_part=prob_part,
+        cache_key=problem_cache_key(problem.id, problem.gemini_file_name),
+        solution=solution,
+        sol_part=sol_part,
+        note=note,
+    )
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from fastapi import HTTPException, UploadFile
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.config import MAX_IMAGE_BYTES, MAX_REQUEST_BYTES
+from backend.images import (
+    ImageTooLargeError,
+    InvalidImageError,
+    NormalizedImage,
+    normalize_image,
+    sniff_format,
+)
+from backend.metrics import metrics
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over max_bytes before they are buffered.
+
+    A declared Content-Length over the limit is answered with 413 without
+    reading the body. Otherwise the bytes are counted as the multipart parser
+    pulls them, and the request fails with 413 as soon as the count passes
+    the limit, so chunked uploads cannot grow without bound either.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int = MAX_REQUEST_BYTES) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > self.max_bytes:
+                    metrics.incr("upload_rejected_too_large")
+                    await _send_413(send, self.max_bytes)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    metrics.incr("upload_rejected_too_large")
+                    # Raised inside request parsing, so FastAPI turns it into a 413.
+                    raise HTTPException(status_code=413, detail=_too_large_detail(self.max_bytes))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large_detail(limit: int) -> str:
+    return f"Request body exceeds {limit // (1024 * 1024)} MB"
+
+
+async def _send_413(send: Send, limit: int) -> None:
+    body = ('{"detail":"%s"}' % _too_large_detail(limit)).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def read_image_upload(upload: UploadFile, field: str, max_bytes: int = MAX_IMAGE_BYTES) -> bytes:
+    """Read an image upload in chunks, enforcing size and format.
+
+    The multipart parser has already spooled the part (to disk past 1 MB);
+    this reads it back in chunks, stopping as soon as max_bytes is passed,
+    and checks the magic bytes of the first chunk so a non-image is rejected
+    without reading the rest. Blocking; call from a worker thread in async
+    routes.
+    """
+    upload.file.seek(0)
+    head = upload.file.read(READ_CHUNK_BYTES)
+    if not head:
+        raise HTTPException(status_code=422, detail=f"{field} is required")
+    if sniff_format(head) is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported image format for field '{field}' (PNG, JPEG or WebP expected)",
+        )
+
+    chunks = [head]
+    size = len(head)
+    while size <= max_bytes:
+        chunk = upload.file.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    if size > max_bytes:
+        metrics.incr("upload_rejected_too_large")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image '{field}' exceeds {max_bytes // (1024 * 1024)} MB",
+        )
+    return b"".join(chunks)
+
+
+def normalize_upload(data: bytes, field: str | None) -> NormalizedImage:
+    """normalize_image() with its errors mapped to HTTP responses (413/422)."""
+    try:
+        return normalize_image(data)
+    except ImageTooLargeError as exc:
+        metrics.incr("upload_rejected_too_large")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image '{field}' has too many pixels",
+        ) from exc
+    except InvalidImageError as exc:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid image uploaded for field '{field}'",
+        ) from exc